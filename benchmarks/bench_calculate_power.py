@@ -0,0 +1,91 @@
+# Time and peak memory of the power model: the previous pandas implementation
+# vs calculate_power (NumPy kernel) vs compute_power_arrays with a reused buffer.
+# Run from the repository root: python -m benchmarks.bench_calculate_power [file] [scale]
+import contextlib
+import io
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from utils.calculate_power import calculate_power, column_as_float, compute_power_arrays
+from utils.load_ride import load_file
+
+RIDER_WEIGHT = 70
+BIKE_WEIGHT = 10
+ROLLING_RESISTANCE = 0.004
+
+def pandas_calculate_power(df, rider_weight, bike_weight, rolling_resistance_coefficient):
+    # The pandas implementation calculate_power replaced, kept as the baseline
+    g = 9.81
+    system_weight = rider_weight + bike_weight
+    time_steps = df['timestamp'].diff().dt.total_seconds()
+    gravitational_potential_energy = system_weight * g * df['altitude']
+    delta_gravitational_potential_energy = gravitational_potential_energy.diff().fillna(0)
+    gravitational_power = delta_gravitational_potential_energy / time_steps
+    df['gravitational_power'] = pd.concat([pd.Series([0]), gravitational_power], ignore_index=True)
+    kinetic_energy = 0.5 * system_weight * (df['speed'] ** 2)
+    delta_kinetic_energy = kinetic_energy.diff().fillna(0)
+    kinetic_power = delta_kinetic_energy / time_steps
+    df['kinetic_power'] = pd.concat([pd.Series([0]), kinetic_power], ignore_index=True)
+    air_resistance_force = 0.5 * 0.96 * 0.4 * 0.76 * (df['speed'] ** 2)
+    rolling_resistance_force = rolling_resistance_coefficient * system_weight * g
+    total_resistance_force = air_resistance_force + rolling_resistance_force
+    df['frictional_power'] = total_resistance_force * df['speed']
+    df['frictional_power'] *= df['timestamp'].diff().dt.total_seconds()
+    df['calculated_power'] = df['gravitational_power'] + df['kinetic_power'] + df['frictional_power']
+    df['calculated_power'] = df['calculated_power'].clip(lower=0)
+    df['calculated_power'] = df['calculated_power'].rolling(window=5, min_periods=1).mean()
+
+def scale_ride(df, scale):
+    # Repeat the ride end to end with continuing timestamps
+    if scale == 1:
+        return df
+    duration = df['timestamp'].iloc[-1] - df['timestamp'].iloc[0] + pd.Timedelta(seconds=1)
+    parts = []
+    for i in range(scale):
+        part = df.copy()
+        part['timestamp'] = part['timestamp'] + i * duration
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+def measure(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def main(filename='Triple_Bypass.fit', scale=1, repeat=5):
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = scale_ride(load_file(filename), int(scale))
+    seconds = column_as_float(df, 'timestamp')
+    altitude = column_as_float(df, 'altitude')
+    speed = column_as_float(df, 'speed')
+    out = np.empty((4, len(df)))
+
+    cases = {
+        'pandas (previous)': lambda: pandas_calculate_power(
+            df.copy(), RIDER_WEIGHT, BIKE_WEIGHT, ROLLING_RESISTANCE),
+        'calculate_power': lambda: calculate_power(
+            df.copy(), RIDER_WEIGHT, BIKE_WEIGHT, ROLLING_RESISTANCE),
+        'compute_power_arrays(out=)': lambda: compute_power_arrays(
+            seconds, altitude, speed, RIDER_WEIGHT + BIKE_WEIGHT, ROLLING_RESISTANCE, out=out),
+    }
+    print(f"{filename} x{scale}: {len(df)} samples")
+    print(f"{'implementation':<28}{'time (ms)':>11}{'peak MB':>10}{'speedup':>9}")
+    baseline = None
+    for name, fn in cases.items():
+        elapsed, peak = measure(fn, repeat)
+        baseline = baseline or elapsed
+        print(f"{name:<28}{elapsed * 1000:>11.2f}{peak / 1024**2:>10.2f}{baseline / elapsed:>8.1f}x")
+
+if __name__ == "__main__":
+    main(*sys.argv[1:3])
@@ -0,0 +1,81 @@
+# Serial vs thread pool figure building: the figures of one ride load (map,
+# line graph, histograms, altitude profile, calculated power) built and
+# serialized with build_figures, inline and on pools of 2..N threads. Plotly
+# figure construction and JSON encoding mostly hold the GIL, so this measures
+# whether FIGURE_WORKERS > 1 is worth turning on for a given machine.
+# Run from the repository root:
+#   python -m benchmarks.bench_figure_pool [file] [scale] [--workers 2 4 6] [--repeat 5]
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+from benchmarks.bench_calculate_power import BIKE_WEIGHT, RIDER_WEIGHT, ROLLING_RESISTANCE, scale_ride
+from utils import figure_pool
+from utils.calculate_power import calculate_power
+from utils.load_ride import load_file
+from utils.range_histograms import RangeHistogramIndex
+from utils.ride_store import HISTOGRAM_CHANNELS
+from utils.route_simplify import RoutePyramid
+
+
+def load_jobs(df):
+    # The figure jobs of load_and_set_df for the whole ride
+    import gradio_app
+    from gradio_components import generate_altitude_graph
+
+    end = len(df) - 1
+    jobs, _ = gradio_app.selection_figure_jobs(df, 0, end, RoutePyramid(df), RangeHistogramIndex(df, HISTOGRAM_CHANNELS))
+    jobs['altitude'] = (generate_altitude_graph, df)
+    jobs['calc_power'] = (gradio_app.get_calc_power_plot, df, 0, end)
+    return jobs
+
+
+def time_build(jobs, workers, repeat):
+    # Median seconds of build_figures(jobs, serialize=True) with `workers`
+    figure_pool.FIGURE_WORKERS = workers
+    figure_pool._executor = None
+
+    def build():
+        return figure_pool.build_figures(jobs, serialize=True)
+
+    # First call warms up the pool threads and Plotly's validators
+    build()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        build()
+        times.append(time.perf_counter() - t0)
+    if figure_pool._executor is not None:
+        figure_pool._executor.shutdown()
+        figure_pool._executor = None
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time building a ride's figures inline vs on a thread pool.")
+    parser.add_argument('filename', nargs='?', default='Triple_Bypass.fit', help="ride file in the rides folder")
+    parser.add_argument('scale', nargs='?', type=int, default=1, help="repeat the ride end to end")
+    parser.add_argument('--workers', nargs='+', type=int, default=[2, 4, 6], help="thread pool sizes")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per case (median is kept)")
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = scale_ride(load_file(args.filename), args.scale)
+        calculate_power(df, RIDER_WEIGHT, BIKE_WEIGHT, ROLLING_RESISTANCE)
+    jobs = load_jobs(df)
+    print(f"{args.filename} x{args.scale}: {len(df)} samples, {len(jobs)} figures, {os.cpu_count()} CPUs")
+    print(f"{'build':<16}{'median (ms)':>13}{'speedup':>9}")
+    serial = time_build(jobs, 1, args.repeat)
+    print(f"{'serial':<16}{serial * 1000:>13.1f}{1:>8.2f}x")
+    for workers in args.workers:
+        elapsed = time_build(jobs, workers, args.repeat)
+        print(f"{f'{workers} threads':<16}{elapsed * 1000:>13.1f}{serial / elapsed:>8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+# Compare the columnar FIT decoder against the original fitparse path.
+# Run from the repository root: python -m benchmarks.bench_load_fit
+import contextlib
+import io
+import sys
+import time
+
+from utils.load_ride import load_fit_file, get_ride_files
+
+def time_load(filename, decoder, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            df = load_fit_file(filename, decoder=decoder)
+            best = min(best, time.perf_counter() - t0)
+    return best, len(df)
+
+def main(repeat=3):
+    files, _ = get_ride_files(".fit")
+    print(f"{'file':<22}{'records':>9}{'fitparse (s)':>14}{'columnar (s)':>14}{'speedup':>9}")
+    for filename in sorted(files):
+        slow, n = time_load(filename, 'fitparse', 1)
+        fast, _ = time_load(filename, 'columnar', repeat)
+        print(f"{filename:<22}{n:>9}{slow:>14.3f}{fast:>14.4f}{slow / fast:>8.0f}x")
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:2]))
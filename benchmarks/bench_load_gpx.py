@@ -0,0 +1,54 @@
+# Throughput (points/second) and peak memory of the streaming GPX loader.
+# Run from the repository root: python -m benchmarks.bench_load_gpx [scale]
+# Besides the bundled rides, each file is also replayed at `scale`x length
+# (track points repeated) to check that memory per point stays constant, i.e.
+# only the output arrays grow with file size.
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from utils.gpx_decoder import decode_gpx_points
+from utils.load_ride import BASE_FOLDER, get_ride_files
+
+def write_scaled_gpx(src, dest, scale):
+    with open(src) as f:
+        text = f.read()
+    start = text.index('<trkpt')
+    end = text.rindex('</trkpt>') + len('</trkpt>')
+    points = text[start:end]
+    # Timestamps repeat too, which doesn't matter for parse throughput
+    with open(dest, 'w') as f:
+        f.write(text[:start])
+        for _ in range(scale):
+            f.write(points)
+        f.write(text[end:])
+
+def measure(path):
+    # Timed and memory-traced separately, tracemalloc slows parsing down a lot
+    t0 = time.perf_counter()
+    _, n_points = decode_gpx_points(path)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    decode_gpx_points(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n_points, elapsed, peak
+
+def main(scale=10):
+    files, _ = get_ride_files(".gpx")
+    print(f"{'file':<26}{'points':>9}{'time (s)':>10}{'points/s':>11}{'peak MB':>9}{'bytes/pt':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for filename in sorted(files):
+            src = os.path.join(BASE_FOLDER, filename)
+            scaled = os.path.join(tmp, re.sub(r'\.gpx$', f'_x{scale}.gpx', filename))
+            write_scaled_gpx(src, scaled, scale)
+            for label, path in ((filename, src), (os.path.basename(scaled), scaled)):
+                n_points, elapsed, peak = measure(path)
+                print(f"{label:<26}{n_points:>9}{elapsed:>10.3f}{n_points / elapsed:>11.0f}"
+                      f"{peak / 1024**2:>9.1f}{peak / n_points:>10.0f}")
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:2]))
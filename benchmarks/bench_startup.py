@@ -0,0 +1,167 @@
+# Startup benchmark: the import time breakdown of gradio_app and the time
+# from launching the dashboard to its first HTTP response, each in a fresh
+# interpreter. Results are written as JSON and compared against a stored
+# baseline, failing (exit code 1) on regressions. Run from the repository
+# root:
+#   python -m benchmarks.bench_startup [--repeat 3] [--output startup_results.json]
+#   python -m benchmarks.bench_startup --save-baseline    # record benchmarks/startup_baseline.json
+#
+# The import breakdown comes from `python -X importtime`: the cumulative time
+# of each direct import of gradio_app, summed per top level package (utils
+# modules separately). Packages imported first by gradio (numpy, pandas...)
+# count towards gradio.
+# Time to first response is measured with an empty RIDE_CACHE_DIR, i.e. a
+# cold ride library index, and with the background prewarm on, as it runs in
+# production; the server must answer while prewarm is still going.
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.bench_suite import DEFAULT_THRESHOLD, environment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'startup_baseline.json')
+STARTUP_TIMEOUT = 120
+# Differences below this are noise (interpreter start, disk cache)
+MIN_SECONDS_DELTA = 0.25
+
+
+def import_breakdown(module='gradio_app'):
+    # {package: seconds} for importing module in a fresh interpreter, plus
+    # 'total' (the cumulative time of module itself)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, 'TIMING_LOG': '0'},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        entries.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1e6))
+    # Lines look like 'import time: self [us] | cumulative | <indent>name',
+    # indented two spaces per level, children listed before their parent: the
+    # direct imports of module are the lines just above it, one level deeper
+    index = max(i for i, (_, name, _) in enumerate(entries) if name == module)
+    depth, _, total = entries[index]
+    packages = {}
+    for child_depth, name, seconds in reversed(entries[:index]):
+        if child_depth <= depth:
+            break
+        if child_depth == depth + 2:
+            package = name if name.startswith('utils.') else name.split('.')[0]
+            packages[package] = packages.get(package, 0.0) + seconds
+    packages['total'] = total
+    return packages
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_response(timeout=STARTUP_TIMEOUT):
+    # Seconds from starting `python gradio_app.py` to the first 200 on /
+    with tempfile.TemporaryDirectory() as cache_dir:
+        port = _free_port()
+        env = {
+            **os.environ, 'RIDE_CACHE_DIR': cache_dir, 'GRADIO_SERVER_PORT': str(port),
+            'GRADIO_ANALYTICS_ENABLED': 'False', 'TIMING_LOG': '0',
+        }
+        url = f'http://127.0.0.1:{port}/'
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, 'gradio_app.py'], cwd=ROOT, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while time.perf_counter() - start < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"gradio_app.py exited with code {process.returncode}")
+                try:
+                    with urllib.request.urlopen(url, timeout=5) as response:
+                        if response.status == 200:
+                            return time.perf_counter() - start
+                except (urllib.error.URLError, ConnectionError, socket.timeout):
+                    pass
+                time.sleep(0.05)
+            raise RuntimeError(f"no response from {url} within {timeout}s")
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def run_startup(repeat=3, progress=print):
+    # {measurement: seconds}, the best of repeat runs each
+    results = {}
+    for _ in range(repeat):
+        for package, seconds in import_breakdown().items():
+            key = f'import.{package}'
+            results[key] = min(results.get(key, seconds), seconds)
+    for key in sorted(results, key=results.get, reverse=True):
+        progress(f"{key:<40}{results[key] * 1000:>10.1f} ms")
+    first = min(time_to_first_response() for _ in range(repeat))
+    results['first_response'] = first
+    progress(f"{'first_response':<40}{first * 1000:>10.1f} ms")
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # [(key, baseline seconds, current seconds, ratio)] for the total import
+    # time and the time to first response, if either regressed. Individual
+    # packages are reported but not checked: their split moves around.
+    regressions = []
+    for key in ('import.total', 'first_response'):
+        before, after = baseline.get(key), results.get(key)
+        if before is None or after is None:
+            continue
+        if after - before > MIN_SECONDS_DELTA and after > before * threshold:
+            regressions.append((key, before, after, after / before))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure gradio_app import time and time to first response.")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement (best is kept)")
+    parser.add_argument('--output', default='startup_results.json', help="results JSON path")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="slowdown factor counted as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_startup(args.repeat)
+    report = {'environment': environment(), 'results': results}
+    paths = [args.output] + ([args.baseline] if args.save_baseline else [])
+    for path in paths:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline['results'], args.threshold)
+    print(f"Compared with {args.baseline} (recorded {baseline['environment']['date']})")
+    for key, before, after, ratio in regressions:
+        print(f"  REGRESSION {key}: {before * 1000:.1f} -> {after * 1000:.1f} ms ({ratio:.2f}x)")
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+# Benchmark suite: time and peak memory of ride loading, the power model,
+# the global metrics and every figure generator, on bundled rides and on
+# synthetic rides scaled to 10x/100x length. Results are written as JSON and
+# compared against a stored baseline, failing (exit code 1) on regressions.
+# Run from the repository root:
+#   python -m benchmarks.bench_suite [--scales 1 10 100] [--output results.json]
+#   python -m benchmarks.bench_suite --save-baseline    # record benchmarks/baseline.json
+#
+# Loaders read synthetic files: the FIT file chained to itself `scale` times
+# (a valid multi-file FIT) and the GPX track points repeated (see
+# bench_load_gpx). The other cases run on the loaded ride repeated end to end
+# with continuing timestamps (see bench_calculate_power). Figures are timed
+# up to their JSON payload, which is what the dashboard ships to the browser.
+# Each case runs once untimed, then --repeat timed runs; the regression check
+# compares median times, since best-of-few timings of the 10-100 ms figure
+# builds swing by more than the threshold from run to run.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_calculate_power import (
+    BIKE_WEIGHT,
+    RIDER_WEIGHT,
+    ROLLING_RESISTANCE,
+    scale_ride,
+)
+from benchmarks.bench_load_gpx import write_scaled_gpx
+from utils.calculate_metrics import compute_global_metrics
+from utils.calculate_power import calculate_power
+from utils.calibration import calibrate
+from utils.load_ride import BASE_FOLDER, load_fit_file, load_gpx_file
+from utils.power_curve import ride_curves
+from utils.range_histograms import RangeHistogramIndex
+from utils.ride_dtypes import compact_ride
+from utils.ride_store import HISTOGRAM_CHANNELS
+from utils.route_simplify import RoutePyramid
+
+DEFAULT_RIDES = ['Triple_Bypass.fit', 'NCAR.gpx']
+DEFAULT_SCALES = [1, 10, 100]
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# A case regresses when it is this many times slower (or uses this many
+# times more memory) than the baseline, and by more than the noise floor
+DEFAULT_THRESHOLD = 1.5
+DEFAULT_REPEAT = 7
+MIN_SECONDS_DELTA = 0.02
+MIN_PEAK_DELTA = 1024**2
+
+
+def write_scaled_fit(src, dest, scale):
+    # FIT files can be chained back to back; the decoders read them all
+    with open(src, 'rb') as f:
+        data = f.read()
+    with open(dest, 'wb') as f:
+        for _ in range(scale):
+            f.write(data)
+
+
+def measure(fn, repeat):
+    # (best, median) seconds over repeat runs after a warm-up run, then the
+    # peak of one traced run
+    fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), statistics.median(times), peak
+
+
+def ride_cases(filename, scale, tmp):
+    # {case name: fn} for one ride at one scale, and the number of samples
+    import gradio_app
+    from gradio_components import (
+        generate_altitude_graph,
+        generate_histogram,
+        generate_line_graph,
+        generate_map_scatter,
+        generate_power_curve,
+    )
+
+    src = os.path.join(BASE_FOLDER, filename)
+    stem, ext = os.path.splitext(filename)
+    path = os.path.abspath(os.path.join(tmp, f"{stem}_x{scale}{ext}"))
+    if ext.lower() == '.fit':
+        write_scaled_fit(src, path, scale)
+        loader_name, loader = 'load_fit_file', load_fit_file
+    else:
+        write_scaled_gpx(src, path, scale)
+        loader_name, loader = 'load_gpx_file', load_gpx_file
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = scale_ride(compact_ride(loader(filename)), scale)
+        powered = df.copy()
+        calculate_power(powered, RIDER_WEIGHT, BIKE_WEIGHT, ROLLING_RESISTANCE)
+    histograms = RangeHistogramIndex(df, HISTOGRAM_CHANNELS)
+    route = RoutePyramid(df)
+    curves = ride_curves(df)
+    end = len(df) - 1
+
+    def quiet(fn, *args):
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                return fn(*args)
+        return run
+
+    def figure(fn, *args):
+        return lambda: fn(*args).to_json()
+
+    cases = {
+        # The loaders use an absolute path as is
+        loader_name: quiet(loader, path),
+        'calculate_power': lambda: calculate_power(df.copy(), RIDER_WEIGHT, BIKE_WEIGHT, ROLLING_RESISTANCE),
+        'calculate_power[savitzky_golay]': lambda: calculate_power(
+            df.copy(), RIDER_WEIGHT, BIKE_WEIGHT, ROLLING_RESISTANCE,
+            smoothing='savitzky_golay', smoothing_window=31, derivative='savitzky_golay'),
+        # Also checks that calibration reads the compact dtypes (nullable
+        # Int16 power) load_file returns
+        'calibrate': lambda: calibrate(df, RIDER_WEIGHT, BIKE_WEIGHT),
+        'compute_global_metrics': lambda: compute_global_metrics(df),
+        'generate_line_graph': figure(generate_line_graph, df),
+        'generate_map_scatter': figure(generate_map_scatter, df, route, 0, end),
+        'generate_histogram[power]': figure(
+            generate_histogram, df, 'power', 'orange', 'Power Distribution', histograms, 0, end),
+        'generate_histogram[heart_rate]': figure(
+            generate_histogram, df, 'heart_rate', 'red', 'Heart Rate Distribution', histograms, 0, end),
+        'generate_altitude_graph': figure(generate_altitude_graph, df),
+        'generate_power_curve': figure(generate_power_curve, curves),
+        'get_calc_power_plot': figure(gradio_app.get_calc_power_plot, powered, 0, end),
+    }
+    return cases, len(df)
+
+
+def run_suite(rides, scales, repeat=DEFAULT_REPEAT, select=None, progress=print):
+    # {case key: result dict}, keyed like 'calculate_power[Triple_Bypass.fit x10]'
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for filename in rides:
+            for scale in scales:
+                cases, samples = ride_cases(filename, scale, tmp)
+                for name, fn in cases.items():
+                    if select and not any(s in name for s in select):
+                        continue
+                    # Fewer repeats where a single run is already long
+                    runs = repeat if scale < 100 else max(1, repeat // 2)
+                    best, median, peak = measure(fn, runs)
+                    key = f"{name}[{filename} x{scale}]"
+                    results[key] = {
+                        'case': name, 'ride': filename, 'scale': scale, 'samples': samples,
+                        'seconds': best, 'median_seconds': median, 'peak_bytes': peak,
+                        'samples_per_second': samples / best if best > 0 else None,
+                    }
+                    progress(f"{key:<58}{median * 1000:>10.2f} ms{peak / 1024**2:>9.2f} MB")
+    return results
+
+
+def environment():
+    return {
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # [(key, metric, baseline value, current value, ratio)] for every case
+    # that regressed against baseline
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric, floor in (('median_seconds', MIN_SECONDS_DELTA), ('peak_bytes', MIN_PEAK_DELTA)):
+            before, after = previous[metric], result[metric]
+            if after - before > floor and after > before * threshold:
+                regressions.append((key, metric, before, after, after / before if before else np.inf))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile loading, the power model and figure generation.")
+    parser.add_argument('--rides', nargs='+', default=DEFAULT_RIDES, help=f"ride files in {BASE_FOLDER}/")
+    parser.add_argument('--scales', nargs='+', type=int, default=DEFAULT_SCALES, help="synthetic ride lengths")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="timed runs per case (the median is compared)")
+    parser.add_argument('--cases', nargs='+', help="only run cases whose name contains one of these")
+    parser.add_argument('--output', default='bench_results.json', help="results JSON path")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="slowdown factor counted as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.rides, args.scales, args.repeat, args.cases)
+    report = {'environment': environment(), 'results': results}
+    paths = [args.output] + ([args.baseline] if args.save_baseline else [])
+    for path in paths:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline['results'], args.threshold)
+    compared = len(set(results) & set(baseline['results']))
+    print(f"Compared {compared} cases with {args.baseline} (recorded {baseline['environment']['date']})")
+    for key, metric, before, after, ratio in regressions:
+        unit, factor = ('ms', 1000) if metric == 'median_seconds' else ('MB', 1 / 1024**2)
+        print(f"  REGRESSION {key} {metric}: {before * factor:.2f} -> {after * factor:.2f} {unit} ({ratio:.2f}x)")
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
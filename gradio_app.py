@@ -1,46 +1,96 @@
 import gradio as gr
 import plotly.graph_objs as go
-import plotly.subplots as sp
 import numpy as np
-from datetime import datetime, timedelta
 import os
-from utils.load_ride import load_file, get_ride_files
+import threading
+import time
+from utils.load_ride import get_ride_files
 from utils.calculate_metrics import compute_global_metrics
-from utils.calculate_power import calculate_power
+from utils.calculate_power import SMOOTHING_WINDOW, TIRE_TYPES
+from utils.calibration import calibrate
+from utils.ride_store import ride_store
+from utils.figure_pool import build_figures, plot_payload
+from utils.power_curve import best_efforts, ride_curves
+from utils.ride_library import SORT_ORDERS, ride_library
+from utils.smoothing import (
+    DEFAULT_DERIVATIVE,
+    DEFAULT_SMOOTHING,
+    DEFAULT_SMOOTHING_WINDOW,
+    DERIVATIVE_METHODS,
+    MAX_WINDOW,
+    SMOOTHING_METHODS,
+)
+from utils.timing import handler_timings, span, timed_handler
 
 from gradio_components import (
     generate_line_graph,
     generate_map_scatter,
     generate_histogram,
-    generate_altitude_graph
+    generate_altitude_graph,
+    generate_power_curve,
+    trace_xy,
 )
 
-def plot_selector(full_df, start_idx, end_idx):
+# Cold start: building the layout only reads the ride library index (one
+# SQLite query). A page load lists the rides indexed so far and starts a
+# background rescan of the rides folder (the Refresh button waits for one),
+# and with PREWARM (default on) a background thread started once the server is
+# listening indexes the folder, loads the newest PREWARM_RIDES rides into the
+# ride store and builds one set of figures, so the first user doesn't pay
+# for the first decode, the figure pool threads or Plotly's first-use setup.
+# plotly.subplots and fitparse are imported on first use.
+# benchmarks/bench_startup.py measures the import time breakdown and the
+# time to first response.
+PREWARM = os.environ.get('PREWARM', '1') != '0'
+PREWARM_RIDES = int(os.environ.get('PREWARM_RIDES', 3))
+
+def selection_figure_jobs(full_df, start_idx, end_idx, route=None, histograms=None):
+    # Figure jobs (for build_figures) of the selected range, and the range df
     df = full_df
+    start, end = None, None
     # Filter dataframe by index range if available
     if df is not None and not df.empty and start_idx is not None and end_idx is not None:
         start = max(0, int(start_idx))
         end = min(len(df)-1, int(end_idx))
         if start < end:
             df = df.iloc[start:end+1]
-    line_plot = generate_line_graph(df)
-    map_plot = generate_map_scatter(df)
-    power_hist = generate_histogram(df, 'power', 'orange', 'Power Distribution')
-    hr_hist = generate_histogram(df, 'heart_rate', 'red', 'Heart Rate Distribution')
-    summary = None
-    if df is not None and not df.empty:
-        summary = df.describe(include='all').T.reset_index().rename(columns={'index': 'field'})
-    return map_plot, line_plot, power_hist, hr_hist, df, summary
-
-def load_and_set_df(selected_filename, filetype_filter):
-    files, file_map = get_ride_files(filetype_filter)
+        else:
+            start, end = None, None
+    jobs = {
+        'map': (generate_map_scatter, df, route, start, end),
+        'line': (generate_line_graph, df),
+        'power_hist': (generate_histogram, df, 'power', 'orange', 'Power Distribution', histograms, start, end),
+        'hr_hist': (generate_histogram, df, 'heart_rate', 'red', 'Heart Rate Distribution', histograms, start, end),
+    }
+    return jobs, df
+
+def selection_summary(range_index, start_idx, end_idx):
+    # count/mean/std/min/max per channel of the selection, from the ride's
+    # range statistics (constant time whatever the range length)
+    if range_index is None:
+        return None
+    return range_index.summary(start_idx, end_idx).round(2)
+
+@timed_handler('load_and_set_df')
+def load_and_set_df(selected_filename, filetype_filter, previous_handle=None):
+    with span('list_files'):
+        files, file_map = get_ride_files(filetype_filter)
     selected_file = file_map.get(selected_filename)
-    df = None
-    if selected_file and selected_file.endswith('.fit'):
-        try:
-            df = load_file(os.path.basename(selected_file))
-        except Exception as e:
-            print(f"Error loading fit file: {e}")
+    # The session stops using its previous ride (the store keeps it for others)
+    ride_store.release(previous_handle)
+    handle = None
+    # Decoding and index building are the 'decode' and 'indexes' stages within
+    with span('acquire'):
+        if selected_file and selected_file.endswith(('.fit', '.gpx')):
+            try:
+                handle = ride_store.acquire(os.path.basename(selected_file))
+            except Exception as e:
+                print(f"Error loading ride file: {e}")
+        # Shared, read-only ride plus its range statistics and route pyramid
+        df = ride_store.frame(handle)
+        range_index = ride_store.range_index(handle)
+        route = ride_store.route(handle)
+        histograms = ride_store.histograms(handle)
     # Set slider range based on df length
     if df is not None and not df.empty:
         max_idx = len(df) - 1
@@ -49,13 +99,20 @@ def load_and_set_df(selected_filename, filetype_filter):
     else:
         start_slider_update = gr.update(minimum=0, maximum=100, value=0)
         end_slider_update = gr.update(minimum=0, maximum=100, value=100)
-    altitude_plot = generate_altitude_graph(df)
-    # Get the rest of the plots/tables (excluding altitude)
-    map_plot, line_plot, power_hist, hr_hist, filtered_df, summary = plot_selector(
-        df, start_slider_update["value"], end_slider_update["value"]
-    )
+    # All figures are independent: build them concurrently
+    with span('slice'):
+        jobs, _ = selection_figure_jobs(
+            df, start_slider_update["value"], end_slider_update["value"], route, histograms
+        )
+    jobs['altitude'] = (generate_altitude_graph, df)
+    # Initial calculated power plot using the initial slider range
+    jobs['calc_power'] = (get_calc_power_plot, df, start_slider_update["value"], end_slider_update["value"])
+    with span('figures'):
+        figures = build_figures(jobs, serialize=True)
     # Compute global metrics
-    metrics = compute_global_metrics(df)
+    with span('metrics'):
+        metrics = compute_global_metrics(df, range_index)
+        summary = selection_summary(range_index, start_slider_update["value"], end_slider_update["value"])
     # Stylish HTML for metrics
     metrics_html = f"""
     <div style="display: flex; gap: 2.5em; justify-content: center; align-items: center; font-size: 2em; font-weight: bold; margin: 1em 0;">
@@ -65,16 +122,15 @@ def load_and_set_df(selected_filename, filetype_filter):
       <span style="color:#FFA500;">&#9889; {metrics['Average Power']}</span>
     </div>
     """
-    # --- Add: generate initial calculated power plot using the initial slider range ---
-    calc_power_fig = get_calc_power_plot(df, start_slider_update["value"], end_slider_update["value"])
     # Return all outputs in the correct order
     return (
-        df, start_slider_update, end_slider_update,
-        altitude_plot, map_plot, line_plot, power_hist, hr_hist,
-        metrics_html, calc_power_fig
+        handle, start_slider_update, end_slider_update,
+        figures['altitude'], figures['map'], figures['line'], figures['power_hist'], figures['hr_hist'],
+        metrics_html, figures['calc_power'], summary
     )
 
-def update_sliders(full_df):
+def update_sliders(handle):
+    full_df = ride_store.frame(handle)
     if full_df is not None and not full_df.empty:
         max_idx = len(full_df) - 1
         return (
@@ -87,6 +143,35 @@ def update_sliders(full_df):
             gr.update(minimum=0, maximum=100, value=100)
         )
 
+def prewarm(max_rides=PREWARM_RIDES):
+    # Background warm-up after launch (see PREWARM above)
+    start = time.perf_counter()
+    handles = []
+    try:
+        indexed, removed = ride_library.refresh()
+        rides = [ride['filename'] for ride in ride_library.list_rides() if ride['error'] is None][:max_rides]
+        for filename in rides:
+            handles.append(ride_store.acquire(filename))
+        if handles:
+            df = ride_store.frame(handles[0])
+            jobs, _ = selection_figure_jobs(
+                df, 0, len(df) - 1, ride_store.route(handles[0]), ride_store.histograms(handles[0])
+            )
+            jobs['altitude'] = (generate_altitude_graph, df)
+            jobs['calc_power'] = (get_calc_power_plot, df, 0, len(df) - 1)
+            build_figures(jobs, serialize=True)
+        print(
+            f"Prewarm done in {time.perf_counter() - start:.1f}s: "
+            f"{indexed} rides indexed, {removed} removed, {len(rides)} loaded"
+        )
+    except Exception as e:
+        print(f"Prewarm failed: {e}")
+    finally:
+        # The store keeps released rides until they idle out; rides acquired
+        # before a failure are released too
+        for handle in handles:
+            ride_store.release(handle)
+
 def get_calc_power_plot(full_df, start_idx, end_idx):
     # Only filter, do not recalculate
     if full_df is None or full_df.empty:
@@ -106,6 +191,8 @@ def get_calc_power_plot(full_df, start_idx, end_idx):
     )
 
     if has_calc:
+        import plotly.subplots as sp
+
         # --- Subplots: 2 rows, shared x-axis ---
         fig = sp.make_subplots(
             rows=2, cols=1,
@@ -123,7 +210,7 @@ def get_calc_power_plot(full_df, start_idx, end_idx):
         avg_calc = None
         if 'power' in df and df['power'].notnull().any():
             fig.add_trace(go.Scatter(
-                x=x, y=df['power'],
+                **trace_xy(x, df['power']),
                 mode='lines', name='Real Power',
                 line=dict(color='orange', width=2),
                 opacity=0.6
@@ -131,7 +218,7 @@ def get_calc_power_plot(full_df, start_idx, end_idx):
             avg_real = df['power'].mean()
         if 'calculated_power' in df and df['calculated_power'].notnull().any():
             fig.add_trace(go.Scatter(
-                x=x, y=df['calculated_power'],
+                **trace_xy(x, df['calculated_power']),
                 mode='lines', name='Calculated Power',
                 line=dict(color='cyan', width=2),
                 opacity=0.6
@@ -157,21 +244,21 @@ def get_calc_power_plot(full_df, start_idx, end_idx):
         # --- Bottom plot: power components ---
         if 'gravitational_power' in df:
             fig.add_trace(go.Scatter(
-                x=x, y=df['gravitational_power'],
+                **trace_xy(x, df['gravitational_power']),
                 mode='lines', name='Gravitational Power',
                 line=dict(color='green', width=1.5, dash='dot'),
                 opacity=0.7
             ), row=2, col=1)
         if 'kinetic_power' in df:
             fig.add_trace(go.Scatter(
-                x=x, y=df['kinetic_power'],
+                **trace_xy(x, df['kinetic_power']),
                 mode='lines', name='Kinetic Power',
                 line=dict(color='magenta', width=1.5, dash='dot'),
                 opacity=0.7
             ), row=2, col=1)
         if 'frictional_power' in df:
             fig.add_trace(go.Scatter(
-                x=x, y=df['frictional_power'],
+                **trace_xy(x, df['frictional_power']),
                 mode='lines', name='Frictional Power',
                 line=dict(color='yellow', width=1.5, dash='dot'),
                 opacity=0.7
@@ -196,7 +283,7 @@ def get_calc_power_plot(full_df, start_idx, end_idx):
         avg_real = None
         if 'power' in df and df['power'].notnull().any():
             fig.add_trace(go.Scatter(
-                x=x, y=df['power'],
+                **trace_xy(x, df['power']),
                 mode='lines', name='Real Power',
                 line=dict(color='orange', width=2),
                 opacity=0.6
@@ -224,10 +311,9 @@ with gr.Blocks() as demo:
     # File upload and validation
     upload_status = gr.Markdown("", visible=False)
 
-    def handle_upload(uploaded_file):
+    def handle_upload(uploaded_file, sort_by):
         import shutil
         import os
-        import time
         BASE_FOLDER = "rides"
         if uploaded_file is None:
             return gr.update(visible=False, value=""), gr.update()
@@ -237,12 +323,13 @@ with gr.Blocks() as demo:
             return gr.update(visible=True, value="❌ Invalid file type. Only .fit and .gpx are allowed."), gr.update()
         os.makedirs(BASE_FOLDER, exist_ok=True)
         dest_path = os.path.join(BASE_FOLDER, filename)
+        # copy returns once the file is written and closed, so it can be
+        # listed and indexed right away
         shutil.copy(uploaded_file, dest_path)
-        # Ensure file system has flushed the file before refreshing list
-        time.sleep(0.2)
-        # Now refresh the file list choices
-        files, _ = get_ride_files("Both")
-        return gr.update(visible=True, value=f"✅ Uploaded: {filename}"), gr.update(choices=files, value=filename)
+        # Index the new ride, then refresh the file list choices
+        ride_library.update_file(filename)
+        choices = ride_library.choices("Both", sort_by)
+        return gr.update(visible=True, value=f"✅ Uploaded: {filename}"), gr.update(choices=choices, value=filename)
 
     with gr.Row():
         with gr.Column(scale=1):
@@ -259,8 +346,17 @@ with gr.Blocks() as demo:
                 height=80,
             )
         with gr.Column(scale=2):
+            sort_dropdown = gr.Dropdown(
+                choices=list(SORT_ORDERS),
+                value="Newest first",
+                label="Sort Rides By",
+                interactive=True
+            )
+            # Labels come from the ride library index, values are filenames.
+            # The folder is rescanned in the background on page load
+            # (demo.load below), not here.
             file_radio = gr.Radio(
-                choices=get_ride_files("Both")[0],
+                choices=ride_library.choices("Both"),
                 label="Select .fit or .gpx file from rides folder",
                 interactive=True
             )
@@ -268,7 +364,7 @@ with gr.Blocks() as demo:
 
     file_upload.upload(
         fn=handle_upload,
-        inputs=file_upload,
+        inputs=[file_upload, sort_dropdown],
         outputs=[upload_status, file_radio]
     )
 
@@ -286,7 +382,8 @@ with gr.Blocks() as demo:
         label=None
     )
 
-    full_df_state = gr.State(None)
+    # Only a RideHandle per session; the ride itself lives in ride_store
+    ride_handle_state = gr.State(None, delete_callback=ride_store.release)
     altitude_plot_output = gr.Plot(label="Altitude Profile (Full Ride)")
     # Replace Range with two sliders
     start_slider = gr.Slider(
@@ -311,6 +408,7 @@ with gr.Blocks() as demo:
     with gr.Row():
         power_hist_output = gr.Plot(label="Power Histogram")
         hr_hist_output = gr.Plot(label="Heart Rate Histogram")
+    range_summary_output = gr.Dataframe(label="Selection Statistics", interactive=False)
 
     # --- Power Calculation Form ---
     with gr.Accordion("Calculate Estimated Power (Physics Model)", open=False):
@@ -322,24 +420,73 @@ with gr.Blocks() as demo:
                 value=10, label="Bike Weight (kg)", minimum=5, maximum=30, step=0.1
             )
             tire_type_dropdown = gr.Dropdown(
-                choices=[
-                    ("Road (23-25mm, 100psi)", 0.003),
-                    ("Road (28-32mm, 80psi)", 0.004),
-                    ("Gravel (35-40mm, 40psi)", 0.006),
-                    ("MTB (2.1-2.4in, 25psi)", 0.010),
-                    ("Touring/Commuter", 0.007)
-                ],
+                choices=TIRE_TYPES,
                 label="Tire Type (Rolling Resistance)"
             )
+        with gr.Row():
+            smoothing_dropdown = gr.Dropdown(
+                choices=SMOOTHING_METHODS, value=DEFAULT_SMOOTHING,
+                label="Altitude / Speed Smoothing"
+            )
+            smoothing_window_input = gr.Number(
+                value=DEFAULT_SMOOTHING_WINDOW, label="Smoothing Window (samples)",
+                minimum=1, maximum=MAX_WINDOW, step=2, precision=0
+            )
+            derivative_dropdown = gr.Dropdown(
+                choices=DERIVATIVE_METHODS, value=DEFAULT_DERIVATIVE,
+                label="Derivative Method"
+            )
+            power_window_input = gr.Number(
+                value=SMOOTHING_WINDOW, label="Power Rolling Mean (samples)",
+                minimum=1, maximum=MAX_WINDOW, step=1, precision=0
+            )
         calc_power_btn = gr.Button("Calculate Power")
         calc_power_status = gr.Markdown("", visible=False)
+        with gr.Row():
+            fit_efficiency_checkbox = gr.Checkbox(
+                value=False, label="Also fit drivetrain efficiency"
+            )
+            calibrate_btn = gr.Button("Calibrate CdA / Rolling Resistance to Power Meter")
+        calibrate_status = gr.Markdown("", visible=False)
 
     # --- Calculated Power Comparison Plot ---
     calc_power_plot = gr.Plot(label="Calculated Power vs Real Power")
 
-    def update_file_choices(filetype_filter):
-        files, _ = get_ride_files(filetype_filter)
-        return gr.update(choices=files, value=None)
+    # --- Diagnostics ---
+    with gr.Accordion("Diagnostics (Handler Latency)", open=False):
+        gr.Markdown(
+            "Rolling p50/p95/p99 latency per handler and stage, in ms. "
+            "Also served as JSON by the `timings` API endpoint."
+        )
+        timings_refresh_btn = gr.Button("Refresh Timings")
+        timings_table = gr.Dataframe(
+            headers=['handler', 'stage', 'calls', 'window', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'],
+            interactive=False,
+        )
+
+    # --- Power Curve ---
+    with gr.Accordion("Power Curve (Mean-Maximal Efforts)", open=False):
+        power_curve_btn = gr.Button("Show Power Curve")
+        power_curve_status = gr.Markdown("", visible=False)
+        power_curve_plot = gr.Plot(label="Power Curve")
+
+    def update_file_choices(filetype_filter, sort_by):
+        return gr.update(choices=ride_library.choices(filetype_filter, sort_by), value=None)
+
+    def load_file_choices(filetype_filter, sort_by):
+        # The index as it is now; rides a running or new background refresh
+        # finds show up on the next load or Refresh
+        ride_library.refresh_in_background()
+        return update_file_choices(filetype_filter, sort_by)
+
+    def refresh_file_choices(filetype_filter, sort_by):
+        # Index files added, changed or removed outside the app
+        ride_library.refresh()
+        return update_file_choices(filetype_filter, sort_by)
+
+    def sort_file_choices(filetype_filter, sort_by, selected_filename):
+        # Reordering keeps the selected ride (and doesn't reload it)
+        return gr.update(choices=ride_library.choices(filetype_filter, sort_by), value=selected_filename)
 
     def update_global_metrics(df):
         metrics = compute_global_metrics(df)
@@ -350,81 +497,206 @@ with gr.Blocks() as demo:
             f"**Average Power:** {metrics['Average Power']}"
         )
 
+    # Pick up rides added or changed since the index was last refreshed
+    demo.load(
+        fn=load_file_choices,
+        inputs=[filetype_filter_radio, sort_dropdown],
+        outputs=file_radio
+    )
+
     file_refresh_btn.click(
-        fn=update_file_choices,
-        inputs=filetype_filter_radio,
+        fn=refresh_file_choices,
+        inputs=[filetype_filter_radio, sort_dropdown],
         outputs=file_radio
     )
 
     filetype_filter_radio.change(
         fn=update_file_choices,
-        inputs=filetype_filter_radio,
+        inputs=[filetype_filter_radio, sort_dropdown],
+        outputs=file_radio
+    )
+
+    sort_dropdown.change(
+        fn=sort_file_choices,
+        inputs=[filetype_filter_radio, sort_dropdown, file_radio],
         outputs=file_radio
     )
 
     file_radio.change(
         fn=load_and_set_df,
-        inputs=[file_radio, filetype_filter_radio],
+        inputs=[file_radio, filetype_filter_radio, ride_handle_state],
         outputs=[
-            full_df_state, start_slider, end_slider,
+            ride_handle_state, start_slider, end_slider,
             altitude_plot_output, map_output, line_output, power_hist_output, hr_hist_output,
-            metrics_html_box, calc_power_plot
+            metrics_html_box, calc_power_plot, range_summary_output
         ]
     )
 
     # When sliders change: use stored df, update plots/tables only
     # Use .release instead of triggers="release"
-    def slider_release_handler(full_df, start_idx, end_idx):
-        # Unpack outputs from plot_selector
-        map_plot, line_plot, power_hist, hr_hist, filtered_df, summary = plot_selector(full_df, start_idx, end_idx)
+    @timed_handler('slider_release_handler')
+    def slider_release_handler(handle, start_idx, end_idx):
+        full_df = ride_store.frame(handle)
+        with span('slice'):
+            jobs, _ = selection_figure_jobs(
+                full_df, start_idx, end_idx, ride_store.route(handle), ride_store.histograms(handle)
+            )
         # Only filter for the plot, do not recalculate
-        calc_power_fig = get_calc_power_plot(full_df, start_idx, end_idx)
-        # Just return the filtered_df and summary directly (Gradio will update the Dataframe components)
-        return map_plot, line_plot, power_hist, hr_hist, filtered_df, summary, calc_power_fig
+        jobs['calc_power'] = (get_calc_power_plot, full_df, start_idx, end_idx)
+        with span('figures'):
+            figures = build_figures(jobs, serialize=True)
+        with span('metrics'):
+            summary = selection_summary(ride_store.range_index(handle), start_idx, end_idx)
+        return (
+            figures['map'], figures['line'], figures['power_hist'], figures['hr_hist'],
+            figures['calc_power'], summary
+        )
 
     start_slider.release(
         slider_release_handler,
-        inputs=[full_df_state, start_slider, end_slider],
-        outputs=[map_output, line_output, power_hist_output, hr_hist_output, calc_power_plot]
+        inputs=[ride_handle_state, start_slider, end_slider],
+        outputs=[map_output, line_output, power_hist_output, hr_hist_output, calc_power_plot, range_summary_output]
     )
     end_slider.release(
         slider_release_handler,
-        inputs=[full_df_state, start_slider, end_slider],
-        outputs=[map_output, line_output, power_hist_output, hr_hist_output, calc_power_plot]
+        inputs=[ride_handle_state, start_slider, end_slider],
+        outputs=[map_output, line_output, power_hist_output, hr_hist_output, calc_power_plot, range_summary_output]
     )
 
     # Use the global dataframe for slider updates:
     file_radio.change(
         fn=update_sliders,
-        inputs=[full_df_state],
+        inputs=[ride_handle_state],
         outputs=[start_slider, end_slider]
     )
 
     # --- Power Calculation Logic ---
-    def do_calculate_power(df, rider_weight, bike_weight, tire_type, start_slider, end_slider):
+    def model_options(smoothing, smoothing_window, derivative, power_window):
+        # Smoothing/derivative options of the form, as power model kwargs
+        return {
+            'smoothing': smoothing or DEFAULT_SMOOTHING,
+            'smoothing_window': int(smoothing_window or DEFAULT_SMOOTHING_WINDOW),
+            'derivative': derivative or DEFAULT_DERIVATIVE,
+            'window': int(power_window or SMOOTHING_WINDOW),
+        }
+
+    @timed_handler('do_calculate_power')
+    def do_calculate_power(handle, rider_weight, bike_weight, tire_type, smoothing, smoothing_window,
+                           derivative, power_window, start_slider, end_slider):
         # tire_type is a tuple (label, value) or just value
         if isinstance(tire_type, (list, tuple)):
             rolling_resistance = float(tire_type[1])
         else:
             rolling_resistance = float(tire_type)
+        df = ride_store.frame(handle)
+        if df is None or df.empty:
+            return handle, gr.update(visible=True, value="❌ No data loaded."), go.Figure()
+        try:
+            # The handle records the parameters; power_cache holds the result
+            new_handle = handle.with_power(
+                rider_weight=rider_weight,
+                bike_weight=bike_weight,
+                rolling_resistance_coefficient=rolling_resistance,
+                **model_options(smoothing, smoothing_window, derivative, power_window),
+            )
+            # The model runs (on a power cache miss) as the 'calculate_power' stage
+            df = ride_store.frame(new_handle)
+            with span('figure.calc_power'):
+                fig = get_calc_power_plot(df, start_slider, end_slider)
+            with span('serialize.calc_power'):
+                fig = plot_payload(fig)
+            return new_handle, gr.update(visible=True, value="✅ Calculated power added to dataframe."), fig
+        except Exception as e:
+            print(e)
+            return handle, gr.update(visible=True, value=f"❌ Error: {e}"), go.Figure()
+
+    def do_calibrate_power(handle, rider_weight, bike_weight, fit_efficiency, smoothing, smoothing_window,
+                           derivative, power_window, start_slider, end_slider):
+        # Fit friction coefficients to the measured power in the selected range,
+        # then recalculate power for the whole ride with the fitted values
+        df = ride_store.frame(handle)
         if df is None or df.empty:
-            return df, gr.update(visible=True, value="❌ No data loaded."), go.Figure()
-        # Defensive copy
-        df = df.copy()
+            return handle, gr.update(visible=True, value="❌ No data loaded."), go.Figure()
+        try:
+            options = model_options(smoothing, smoothing_window, derivative, power_window)
+            result = calibrate(
+                df, rider_weight, bike_weight,
+                fit_efficiency=fit_efficiency,
+                start_idx=start_slider, end_idx=end_slider,
+                **options,
+            )
+            new_handle = handle.with_power(
+                rider_weight=rider_weight,
+                bike_weight=bike_weight,
+                rolling_resistance_coefficient=result['rolling_resistance_coefficient'],
+                air_density=result['air_density'],
+                drag_area=result['drag_area'],
+                drivetrain_efficiency=result['drivetrain_efficiency'],
+                **options,
+            )
+            fig = get_calc_power_plot(ride_store.frame(new_handle), start_slider, end_slider)
+            summary = (
+                f"✅ Calibrated on {result['samples']} samples: "
+                f"CdA = {result['drag_area']:.3f} m², "
+                f"Crr = {result['rolling_resistance_coefficient']:.4f}, "
+                f"drivetrain efficiency = {result['drivetrain_efficiency']:.1%}<br>"
+                f"Avg power error {result['avg_power_error_pct']:+.1f}%, "
+                f"MAE {result['mae']:.0f} W, RMSE {result['rmse']:.0f} W, R² {result['r2']:.2f}"
+            )
+            return new_handle, gr.update(visible=True, value=summary), fig
+        except Exception as e:
+            print(e)
+            return handle, gr.update(visible=True, value=f"❌ Error: {e}"), go.Figure()
+
+    def do_power_curve(handle):
+        # Curve of the selected ride against the all-time bests of rides/;
+        # the best efforts index only decodes rides it hasn't seen before
+        df = ride_store.frame(handle)
         try:
-            calculate_power(df, rider_weight, bike_weight, rolling_resistance)
-            fig = get_calc_power_plot(df, start_slider, end_slider)
-            return df, gr.update(visible=True, value="✅ Calculated power added to dataframe."), fig
+            added = best_efforts.update()
+            best_power = best_efforts.best('power')
+            curves = ride_curves(df) if df is not None and not df.empty else {}
+            fig = generate_power_curve(curves, best_power)
+            status = f"✅ Best efforts from {len(best_efforts)} rides"
+            if added:
+                status += f" ({added} newly indexed)"
+            return gr.update(visible=True, value=status), fig
         except Exception as e:
             print(e)
-            return df, gr.update(visible=True, value=f"❌ Error: {e}"), go.Figure()
+            return gr.update(visible=True, value=f"❌ Error: {e}"), go.Figure()
+
+    def timings_rows():
+        rows = handler_timings.table()
+        return [[row[col] for col in timings_table.headers] for row in rows] or None
+
+    timings_refresh_btn.click(fn=timings_rows, outputs=timings_table, api_name=False)
+    gr.api(handler_timings.snapshot, api_name="timings")
+
+    power_curve_btn.click(
+        fn=do_power_curve,
+        inputs=[ride_handle_state],
+        outputs=[power_curve_status, power_curve_plot]
+    )
+
+    calibrate_btn.click(
+        fn=do_calibrate_power,
+        inputs=[ride_handle_state, rider_weight_input, bike_weight_input, fit_efficiency_checkbox,
+                smoothing_dropdown, smoothing_window_input, derivative_dropdown, power_window_input,
+                start_slider, end_slider],
+        outputs=[ride_handle_state, calibrate_status, calc_power_plot]
+    )
 
     # --- Power Calculation Button Event ---
     calc_power_btn.click(
         fn=do_calculate_power,
-        inputs=[full_df_state, rider_weight_input, bike_weight_input, tire_type_dropdown, start_slider, end_slider],
-        outputs=[full_df_state, calc_power_status, calc_power_plot]
+        inputs=[ride_handle_state, rider_weight_input, bike_weight_input, tire_type_dropdown,
+                smoothing_dropdown, smoothing_window_input, derivative_dropdown, power_window_input,
+                start_slider, end_slider],
+        outputs=[ride_handle_state, calc_power_status, calc_power_plot]
     )
 
 if __name__ == "__main__":
-    demo.launch()
+    demo.launch(prevent_thread_lock=True)
+    if PREWARM:
+        threading.Thread(target=prewarm, name='prewarm', daemon=True).start()
+    demo.block_thread()
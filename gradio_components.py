@@ -1,6 +1,14 @@
 import numpy as np
 import plotly.graph_objs as go
 
+from utils.downsample import downsample_xy
+from utils.route_simplify import fit_zoom
+
+def trace_xy(x, y, max_points=None):
+    # Trace data capped at max_points (utils/downsample.py keeps the peaks)
+    x, y = downsample_xy(x, y, max_points)
+    return dict(x=x, y=y)
+
 def generate_line_graph(df):
     fig = go.Figure()
     if df is not None and not df.empty:
@@ -10,28 +18,28 @@ def generate_line_graph(df):
             x = np.arange(len(df))
         if 'heart_rate' in df:
             fig.add_trace(go.Scatter(
-                x=x, y=df['heart_rate'],
+                **trace_xy(x, df['heart_rate']),
                 mode='lines', name='Heart Rate',
                 line=dict(color='red', width=2),
                 opacity=0.7
             ))
         if 'cadence' in df:
             fig.add_trace(go.Scatter(
-                x=x, y=df['cadence'],
+                **trace_xy(x, df['cadence']),
                 mode='lines', name='Cadence',
                 line=dict(color='blue', width=2),
                 opacity=0.7
             ))
         if 'speed' in df:
             fig.add_trace(go.Scatter(
-                x=x, y=df['speed'],
+                **trace_xy(x, df['speed']),
                 mode='lines', name='Speed',
                 line=dict(color='purple', width=2),
                 opacity=0.7
             ))
         if 'power' in df:
             fig.add_trace(go.Scatter(
-                x=x, y=df['power'],
+                **trace_xy(x, df['power']),
                 mode='lines', name='Power',
                 line=dict(color='orange', width=2),
                 opacity=0.7
@@ -65,41 +73,60 @@ def generate_line_graph(df):
         )
     return fig
 
-def generate_map_scatter(df):
+def calc_zoom(lat_min, lat_max, lon_min, lon_max):
+    # Calculate zoom level based on bounds (approximate)
+    lat_range = max(abs(lat_max - lat_min), 1e-6)
+    lon_range = max(abs(lon_max - lon_min), 1e-6)
+    max_range = max(lat_range, lon_range)
+    if max_range < 0.001:
+        return 15
+    elif max_range < 0.01:
+        return 13
+    elif max_range < 0.05:
+        return 11
+    elif max_range < 0.1:
+        return 10
+    elif max_range < 0.5:
+        return 8
+    elif max_range < 1:
+        return 7
+    else:
+        return 5
+
+def generate_map_scatter(df, route=None, start_idx=None, end_idx=None):
+    # With a RoutePyramid (utils/route_simplify.py) for the full ride, the
+    # route between start_idx and end_idx is drawn at the simplification
+    # level matching the zoom that fits it. Otherwise every fix in df is drawn.
     fig = go.Figure()
-    if df is not None and not df.empty and 'position_lat' in df and 'position_long' in df:
-        fig.add_trace(go.Scattermapbox(
-            lat=df['position_lat'],
-            lon=df['position_long'],
-            mode='markers+lines',
-            marker=go.scattermapbox.Marker(size=7, color='#FFD700'),
-            name='Ride Path'
-        ))
+    bounds = None
+    if route is not None and route.levels:
+        start = 0 if start_idx is None else int(start_idx)
+        end = route.positions[-1] if end_idx is None else int(end_idx)
+        bounds = route.bounding_box(start, end)
+    if bounds is not None:
+        lat_min, lat_max, lon_min, lon_max = bounds
+        zoom = fit_zoom(lat_min, lat_max, lon_min, lon_max)
+        lat, lon = route.polyline(start, end, zoom)
+        lat_center = (lat_min + lat_max) / 2
+        lon_center = (lon_min + lon_max) / 2
+    elif df is not None and not df.empty and 'position_lat' in df and 'position_long' in df:
+        lat, lon = df['position_lat'], df['position_long']
         lat_center = df['position_lat'].mean()
         lon_center = df['position_long'].mean()
         # Calculate bounds
         lat_min, lat_max = df['position_lat'].min(), df['position_lat'].max()
         lon_min, lon_max = df['position_long'].min(), df['position_long'].max()
-        # Calculate zoom level based on bounds (approximate)
-        def calc_zoom(lat_min, lat_max, lon_min, lon_max):
-            lat_range = max(abs(lat_max - lat_min), 1e-6)
-            lon_range = max(abs(lon_max - lon_min), 1e-6)
-            max_range = max(lat_range, lon_range)
-            if max_range < 0.001:
-                return 15
-            elif max_range < 0.01:
-                return 13
-            elif max_range < 0.05:
-                return 11
-            elif max_range < 0.1:
-                return 10
-            elif max_range < 0.5:
-                return 8
-            elif max_range < 1:
-                return 7
-            else:
-                return 5
         zoom = calc_zoom(lat_min, lat_max, lon_min, lon_max)
+    else:
+        lat = None
+    if lat is not None:
+        fig.add_trace(go.Scattermapbox(
+            lat=lat,
+            lon=lon,
+            mode='markers+lines',
+            marker=go.scattermapbox.Marker(size=7, color='#FFD700'),
+            name='Ride Path'
+        ))
         fig.update_layout(
             mapbox_style="carto-darkmatter",
             mapbox=dict(
@@ -123,15 +150,32 @@ def generate_map_scatter(df):
         )
     return fig
 
-def generate_histogram(df, column, color, title):
+def generate_histogram(df, column, color, title, histograms=None, start_idx=None, end_idx=None):
+    # With a RangeHistogramIndex (utils/range_histograms.py) for the full ride,
+    # the counts of samples [start_idx, end_idx] are looked up and shipped as
+    # bars. Otherwise the browser bins the raw samples of df.
     fig = go.Figure()
-    if df is not None and not df.empty and column in df:
+    binned = histograms.histogram(column, start_idx, end_idx) if histograms is not None else None
+    if binned is not None and binned[1].any():
+        edges, counts = binned
+        # Only the bins the selected range reaches
+        nonzero = np.flatnonzero(counts)
+        first, last = nonzero[0], nonzero[-1] + 1
+        fig.add_trace(go.Bar(
+            x=(edges[first:last] + edges[first + 1:last + 1]) / 2,
+            y=counts[first:last],
+            width=edges[1] - edges[0],
+            marker_color=color,
+            name=title
+        ))
+    elif df is not None and not df.empty and column in df:
         fig.add_trace(go.Histogram(
             x=df[column],
             marker_color=color,
             nbinsx=30,
             name=title
         ))
+    if fig.data:
         fig.update_layout(
             template='plotly_dark',
             plot_bgcolor='#222222',
@@ -172,7 +216,7 @@ def generate_altitude_graph(df):
             label = 'Altitude'
         if y is not None:
             fig.add_trace(go.Scatter(
-                x=x, y=y,
+                **trace_xy(x, y),
                 mode='lines', name=label,
                 line=dict(color='green')
             ))
@@ -224,3 +268,58 @@ def generate_altitude_graph(df):
             margin=dict(l=20, r=20, t=40, b=20)
         )
     return fig
+
+def format_curve_duration(seconds):
+    if seconds < 60:
+        return f"{seconds}s"
+    elif seconds < 3600:
+        return f"{seconds // 60}min"
+    return f"{seconds // 3600}h"
+
+def generate_power_curve(curves, best_power=None):
+    # curves: {channel: (durations, best average)} from utils.power_curve.ride_curves,
+    # best_power: (durations, all-time best, filenames) from BestEffortsIndex.best
+    fig = go.Figure()
+    if 'power' in curves:
+        durations, values = curves['power']
+        fig.add_trace(go.Scatter(
+            x=durations, y=values,
+            mode='lines', name='Power (this ride)',
+            line=dict(color='orange', width=2),
+        ))
+    if best_power is not None and np.isfinite(best_power[1]).any():
+        durations, values, filenames = best_power
+        fig.add_trace(go.Scatter(
+            x=durations, y=values,
+            mode='lines', name='Power (all-time best)',
+            line=dict(color='#FFFFFF', width=1.5, dash='dot'),
+            customdata=[f or '' for f in filenames],
+            hovertemplate='%{y:.0f} W<br>%{customdata}<extra></extra>',
+        ))
+    if 'heart_rate' in curves:
+        durations, values = curves['heart_rate']
+        fig.add_trace(go.Scatter(
+            x=durations, y=values,
+            mode='lines', name='Heart Rate (this ride)',
+            line=dict(color='red', width=2),
+            yaxis='y2',
+        ))
+    tickvals = [1, 5, 15, 30, 60, 300, 600, 1200, 3600, 7200, 14400, 28800]
+    fig.update_layout(
+        template='plotly_dark',
+        plot_bgcolor='#222222',
+        paper_bgcolor='#222222',
+        font=dict(color='#FFFFFF'),
+        title='Mean-Maximal Power Curve' if fig.data else 'No Power or Heart Rate Data',
+        xaxis=dict(
+            type='log',
+            title='Duration',
+            tickvals=tickvals,
+            ticktext=[format_curve_duration(t) for t in tickvals],
+            gridcolor='#444444',
+        ),
+        yaxis=dict(title='Power (W)', gridcolor='#444444'),
+        yaxis2=dict(title='Heart Rate (bpm)', overlaying='y', side='right', showgrid=False),
+        margin=dict(l=20, r=20, t=40, b=20)
+    )
+    return fig
@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.calculate_power import (
+    AIR_DENSITY,
+    DRAG_COEFFICIENT,
+    FRONTAL_AREA,
+    POWER_COMPONENTS,
+    TIRE_TYPES,
+    calculate_power,
+)
+from utils.calibration import power_error_metrics
+from utils.load_ride import BASE_FOLDER, load_file
+from utils.range_stats import RangeStatsIndex
+from utils.ride_library import normalized_power
+
+# Headless power estimation and ride metrics over many rides.
+#
+# Usage (from the repository root):
+#   python -m utils.batch_analysis 'rides/*.fit' --rider-weight 70 --bike-weight 10 \
+#       --tire 'Road (28-32mm, 80psi)' --summary summary.csv [--samples-dir per_sample/]
+#
+# Rides are analysed in parallel on a process pool, one ride per task. The
+# summary is one table with a row per ride (metrics, model parameters and
+# calculated-vs-real power error); --samples-dir also writes each ride's
+# samples with the calculated power components. Tables are written as .csv,
+# .npz (one array per column) or .parquet (needs pyarrow), by file extension.
+# Rides must be in BASE_FOLDER; import others with utils.bulk_ingest first.
+
+SUMMARY_COLUMNS = [
+    'filename', 'ride_id', 'error', 'samples', 'start_time',
+    'elapsed_seconds', 'distance', 'elevation_gain',
+    'avg_speed', 'avg_heart_rate', 'avg_cadence',
+    'avg_power', 'np_power', 'avg_calculated_power',
+    'mae', 'rmse', 'avg_power_error_pct', 'r2',
+    'rider_weight', 'bike_weight', 'rolling_resistance_coefficient',
+    'air_density', 'drag_area', 'drivetrain_efficiency',
+]
+SAMPLE_COLUMNS = ['timestamp', 'distance', 'altitude', 'speed', 'power', *POWER_COMPONENTS, 'gap', 'paused']
+TABLE_FORMATS = ('.csv', '.npz', '.parquet')
+
+
+def resolve_rides(patterns):
+    # Filenames in BASE_FOLDER matching the patterns (paths or globs,
+    # relative to the working directory or to BASE_FOLDER), and the matches
+    # that lie outside BASE_FOLDER
+    base = os.path.realpath(BASE_FOLDER)
+    filenames, outside = [], []
+    for pattern in patterns:
+        matches = [
+            path for path in sorted(glob.glob(pattern)) or sorted(glob.glob(os.path.join(BASE_FOLDER, pattern)))
+            if path.lower().endswith(('.fit', '.gpx')) and os.path.isfile(path)
+        ]
+        for path in matches:
+            if os.path.dirname(os.path.realpath(path)) != base:
+                outside.append(path)
+            elif os.path.basename(path) not in filenames:
+                filenames.append(os.path.basename(path))
+    return filenames, outside
+
+
+def _npz_column(series):
+    if series.dtype == object:
+        return series.fillna('').to_numpy(dtype=str)
+    if isinstance(series.array, pd.arrays.IntegerArray):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return series.to_numpy()
+
+
+def write_table(df, path):
+    ext = os.path.splitext(path)[1].lower()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if ext == '.csv':
+        df.to_csv(path, index=False)
+    elif ext == '.parquet':
+        df.to_parquet(path, index=False)
+    elif ext == '.npz':
+        np.savez(path, **{col: _npz_column(df[col]) for col in df.columns})
+    else:
+        raise ValueError(f"Unsupported table format {ext!r}, use one of {', '.join(TABLE_FORMATS)}")
+
+
+def _mean(stats, channel):
+    return stats[channel]['mean'] if channel in stats else np.nan
+
+
+def analyze_ride(filename, params, samples_path=None):
+    # Worker: power model and metrics for one ride; returns a summary row.
+    # Failures are returned in the row's 'error' field rather than raised.
+    row = dict.fromkeys(SUMMARY_COLUMNS)
+    row.update(params, filename=filename)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = load_file(filename, use_cache=False)
+        calculate_power(df, **params)
+        stats = RangeStatsIndex(df).stats()
+        row.update(
+            ride_id=df.attrs.get('ride_id'),
+            samples=len(df),
+            start_time=df['timestamp'].dropna().iloc[0] if df['timestamp'].notnull().any() else pd.NaT,
+            elapsed_seconds=stats['elapsed_seconds'],
+            distance=stats['distance'],
+            elevation_gain=stats['elevation_gain'],
+            avg_speed=_mean(stats, 'speed'),
+            avg_heart_rate=_mean(stats, 'heart_rate'),
+            avg_cadence=_mean(stats, 'cadence'),
+            avg_power=_mean(stats, 'power'),
+            np_power=normalized_power(df) if 'power' in stats else np.nan,
+            avg_calculated_power=float(np.nanmean(df['calculated_power'].to_numpy())),
+        )
+        if 'power' in df:
+            row.update(power_error_metrics(
+                df['calculated_power'].to_numpy(dtype=np.float64),
+                df['power'].to_numpy(dtype=np.float64, na_value=np.nan),
+            ))
+        if samples_path is not None:
+            write_table(df[[col for col in SAMPLE_COLUMNS if col in df]], samples_path)
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def analyze_rides(filenames, params, workers=None, samples_dir=None, samples_format='.csv'):
+    # Summary DataFrame, one row per ride, in the order of filenames
+    # ex: NCAR.fit -> NCAR_fit.csv, so NCAR.gpx doesn't overwrite it
+    samples_paths = [
+        os.path.join(samples_dir, f"{os.path.splitext(f)[0]}_{os.path.splitext(f)[1][1:]}{samples_format}")
+        if samples_dir else None
+        for f in filenames
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(analyze_ride, filenames, [params] * len(filenames), samples_paths))
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+
+def main(argv=None):
+    tires = dict(TIRE_TYPES)
+    parser = argparse.ArgumentParser(description="Estimate power and compute ride metrics for many rides.")
+    parser.add_argument('rides', nargs='*', default=[os.path.join(BASE_FOLDER, '*')], help=f"ride files or globs in {BASE_FOLDER}/ (default: all)")
+    parser.add_argument('--rider-weight', type=float, required=True, help="kg")
+    parser.add_argument('--bike-weight', type=float, required=True, help="kg")
+    rolling = parser.add_mutually_exclusive_group(required=True)
+    rolling.add_argument('--tire', choices=list(tires), help="tire type (sets the rolling resistance)")
+    rolling.add_argument('--crr', type=float, help="rolling resistance coefficient")
+    parser.add_argument('--air-density', type=float, default=AIR_DENSITY, help="kg/m^3")
+    parser.add_argument('--drag-area', type=float, default=FRONTAL_AREA * DRAG_COEFFICIENT, help="CdA, m^2")
+    parser.add_argument('--drivetrain-efficiency', type=float, default=1.0)
+    parser.add_argument('--summary', default='summary.csv', help=f"summary table path ({', '.join(TABLE_FORMATS)})")
+    parser.add_argument('--samples-dir', help="also write each ride's samples with calculated power here")
+    parser.add_argument('--samples-format', choices=TABLE_FORMATS, default='.csv')
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    filenames, outside = resolve_rides(args.rides)
+    for path in outside:
+        print(f"Skipping {path}: not in {BASE_FOLDER}/ (import it with python -m utils.bulk_ingest)")
+    if not filenames:
+        print("No rides matched")
+        return 2
+    params = {
+        'rider_weight': args.rider_weight,
+        'bike_weight': args.bike_weight,
+        'rolling_resistance_coefficient': tires[args.tire] if args.tire else args.crr,
+        'air_density': args.air_density,
+        'drag_area': args.drag_area,
+        'drivetrain_efficiency': args.drivetrain_efficiency,
+    }
+    started = time.perf_counter()
+    summary = analyze_rides(filenames, params, args.workers, args.samples_dir, args.samples_format)
+    write_table(summary, args.summary)
+    seconds = time.perf_counter() - started
+    failed = summary[summary['error'].notnull()]
+    print(
+        f"Analysed {len(summary) - len(failed)} of {len(summary)} rides in {seconds:.1f}s "
+        f"({summary['samples'].sum():,.0f} samples), summary written to {args.summary}"
+    )
+    for _, row in failed.iterrows():
+        print(f"  FAILED {row['filename']}: {row['error']}")
+    return 1 if len(failed) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.load_ride import BASE_FOLDER, load_file
+from utils.ride_cache import file_content_hash, ride_cache
+from utils.ride_library import ride_library
+
+# Bulk ingest of ride files into the rides folder, the ride cache and the
+# ride library.
+#
+# Usage (from the repository root):
+#   python -m utils.bulk_ingest /path/to/archive [more paths] [--workers N]
+#
+# Directory trees are walked for .fit/.gpx files. Each file is copied into
+# BASE_FOLDER (renamed with a -2, -3, ... suffix if a different ride already
+# has its name) and decoded on a process pool. This process then stores the
+# decoded rides in the cache and the library, so the index files only have
+# one writer. Files already in the library with the same content are skipped.
+# A file that fails to decode, or crashes its worker, is reported, removed
+# from the rides folder again (unless it was there before) and the batch
+# continues.
+
+RIDE_EXTENSIONS = ('.fit', '.gpx')
+
+
+def find_ride_files(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(
+                    os.path.join(root, f) for f in sorted(files)
+                    if f.lower().endswith(RIDE_EXTENSIONS)
+                )
+        elif path.lower().endswith(RIDE_EXTENSIONS):
+            found.append(path)
+    return found
+
+
+def _same_content(a, b):
+    return os.path.getsize(a) == os.path.getsize(b) and file_content_hash(a) == file_content_hash(b)
+
+
+def plan_ingest(sources, force=False):
+    # [(source, filename in BASE_FOLDER)] to decode, and the number of
+    # sources skipped because the library already has them (or they repeat
+    # an earlier file of the batch)
+    os.makedirs(BASE_FOLDER, exist_ok=True)
+    indexed = ride_library.current_files()
+    taken = {}
+    plan = []
+    skipped = 0
+    for source in sources:
+        stem, ext = os.path.splitext(os.path.basename(source))
+        ext = ext.lower()
+        suffix = 1
+        while True:
+            filename = f"{stem}{ext}" if suffix == 1 else f"{stem}-{suffix}{ext}"
+            dest = os.path.join(BASE_FOLDER, filename)
+            if filename in taken:
+                if _same_content(taken[filename], source):
+                    filename = None
+                    break
+            elif not os.path.exists(dest) or _same_content(dest, source):
+                break
+            suffix += 1
+        if filename is None:
+            # Duplicate of a file earlier in this batch
+            skipped += 1
+            continue
+        taken[filename] = source
+        stat = os.stat(dest) if os.path.exists(dest) else None
+        if (
+            not force and stat is not None
+            and indexed.get(filename) == (stat.st_mtime_ns, stat.st_size)
+        ):
+            skipped += 1
+            continue
+        plan.append((source, filename))
+    return plan, skipped
+
+
+def decode_ride(source, filename):
+    # Worker: copy source into BASE_FOLDER as filename and decode it.
+    # Returns (filename, df or None, error or None, seconds).
+    # A file that fails to decode is removed again, so it never shows up in
+    # the rides folder. If the worker itself crashes, ingest removes it.
+    start = time.perf_counter()
+    dest = os.path.join(BASE_FOLDER, filename)
+    copied = False
+    try:
+        if not os.path.exists(dest) or not os.path.samefile(source, dest):
+            tmp_path = dest + '.ingest.tmp'
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, dest)
+            copied = True
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = load_file(filename, use_cache=False)
+        return filename, df, None, time.perf_counter() - start
+    except Exception as e:
+        if copied:
+            os.remove(dest)
+        return filename, None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+def _store(filename, df, error):
+    path = os.path.join(BASE_FOLDER, filename)
+    if df is not None:
+        ride_cache.put(path, df)
+    if os.path.exists(path):
+        ride_library.update_file(filename, df=df, error=error)
+
+
+def ingest(sources, workers=None, force=False, progress=print):
+    # Returns a report dict (see main for the fields)
+    started = time.perf_counter()
+    plan, skipped = plan_ingest(sources, force)
+    sources_by_name = {filename: source for source, filename in plan}
+    report = {'files': len(sources), 'skipped': skipped, 'ingested': 0, 'samples': 0, 'bytes': 0, 'failed': []}
+
+    def record(filename, df, error, seconds):
+        _store(filename, df, error)
+        done = report['ingested'] + len(report['failed']) + 1
+        elapsed = time.perf_counter() - started
+        if error is None:
+            report['ingested'] += 1
+            report['samples'] += len(df)
+            report['bytes'] += os.path.getsize(os.path.join(BASE_FOLDER, filename))
+            status = f"ok, {len(df)} samples in {seconds:.2f}s"
+        else:
+            report['failed'].append({'source': sources_by_name[filename], 'filename': filename, 'error': error})
+            status = f"FAILED: {error}"
+        progress(f"[{done}/{len(plan)}] {done / elapsed:.1f} files/s  {filename}: {status}")
+
+    workers = workers or os.cpu_count() or 1
+    existing = {filename for _, filename in plan if os.path.exists(os.path.join(BASE_FOLDER, filename))}
+    queue = deque(plan)
+    while queue:
+        # At most `workers` files are submitted and unfinished at a time, so
+        # when a crashed worker takes the whole pool down with it, only those
+        # files are suspects
+        suspects = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            while queue or running:
+                while queue and len(running) < workers:
+                    source, filename = queue.popleft()
+                    running[executor.submit(decode_ride, source, filename)] = filename
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    filename = running.pop(future)
+                    try:
+                        record(*future.result())
+                    except BrokenProcessPool:
+                        suspects.append(filename)
+                if suspects:
+                    for future, filename in running.items():
+                        try:
+                            record(*future.result())
+                        except BrokenProcessPool:
+                            suspects.append(filename)
+                    break
+        # Retry the suspects one per pool so only the culprit fails, then
+        # carry on with the rest of the queue on a new full-size pool
+        for filename in suspects:
+            try:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    result = executor.submit(decode_ride, sources_by_name[filename], filename).result()
+            except BrokenProcessPool:
+                result = (filename, None, "worker process crashed", 0.0)
+                # The worker didn't get to remove its copy
+                dest = os.path.join(BASE_FOLDER, filename)
+                for path in (dest + '.ingest.tmp', dest if filename not in existing else None):
+                    if path is not None and os.path.exists(path):
+                        os.remove(path)
+            record(*result)
+
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode ride files into the rides folder, ride cache and ride library.")
+    parser.add_argument('paths', nargs='+', help="ride files or directories to walk")
+    parser.add_argument('--workers', type=int, default=None, help="decoding processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="re-decode files the library already has")
+    parser.add_argument('--report', help="write the report as JSON to this path")
+    parser.add_argument('--quiet', action='store_true', help="only print the summary")
+    args = parser.parse_args(argv)
+
+    sources = find_ride_files(args.paths)
+    report = ingest(sources, args.workers, args.force, progress=(lambda line: None) if args.quiet else print)
+    seconds = max(report['seconds'], 1e-9)
+    print(
+        f"Ingested {report['ingested']} of {report['files']} files "
+        f"({report['skipped']} already ingested, {len(report['failed'])} failed) "
+        f"in {seconds:.1f}s: {report['ingested'] / seconds:.1f} files/s, "
+        f"{report['samples'] / seconds:,.0f} samples/s, {report['bytes'] / seconds / 1024**2:.1f} MB/s"
+    )
+    for failure in report['failed']:
+        print(f"  FAILED {failure['source']}: {failure['error']}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if report['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,36 @@
-def compute_global_metrics(df):
+import numpy as np
+
+
+def format_duration(total_seconds):
+    total_seconds = int(total_seconds)
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    if hours > 0:
+        return f"{hours}hr {minutes}min {seconds}sec"
+    elif minutes > 0:
+        return f"{minutes}min {seconds}sec"
+    else:
+        return f"{seconds}sec"
+
+
+def _global_metrics_from_index(range_index):
+    # Whole-ride metrics from a utils.range_stats.RangeStatsIndex
+    stats = range_index.stats()
+    empty = {'mean': np.nan}
+    elapsed = stats['elapsed_seconds']
+    distance = stats['distance']
+    avg_speed = stats.get('speed', empty)['mean']
+    avg_power = stats.get('power', empty)['mean']
+    return {
+        "Total Time": format_duration(elapsed) if np.isfinite(elapsed) else "-",
+        "Total Distance": f"{distance / 1000:.2f} km" if np.isfinite(distance) else "-",
+        "Average Speed": f"{avg_speed * 3.6:.1f} km/h" if np.isfinite(avg_speed) else "-",
+        "Average Power": f"{avg_power:.0f} W" if np.isfinite(avg_power) else "-",
+    }
+
+
+def compute_global_metrics(df, range_index=None):
     if df is None or df.empty:
         return {
             "Total Time": "-",
@@ -6,21 +38,14 @@ def compute_global_metrics(df):
             "Average Speed": "-",
             "Average Power": "-"
         }
+    if range_index is not None:
+        return _global_metrics_from_index(range_index)
     # Total ride time
     if 'timestamp' in df and df['timestamp'].notnull().any():
         t0 = df['timestamp'].iloc[0]
         t1 = df['timestamp'].iloc[-1]
         delta = t1 - t0
-        total_seconds = int(delta.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        if hours > 0:
-            total_time = f"{hours}hr {minutes}min {seconds}sec"
-        elif minutes > 0:
-            total_time = f"{minutes}min {seconds}sec"
-        else:
-            total_time = f"{seconds}sec"
+        total_time = format_duration(delta.total_seconds())
     else:
         total_time = "-"
     # Total distance (in km)
@@ -1,6 +1,192 @@
-import pandas as pd
+import numpy as np
+
+from utils.smoothing import (
+    DEFAULT_DERIVATIVE,
+    DEFAULT_SMOOTHING,
+    DEFAULT_SMOOTHING_WINDOW,
+    model_rates,
+)
+
+# Constants
+g = 9.81  # m/s^2, gravitational acceleration
+
+# Sea level standard air density is 1.225 kg/m^3
+# TODO: Should probably adjust for altitude
+# Using air pressure at 1-mile high at 30C
+# TODO make this a parameter.
+AIR_DENSITY = 0.96  # kg/m^3
+
+FRONTAL_AREA = 0.4  # m^2, average frontal area of a cyclist
+# TODO: This is a guess. Maybe this should be a parameter
+DRAG_COEFFICIENT = 0.76  # professional cyclist drag coefficient
+# TODO: This is a guess and testing empirically needs a wind tunnel.
+
+SMOOTHING_WINDOW = 5  # samples, rolling mean of calculated power
+
+# Rolling resistance coefficient by tire type
+TIRE_TYPES = [
+    ("Road (23-25mm, 100psi)", 0.003),
+    ("Road (28-32mm, 80psi)", 0.004),
+    ("Gravel (35-40mm, 40psi)", 0.006),
+    ("MTB (2.1-2.4in, 25psi)", 0.010),
+    ("Touring/Commuter", 0.007),
+]
+
+# Bump whenever the model's output changes, to invalidate cached results
+MODEL_VERSION = 2
+
+POWER_COMPONENTS = (
+    'gravitational_power',
+    'kinetic_power',
+    'frictional_power',
+    'calculated_power',
+)
+
+
+def column_as_float(df, column):
+    # Contiguous float64 copy of a column, NaN for missing values
+    if column not in df:
+        return np.full(len(df), np.nan)
+    values = df[column]
+    if values.dtype.kind == 'M':
+        seconds = values.to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+        seconds[values.isnull().to_numpy()] = np.nan
+        return seconds
+    return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def ride_seconds(df):
+    # Time base for the power model: the sample spacing of a ride on a
+    # uniform grid (see utils/resample.py), else its timestamps as seconds
+    rate = df.attrs.get('sample_rate')
+    if rate:
+        return 1.0 / rate
+    return column_as_float(df, 'timestamp')
+
+
+def time_steps(seconds, n, out=None):
+    # Seconds since the previous sample, NaN for the first sample and for
+    # steps that don't move forward (ex: duplicate timestamps). seconds is
+    # either the timestamps or the spacing of uniformly sampled data.
+    if out is None:
+        out = np.empty(n)
+    if n == 0:
+        return out
+    if np.ndim(seconds) == 0:
+        out.fill(seconds)
+    else:
+        np.subtract(seconds[1:], seconds[:-1], out=out[1:])
+    out[0] = np.nan
+    with np.errstate(invalid='ignore'):
+        out[out <= 0] = np.nan
+    return out
+
+
+def rolling_mean(values, window, out=None):
+    # Trailing rolling mean along the last axis with min_periods=1, skipping
+    # non-finite samples. Uses cumulative sums, so the cost doesn't depend on
+    # the window length.
+    n = values.shape[-1]
+    if out is None:
+        out = np.empty(values.shape)
+    finite = np.isfinite(values)
+    sums = np.zeros(values.shape[:-1] + (n + 1,))
+    np.cumsum(np.where(finite, values, 0.0), axis=-1, out=sums[..., 1:])
+    counts = np.zeros(values.shape[:-1] + (n + 1,))
+    np.cumsum(finite, axis=-1, out=counts[..., 1:])
+    window_sums = sums[..., 1:].copy()
+    window_counts = counts[..., 1:].copy()
+    if window < n + 1:
+        window_sums[..., window:] -= sums[..., 1:n + 1 - window]
+        window_counts[..., window:] -= counts[..., 1:n + 1 - window]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(window_sums, window_counts, out=out)
+    out[window_counts == 0] = np.nan
+    return out
+
+
+def compute_power_arrays(
+    seconds, altitude, speed,
+    system_weight, rolling_resistance_coefficient,
+    air_density=AIR_DENSITY, drag_area=FRONTAL_AREA * DRAG_COEFFICIENT,
+    drivetrain_efficiency=1.0, window=SMOOTHING_WINDOW, out=None,
+    smoothing=DEFAULT_SMOOTHING, smoothing_window=DEFAULT_SMOOTHING_WINDOW,
+    derivative=DEFAULT_DERIVATIVE, kernels=None,
+):
+    # Array-level power model. Inputs are float64 arrays of equal length
+    # (timestamps as seconds, or the sample spacing as a scalar, see
+    # time_steps). Returns a (4, n) array whose rows are
+    # POWER_COMPONENTS; pass `out` to reuse a buffer across calls.
+    # smoothing, smoothing_window and derivative select how altitude and
+    # speed are smoothed and differentiated (see utils/smoothing.py); kernels
+    # is a dict to share that work between calls on the same ride.
+    n = len(altitude)
+    if out is None:
+        out = np.empty((4, n))
+    gravitational, kinetic, frictional, calculated = out
+    if n == 0:
+        return out
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if smoothing == 'none' and derivative == 'first_order':
+            # Backward differences of the recorded values, in place. The
+            # calculated row doubles as scratch space for the time steps.
+            steps = time_steps(seconds, n, out=calculated)
+
+            # GPE = m * g * h, power is the change in GPE per time step
+            gravitational[0] = 0
+            np.subtract(altitude[1:], altitude[:-1], out=gravitational[1:])
+            # Missing samples contribute no change in energy
+            gravitational[np.isnan(gravitational)] = 0
+            gravitational[1:] *= system_weight * g
+            gravitational[1:] /= steps[1:]
+
+            # Kinetic energy = 0.5 * m * v^2, frictional row holds v^2 for now
+            speed_squared = frictional
+            np.multiply(speed, speed, out=speed_squared)
+            kinetic[0] = 0
+            np.subtract(speed_squared[1:], speed_squared[:-1], out=kinetic[1:])
+            kinetic[np.isnan(kinetic)] = 0
+            kinetic[1:] *= 0.5 * system_weight
+            kinetic[1:] /= steps[1:]
+        else:
+            # Same terms from the smoothed inputs and their rates of change
+            speed, climb, speed_squared_change = model_rates(
+                seconds, altitude, speed, smoothing, smoothing_window, derivative, kernels,
+            )
+            np.multiply(climb, system_weight * g, out=gravitational)
+            np.multiply(speed_squared_change, 0.5 * system_weight, out=kinetic)
+            np.multiply(speed, speed, out=frictional)
+
+        # Air resistance force = 0.5 * rho * CdA * v^2
+        # Rolling resistance force = C_r * m * g
+        # Power = Force * Speed
+        frictional *= 0.5 * air_density * drag_area
+        frictional += rolling_resistance_coefficient * system_weight * g
+        frictional *= speed
+
+        np.add(gravitational, kinetic, out=calculated)
+        calculated += frictional
+        # Power at the pedals, before drivetrain losses
+        if drivetrain_efficiency != 1.0:
+            calculated /= drivetrain_efficiency
 
-def calculate_power(df, rider_weight, bike_weight, rolling_resistance_coefficient):
+    # Output power cannot be negative. This is a result of braking (or error).
+    # (np.maximum keeps NaN, like Series.clip)
+    np.maximum(calculated, 0, out=calculated)
+
+    # Smooth out calculated power using a rolling window
+    rolling_mean(calculated, window, out=calculated)
+    return out
+
+
+def calculate_power(
+    df, rider_weight, bike_weight, rolling_resistance_coefficient,
+    air_density=AIR_DENSITY, drag_area=FRONTAL_AREA * DRAG_COEFFICIENT,
+    drivetrain_efficiency=1.0, window=SMOOTHING_WINDOW,
+    smoothing=DEFAULT_SMOOTHING, smoothing_window=DEFAULT_SMOOTHING_WINDOW,
+    derivative=DEFAULT_DERIVATIVE,
+):
     # Use speed and altitude to estimate power
     # Properties we care about:
     # - Gravitational energy
@@ -10,79 +196,22 @@ def calculate_power(df, rider_weight, bike_weight, rolling_resistance_coefficien
     # Properties not in scope:
     # - Wind resistance: We don't have wind speed/direction data
     # Mechanical losses: Assume drivetrain efficiency is high enough to not care about it
-
-    # Constants
-    g = 9.81  # m/s^2, gravitational acceleration
+    #   (unless a calibrated drivetrain_efficiency is given, see utils/calibration.py)
     system_weight = rider_weight + bike_weight  # kg
 
-    time_steps = df['timestamp'].diff().dt.total_seconds()
-
-    # GPE = m * g * h
-    gravitational_potential_energy = system_weight * g * df['altitude']
-    delta_gravitational_potential_energy = gravitational_potential_energy.diff().fillna(0)
-
-    gravitational_power = delta_gravitational_potential_energy / time_steps
-    # Pad with 0 to account for diff
-    df['gravitational_power'] = pd.concat(
-        [pd.Series([0]), gravitational_power], ignore_index=True
-    )
-
-
-    # Kinetic energy = 0.5 * m * v^2
-    kinetic_energy = 0.5 * system_weight * (df['speed'] ** 2)
-    delta_kinetic_energy = kinetic_energy.diff().fillna(0)
-    kinetic_power = delta_kinetic_energy / time_steps
-    # Pad with 0 to account for diff
-    df['kinetic_power'] = pd.concat(
-        [pd.Series([0]), kinetic_power], ignore_index=True
+    components = compute_power_arrays(
+        ride_seconds(df),
+        column_as_float(df, 'altitude'),
+        column_as_float(df, 'speed'),
+        system_weight,
+        rolling_resistance_coefficient,
+        air_density=air_density,
+        drag_area=drag_area,
+        drivetrain_efficiency=drivetrain_efficiency,
+        window=window,
+        smoothing=smoothing,
+        smoothing_window=smoothing_window,
+        derivative=derivative,
     )
-
-    # Frictional resistances
-    # Air resistance force = 0.5 * rho * A * C_d * v^2
-    # where rho is air density, A is frontal area, C_d is drag coefficient, v is speed,
-    # Rolling resistance force = C_r * m * g
-    # where C_r is rolling resistance coefficient, m is mass, g is gravitational acceleration,
-
-    # Energy = Force * Distance
-    # So, Energy = Force * Speed * Time
-    # Power = Energy / Time
-    # Thus, Power = Force * Speed
-
-    air_density = 1.225  # kg/m^3, sea level standard air density
-    # TODO: Should probably adjust for altitude
-    # Using air pressure at 1-mile high at 30C
-    # TODO make this a parameter.
-    air_density = 0.96  # kg/m^3
-
-    frontal_area = 0.4  # m^2, average frontal area of a cyclist
-    # TODO: This is a guess. Maybe this should be a parameter
-    drag_coefficient = 0.76  # professional cyclist drag coefficient
-    # TODO: This is a guess and testing empirically needs a wind tunnel.
-
-    air_resistance_force = (
-        0.5 * air_density * frontal_area * drag_coefficient * (df['speed'] ** 2)
-    )
-    rolling_resistance_force = (
-        rolling_resistance_coefficient * system_weight * g
-    )
-    total_resistance_force = air_resistance_force + rolling_resistance_force
-
-    frictional_power = (
-        total_resistance_force * df['speed']
-    )
-    df['frictional_power'] = frictional_power
-    # Adjust for data sampling rate
-    df['frictional_power'] *= df['timestamp'].diff().dt.total_seconds()
-
-
-    df['calculated_power'] = (
-        df['gravitational_power'] +
-        df['kinetic_power'] +
-        df['frictional_power']
-    )
-
-    # Output power cannot be negative. This is a result of braking (or error).
-    df['calculated_power'] = df['calculated_power'].clip(lower=0)
-
-    # Smooth out calculated power using a rolling window
-    df['calculated_power'] = df['calculated_power'].rolling(window=5, min_periods=1).mean()
+    for name, values in zip(POWER_COMPONENTS, components):
+        df[name] = values
@@ -0,0 +1,133 @@
+import numpy as np
+
+from utils.calculate_power import (
+    AIR_DENSITY,
+    SMOOTHING_WINDOW,
+    column_as_float,
+    compute_power_arrays,
+    rolling_mean,
+)
+from utils.power_sweep import power_basis
+from utils.smoothing import (
+    DEFAULT_DERIVATIVE,
+    DEFAULT_SMOOTHING,
+    DEFAULT_SMOOTHING_WINDOW,
+)
+
+# Calibrate the friction terms of the power model against a power meter.
+#
+# Before clipping, the model is linear in its friction coefficients
+# (see utils/power_sweep.py):
+#
+#   efficiency * P = m * A + C_r * (m * B) + CdA * (rho * C)
+#
+# Rolling means are linear too, so we smooth the measured power and the
+# basis terms with the model's window and solve for C_r, CdA (and optionally
+# the drivetrain efficiency) with one least squares solve. Samples where the
+# rider isn't pedaling are left out, since the model clips those to 0.
+
+MIN_FIT_SAMPLES = 30
+
+
+def _solve_nonnegative(X, y):
+    # Least squares with coefficients >= 0: coefficients that come out
+    # negative are pinned to 0 and the rest are re-solved.
+    free = np.ones(X.shape[1], dtype=bool)
+    x = np.zeros(X.shape[1])
+    while free.any():
+        x[:] = 0
+        x[free] = np.linalg.lstsq(X[:, free], y, rcond=None)[0]
+        negative = free & (x < 0)
+        if not negative.any():
+            break
+        free &= ~negative
+    x[~free] = 0
+    return x
+
+
+def power_error_metrics(calculated, measured):
+    valid = np.isfinite(calculated) & np.isfinite(measured)
+    calculated = calculated[valid]
+    measured = measured[valid]
+    if not valid.any():
+        return {'mae': np.nan, 'rmse': np.nan, 'avg_power_error_pct': np.nan, 'r2': np.nan}
+    residual = calculated - measured
+    total = np.sum((measured - measured.mean()) ** 2)
+    avg_measured = measured.mean()
+    return {
+        'mae': float(np.mean(np.abs(residual))),
+        'rmse': float(np.sqrt(np.mean(residual ** 2))),
+        # Same figure README.old.md quotes: error of the average power
+        'avg_power_error_pct': float(100 * (calculated.mean() - avg_measured) / avg_measured) if avg_measured else np.nan,
+        'r2': float(1 - np.sum(residual ** 2) / total) if total else np.nan,
+    }
+
+
+def calibrate(
+    df, rider_weight, bike_weight,
+    air_density=AIR_DENSITY, fit_efficiency=False,
+    start_idx=None, end_idx=None,
+    window=SMOOTHING_WINDOW, min_power=1.0,
+    smoothing=DEFAULT_SMOOTHING, smoothing_window=DEFAULT_SMOOTHING_WINDOW,
+    derivative=DEFAULT_DERIVATIVE,
+):
+    # Fit rolling resistance coefficient and CdA (and drivetrain efficiency if
+    # fit_efficiency) to the ride's measured `power` over [start_idx, end_idx],
+    # for the model with the given smoothing and derivative methods.
+    # Returns the fitted coefficients and error metrics of the calibrated model.
+    if df is None or df.empty or 'power' not in df:
+        raise ValueError("Calibration needs a ride with measured power")
+    start = 0 if start_idx is None else max(0, int(start_idx))
+    end = len(df) - 1 if end_idx is None else min(len(df) - 1, int(end_idx))
+    if start >= end:
+        raise ValueError("Calibration range is empty")
+    rows = slice(start, end + 1)
+
+    system_weight = rider_weight + bike_weight
+    seconds = column_as_float(df, 'timestamp')[rows]
+    altitude = column_as_float(df, 'altitude')[rows]
+    speed = column_as_float(df, 'speed')[rows]
+    measured = column_as_float(df, 'power')[rows]
+
+    # Smooth all four series over the same set of valid samples
+    basis = power_basis(seconds, altitude, speed, smoothing, smoothing_window, derivative)
+    series = np.vstack([basis, measured])
+    series[:, ~np.isfinite(series).all(axis=0)] = np.nan
+    smoothed = rolling_mean(series, window)
+    A, B, C, P = smoothed
+    use = np.isfinite(smoothed).all(axis=0) & (P >= min_power)
+    if use.sum() < MIN_FIT_SAMPLES:
+        raise ValueError("Not enough samples with measured power to calibrate")
+    A, B, C, P = A[use], B[use], C[use], P[use]
+
+    efficiency = None
+    if fit_efficiency:
+        # m * A = efficiency * P - C_r * (m * B) - CdA * (rho * C)
+        X = np.column_stack([P, -system_weight * B, -air_density * C])
+        efficiency, crr, drag_area = _solve_nonnegative(X, system_weight * A)
+        if efficiency == 0:
+            raise ValueError("Could not fit a drivetrain efficiency to this range")
+        if efficiency > 1:
+            # Losses can't be negative, refit with a lossless drivetrain
+            efficiency = None
+    if efficiency is None:
+        # P - m * A = C_r * (m * B) + CdA * (rho * C)
+        X = np.column_stack([system_weight * B, air_density * C])
+        crr, drag_area = _solve_nonnegative(X, P - system_weight * A)
+        efficiency = 1.0
+
+    calculated = compute_power_arrays(
+        seconds, altitude, speed, system_weight, crr,
+        air_density=air_density, drag_area=drag_area,
+        drivetrain_efficiency=efficiency, window=window,
+        smoothing=smoothing, smoothing_window=smoothing_window, derivative=derivative,
+    )[3]
+    result = {
+        'rolling_resistance_coefficient': float(crr),
+        'drag_area': float(drag_area),
+        'drivetrain_efficiency': float(efficiency),
+        'air_density': float(air_density),
+        'samples': int(use.sum()),
+    }
+    result.update(power_error_metrics(calculated, measured))
+    return result
@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+
+# Shape-preserving downsampling for plot traces.
+#
+# 'minmax' splits the series into equal buckets and keeps the minimum and
+# maximum sample of each, so every peak (ex: sprint power spikes) survives.
+# 'lttb' is Largest-Triangle-Three-Buckets, which keeps the visually most
+# significant point per bucket. Both keep the first and last samples, and a
+# series that already fits is returned untouched (full resolution once the
+# selected range is small enough).
+
+MAX_TRACE_POINTS = int(os.environ.get('MAX_TRACE_POINTS', 2000))
+DOWNSAMPLE_METHOD = os.environ.get('DOWNSAMPLE_METHOD', 'minmax')
+
+
+def _as_numeric(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def minmax_indices(y, max_points):
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    n_buckets = max(1, (max_points - 2) // 2)
+    bucket_size = -(-n // n_buckets)
+    padded = n_buckets * bucket_size
+    valid = np.isfinite(y)
+    low = np.full(padded, np.inf)
+    low[:n][valid] = y[valid]
+    high = np.full(padded, -np.inf)
+    high[:n][valid] = y[valid]
+    offsets = np.arange(n_buckets) * bucket_size
+    low = low.reshape(n_buckets, bucket_size)
+    high = high.reshape(n_buckets, bucket_size)
+    argmin = offsets + low.argmin(axis=1)
+    argmax = offsets + high.argmax(axis=1)
+    # Buckets without valid samples keep one (NaN) sample so gaps stay gaps
+    empty = ~np.isfinite(low.min(axis=1))
+    argmin[empty] = np.minimum(offsets[empty], n - 1)
+    argmax[empty] = argmin[empty]
+    indices = np.concatenate([[0, n - 1], argmin, argmax])
+    return np.unique(indices[indices < n])
+
+
+def lttb_indices(x, y, max_points):
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    x = _as_numeric(x)
+    # Missing values never win a bucket (their area is NaN -> -1 below)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    selected = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if end <= start:
+            end = start + 1
+        # Average of the next bucket is the third triangle vertex
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        with np.errstate(invalid='ignore'):
+            avg_x = x[next_start:next_end].mean()
+            next_y = y[next_start:next_end]
+            avg_y = np.nanmean(next_y) if np.isfinite(next_y).any() else 0.0
+        ax, ay = x[selected], y[selected]
+        if not np.isfinite(ay):
+            ay = 0.0
+        area = np.abs(
+            (ax - avg_x) * (y[start:end] - ay)
+            - (ax - x[start:end]) * (avg_y - ay)
+        )
+        area = np.nan_to_num(area, nan=-1.0)
+        selected = start + int(area.argmax())
+        indices[bucket + 1] = selected
+    return np.unique(indices)
+
+
+def downsample_indices(x, y, max_points=None, method=None):
+    max_points = MAX_TRACE_POINTS if max_points is None else max_points
+    method = DOWNSAMPLE_METHOD if method is None else method
+    if method == 'minmax':
+        return minmax_indices(y, max_points)
+    elif method == 'lttb':
+        return lttb_indices(x, y, max_points)
+    raise ValueError(f"Unknown downsampling method: {method}")
+
+
+def _as_array(values):
+    # Nullable integer Series become float64 with NaN for missing values
+    if getattr(values, 'dtype', None) is not None and not isinstance(values.dtype, np.dtype):
+        if values.dtype.kind in 'iuf':
+            return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.asarray(values)
+
+
+def downsample_xy(x, y, max_points=None, method=None):
+    # x and y are array-likes (Series are fine); returns numpy arrays
+    x = _as_array(x)
+    y = _as_array(y)
+    max_points = MAX_TRACE_POINTS if max_points is None else max_points
+    if len(y) <= max_points:
+        return x, y
+    indices = downsample_indices(x, y, max_points, method)
+    return x[indices], y[indices]
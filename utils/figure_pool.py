@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gradio.components.plot import PlotData
+
+from utils.timing import record_stage
+
+# Bounded worker pool for building the dashboard's Plotly figures.
+#
+# The figures of one handler call are independent, so with FIGURE_WORKERS > 1
+# they are built on a thread pool shared by all sessions. Plotly figure
+# construction and JSON encoding are mostly pure Python under the GIL, so the
+# pool is off by default (figures are built inline): on one CPU it was 5-15%
+# slower than building serially. benchmarks/bench_figure_pool.py measures
+# whether it pays off on a given machine. Threads rather than processes: the
+# figures and the ride views they read would have to be pickled across
+# processes, which costs far more than building them.
+#
+# With serialize=True each figure is also turned into its Plotly JSON payload
+# on the pool (gr.Plot accepts it as is), so the handler's timing spans see
+# serialization, which Gradio would otherwise do after the handler returns.
+# Build and serialization times are recorded per figure as 'figure.<name>'
+# and 'serialize.<name>' stages of the running handler (utils/timing.py).
+
+FIGURE_WORKERS = int(os.environ.get('FIGURE_WORKERS', 1))
+
+_executor = None
+_executor_lock = threading.Lock()
+# Seconds taken by the most recent build of each figure
+figure_timings = {}
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FIGURE_WORKERS, thread_name_prefix='figure')
+        return _executor
+
+
+def plot_payload(fig):
+    # Plotly figure -> the JSON payload gr.Plot sends to the browser
+    return PlotData(type='plotly', plot=fig.to_json())
+
+
+def _timed(name, fn, args, serialize):
+    # Returns (result, {stage: seconds})
+    start = time.perf_counter()
+    try:
+        result = fn(*args)
+    finally:
+        figure_timings[name] = time.perf_counter() - start
+    stages = {f'figure.{name}': figure_timings[name]}
+    if serialize and result is not None:
+        start = time.perf_counter()
+        result = plot_payload(result)
+        stages[f'serialize.{name}'] = time.perf_counter() - start
+    return result, stages
+
+
+def _collect(timed):
+    result, stages = timed
+    for stage, seconds in stages.items():
+        record_stage(stage, seconds)
+    return result
+
+
+def build_figures(jobs, serialize=False):
+    # jobs maps a figure name to (function, *args); returns {name: result}
+    # in the same order. An exception in any job is raised here.
+    if FIGURE_WORKERS <= 1 or len(jobs) <= 1:
+        return {name: _collect(_timed(name, fn, args, serialize)) for name, (fn, *args) in jobs.items()}
+    executor = _get_executor()
+    futures = {
+        name: executor.submit(_timed, name, fn, args, serialize)
+        for name, (fn, *args) in jobs.items()
+    }
+    return {name: _collect(future.result()) for name, future in futures.items()}
@@ -0,0 +1,332 @@
+import struct
+import numpy as np
+
+# Minimal columnar decoder for the `record` messages of a FIT file.
+#
+# fitparse builds a Python object per field per message, which dominates load
+# time on long rides. Record messages are fixed size for a given definition, so
+# here we only walk the message headers in Python (to find where each record
+# starts) and then decode each field of every record with vectorized NumPy
+# gathers into preallocated arrays.
+#
+# Only the requested fields are gathered (a column projection), and with a
+# time window the timestamps are decoded first so the other fields are only
+# gathered for the records inside it. decode_fit_summary reads just the
+# session and lap messages (device totals), skipping the records entirely.
+#
+# Reference: FIT protocol, "Definition message" and "Data message" layouts.
+
+FIT_EPOCH_S = 631065600  # 1989-12-31T00:00:00Z in unix seconds
+SESSION_MESG_NUM = 18
+LAP_MESG_NUM = 19
+RECORD_MESG_NUM = 20
+
+# FIT base type number (low 5 bits of the base type byte) -> (numpy type, invalid value)
+BASE_TYPES = {
+    0x00: ('u1', 0xFF),                # enum
+    0x01: ('i1', 0x7F),                # sint8
+    0x02: ('u1', 0xFF),                # uint8
+    0x03: ('i2', 0x7FFF),              # sint16
+    0x04: ('u2', 0xFFFF),              # uint16
+    0x05: ('i4', 0x7FFFFFFF),          # sint32
+    0x06: ('u4', 0xFFFFFFFF),          # uint32
+    0x08: ('f4', None),                # float32 (invalid is all bits set -> NaN)
+    0x09: ('f8', None),                # float64
+    0x0A: ('u1', 0x00),                # uint8z
+    0x0B: ('u2', 0x0000),              # uint16z
+    0x0C: ('u4', 0x00000000),          # uint32z
+    0x0D: ('u1', 0xFF),                # byte
+    0x0E: ('i8', 0x7FFFFFFFFFFFFFFF),  # sint64
+    0x0F: ('u8', 0xFFFFFFFFFFFFFFFF),  # uint64
+    0x10: ('u8', 0x0000000000000000),  # uint64z
+}
+
+# Record message fields we decode: field number -> (name, scale, offset)
+# value = raw / scale - offset
+RECORD_FIELDS = {
+    253: ('timestamp', 1, 0),
+    0: ('position_lat', 1, 0),
+    1: ('position_long', 1, 0),
+    2: ('altitude', 5, 500),
+    3: ('heart_rate', 1, 0),
+    4: ('cadence', 1, 0),
+    5: ('distance', 100, 0),
+    6: ('speed', 1000, 0),
+    7: ('power', 1, 0),
+    9: ('grade', 100, 0),
+    13: ('temperature', 1, 0),
+    31: ('gps_accuracy', 1, 0),
+    73: ('enhanced_speed', 1000, 0),
+    78: ('enhanced_altitude', 5, 500),
+}
+
+# Session and lap message fields used for ride totals
+SESSION_FIELDS = {
+    253: ('timestamp', 1, 0),
+    2: ('start_time', 1, 0),
+    7: ('total_elapsed_time', 1000, 0),
+    8: ('total_timer_time', 1000, 0),
+    9: ('total_distance', 100, 0),
+    14: ('avg_speed', 1000, 0),
+    16: ('avg_heart_rate', 1, 0),
+    18: ('avg_cadence', 1, 0),
+    20: ('avg_power', 1, 0),
+    21: ('max_power', 1, 0),
+    22: ('total_ascent', 1, 0),
+    23: ('total_descent', 1, 0),
+    29: ('nec_lat', 1, 0),
+    30: ('nec_long', 1, 0),
+    31: ('swc_lat', 1, 0),
+    32: ('swc_long', 1, 0),
+    34: ('normalized_power', 1, 0),
+    124: ('enhanced_avg_speed', 1000, 0),
+}
+LAP_FIELDS = {
+    253: ('timestamp', 1, 0),
+    2: ('start_time', 1, 0),
+    7: ('total_elapsed_time', 1000, 0),
+    8: ('total_timer_time', 1000, 0),
+    9: ('total_distance', 100, 0),
+    13: ('avg_speed', 1000, 0),
+    15: ('avg_heart_rate', 1, 0),
+    17: ('avg_cadence', 1, 0),
+    19: ('avg_power', 1, 0),
+    20: ('max_power', 1, 0),
+    21: ('total_ascent', 1, 0),
+    22: ('total_descent', 1, 0),
+    33: ('normalized_power', 1, 0),
+    110: ('enhanced_avg_speed', 1000, 0),
+}
+
+TIMESTAMP_FIELDS = ('timestamp', 'start_time')
+SEMICIRCLE_FIELDS = ('position_lat', 'position_long', 'nec_lat', 'nec_long', 'swc_lat', 'swc_long')
+
+# Fields that fitparse expands into their enhanced counterpart (FIT components)
+COMPONENT_EXPANSIONS = {
+    'speed': 'enhanced_speed',
+    'altitude': 'enhanced_altitude',
+}
+
+
+class UnsupportedFitFile(Exception):
+    # Raised for FIT features this decoder does not handle (callers fall back to fitparse)
+    pass
+
+
+def _scan_messages(buf, message_nums=(RECORD_MESG_NUM,)):
+    # Walk the message headers of every (possibly chained) FIT file in buf.
+    # Returns {global message number: [(definition, offsets, positions)]} for
+    # the definitions of the wanted messages, where positions give message
+    # order, and {global message number: message count}.
+    message_defs = {num: [] for num in message_nums}
+    counts = dict.fromkeys(message_nums, 0)
+    pos = 0
+    end_of_buf = len(buf)
+    while pos < end_of_buf:
+        if end_of_buf - pos < 12:
+            break
+        header_size = buf[pos]
+        data_size = struct.unpack_from('<I', buf, pos + 4)[0]
+        if buf[pos + 8:pos + 12] != b'.FIT':
+            raise UnsupportedFitFile("Missing .FIT signature")
+        pos += header_size
+        end = min(pos + data_size, end_of_buf)
+
+        # local message type -> (message size, global number, wanted entry or None)
+        local_defs = {}
+        while pos < end:
+            header = buf[pos]
+            pos += 1
+            if header & 0x80:
+                raise UnsupportedFitFile("Compressed timestamp headers are not supported")
+            local_type = header & 0x0F
+            if header & 0x40:
+                # Definition message
+                arch = buf[pos + 1]
+                endian = '>' if arch == 1 else '<'
+                global_num = struct.unpack_from(endian + 'H', buf, pos + 2)[0]
+                num_fields = buf[pos + 4]
+                pos += 5
+                fields = []
+                offset = 0
+                for _ in range(num_fields):
+                    field_num, size, base_type = buf[pos], buf[pos + 1], buf[pos + 2]
+                    fields.append((field_num, offset, size, base_type & 0x1F))
+                    offset += size
+                    pos += 3
+                if header & 0x20:
+                    num_dev_fields = buf[pos]
+                    pos += 1
+                    for _ in range(num_dev_fields):
+                        offset += buf[pos + 1]
+                        pos += 3
+                if global_num in message_defs:
+                    message_defs[global_num].append(({
+                        'endian': endian,
+                        'size': offset,
+                        'fields': fields,
+                    }, [], []))
+                    local_defs[local_type] = (offset, global_num, message_defs[global_num][-1])
+                else:
+                    local_defs[local_type] = (offset, global_num, None)
+            else:
+                # Data message
+                if local_type not in local_defs:
+                    raise UnsupportedFitFile(f"Data message for undefined local type {local_type}")
+                size, global_num, message_def = local_defs[local_type]
+                if message_def is not None:
+                    message_def[1].append(pos)
+                    message_def[2].append(counts[global_num])
+                    counts[global_num] += 1
+                pos += size
+        # Skip file CRC
+        pos = end + 2
+    message_defs = {
+        num: [
+            (definition, np.asarray(offsets, dtype=np.int64), np.asarray(positions, dtype=np.int64))
+            for definition, offsets, positions in defs if offsets
+        ]
+        for num, defs in message_defs.items()
+    }
+    return message_defs, counts
+
+
+def _gather_fields(raw, message_defs, n, field_map, names):
+    # Decode the fields of field_map named in names into float64 columns of
+    # length n (raw values, NaN where missing). Returns (columns, present).
+    columns = {}
+    present = {}
+    for definition, offsets, positions in message_defs:
+        for field_num, offset, field_size, base_type in definition['fields']:
+            if field_num not in field_map or base_type not in BASE_TYPES:
+                continue
+            name = field_map[field_num][0]
+            if name not in names:
+                continue
+            np_type, invalid = BASE_TYPES[base_type]
+            dtype = np.dtype(definition['endian'] + np_type)
+            if field_size != dtype.itemsize:
+                # Array fields are not used by the app
+                continue
+            # (messages, field bytes) gathered in one step
+            field_bytes = raw[offsets[:, None] + (offset + np.arange(field_size, dtype=np.int64))]
+            values = field_bytes.view(dtype).ravel()
+            if invalid is None:
+                valid = np.isfinite(values)
+            else:
+                valid = values != invalid
+            if name not in columns:
+                columns[name] = np.full(n, np.nan, dtype=np.float64)
+                present[name] = np.zeros(n, dtype=bool)
+            columns[name][positions[valid]] = values[valid]
+            present[name][positions[valid]] = True
+    return columns, present
+
+
+def _to_datetime(column, present):
+    # FIT timestamps (s since FIT epoch) to datetime64[ns] (naive UTC, like fitparse)
+    timestamps = np.full(len(column), np.datetime64('NaT'), dtype='datetime64[s]')
+    timestamps[present] = (column[present].astype(np.int64) + FIT_EPOCH_S).astype('datetime64[s]')
+    return timestamps.astype('datetime64[ns]')
+
+
+def _finish_columns(columns, present, field_map, integer_columns=True):
+    # Physical units: scale/offset, semicircles to degrees, timestamps.
+    # Integer channels without any invalid sample become int64 if
+    # integer_columns, everything else stays float64 with NaN.
+    scales = {name: (scale, offset) for name, scale, offset in field_map.values()}
+    result = {}
+    for name, column in columns.items():
+        if name in TIMESTAMP_FIELDS:
+            result[name] = _to_datetime(column, present[name])
+            continue
+        scale, offset = scales[name]
+        if scale != 1:
+            column /= scale
+        if offset:
+            column -= offset
+        if name in SEMICIRCLE_FIELDS:
+            column *= 180 / 2**31
+        elif integer_columns and present[name].all() and (scale, offset) == (1, 0):
+            column = column.astype(np.int64)
+        result[name] = column
+    return result
+
+
+def _select_window(raw, record_defs, n_records, time_window):
+    # Restrict record_defs to the records whose timestamp lies in
+    # time_window = (start, end) (inclusive, either may be None). Returns the
+    # filtered defs and the new record count.
+    columns, present = _gather_fields(raw, record_defs, n_records, RECORD_FIELDS, {'timestamp'})
+    if 'timestamp' not in columns:
+        return [], 0
+    seconds = columns['timestamp']
+    keep = present['timestamp'].copy()
+    start, end = time_window
+    if start is not None:
+        keep &= seconds >= _fit_seconds(start)
+    if end is not None:
+        keep &= seconds <= _fit_seconds(end)
+    new_positions = np.cumsum(keep) - 1
+    selected = []
+    for definition, offsets, positions in record_defs:
+        mask = keep[positions]
+        if mask.any():
+            selected.append((definition, offsets[mask], new_positions[positions[mask]]))
+    return selected, int(keep.sum())
+
+
+def _fit_seconds(value):
+    # datetime-like (naive UTC) -> seconds since the FIT epoch
+    unix_seconds = np.datetime64(value, 's').astype(np.int64)
+    return unix_seconds - FIT_EPOCH_S
+
+
+def decode_fit_records(path, columns=None, time_window=None):
+    # Decode record messages into {name: np.ndarray} with physical units.
+    # columns limits decoding to those fields (default: all of RECORD_FIELDS)
+    # and time_window = (start, end) to the records with a timestamp in that
+    # inclusive range (datetime-likes in naive UTC, either may be None).
+    # Integer channels without any invalid sample are returned as int64,
+    # everything else as float64 with NaN for missing/invalid samples.
+    # Timestamps are returned as datetime64[ns] (naive UTC, matching fitparse).
+    with open(path, 'rb') as f:
+        buf = f.read()
+    message_defs, counts = _scan_messages(buf)
+    record_defs, n_records = message_defs[RECORD_MESG_NUM], counts[RECORD_MESG_NUM]
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    if time_window is not None:
+        record_defs, n_records = _select_window(raw, record_defs, n_records, time_window)
+
+    requested = {name for name, _, _ in RECORD_FIELDS.values()} if columns is None else set(columns)
+    # Enhanced fields may have to be expanded from their source field
+    wanted = requested | {name for name, enhanced in COMPONENT_EXPANSIONS.items() if enhanced in requested}
+    decoded, present = _gather_fields(raw, record_defs, n_records, RECORD_FIELDS, wanted)
+
+    # Mirror fitparse component expansion (speed -> enhanced_speed, ...)
+    for name, enhanced in COMPONENT_EXPANSIONS.items():
+        if enhanced in requested and name in decoded and enhanced not in decoded:
+            decoded[enhanced] = decoded[name].copy()
+            present[enhanced] = present[name].copy()
+    decoded = {name: column for name, column in decoded.items() if name in requested}
+    return _finish_columns(decoded, present, RECORD_FIELDS), n_records
+
+
+def decode_fit_summary(path):
+    # Device totals from the session and lap messages, without decoding any
+    # record: {'session': [{field: value}], 'lap': [{field: value}]}, one dict
+    # per message (missing fields are left out).
+    with open(path, 'rb') as f:
+        buf = f.read()
+    message_defs, counts = _scan_messages(buf, (SESSION_MESG_NUM, LAP_MESG_NUM))
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    summary = {}
+    for key, num, field_map in (('session', SESSION_MESG_NUM, SESSION_FIELDS), ('lap', LAP_MESG_NUM, LAP_FIELDS)):
+        names = {name for name, _, _ in field_map.values()}
+        columns, present = _gather_fields(raw, message_defs[num], counts[num], field_map, names)
+        columns = _finish_columns(columns, present, field_map, integer_columns=False)
+        summary[key] = [
+            {name: columns[name][i] for name in columns if present[name][i]}
+            for i in range(counts[num])
+        ]
+    return summary
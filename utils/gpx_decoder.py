@@ -0,0 +1,140 @@
+from array import array
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# Streaming decoder for GPX track points.
+#
+# The file is read with ElementTree.iterparse and each <trkpt> is cleared (and
+# detached from its <trkseg>) as soon as it has been read, so the XML tree never
+# grows beyond a single point. Values go straight into typed arrays, which are
+# the only thing that grows with the file.
+
+EARTH_RADIUS_M = 6371008.8
+# Time strings are converted to datetime64 in batches of this many points
+TIME_BATCH = 8192
+
+# Local tag name -> output channel. Garmin TrackPointExtension puts hr/cad/atemp
+# under gpxtpx:, while Strava exports write <power> directly under <extensions>.
+EXTENSION_TAGS = {
+    'hr': 'heart_rate',
+    'cad': 'cadence',
+    'power': 'power',
+    'watts': 'power',
+    'atemp': 'temperature',
+}
+INTEGER_CHANNELS = ('heart_rate', 'cadence', 'power', 'temperature')
+
+
+def _local_name(tag):
+    return tag.rpartition('}')[2]
+
+
+def _parse_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _flush_times(time_text, times):
+    # Vectorized ISO-8601 parsing for a batch of <time> strings
+    if not time_text:
+        return
+    parsed = np.array(
+        [t.strip().rstrip('Z') if t else 'NaT' for t in time_text],
+        dtype='datetime64[ms]',
+    )
+    times.extend(parsed.astype(np.int64))
+    time_text.clear()
+
+
+def haversine_distance(lat, lon):
+    # Distance in meters between consecutive points, 0 for the first point
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    dlat = np.diff(lat_rad)
+    dlon = np.diff(lon_rad)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_rad[:-1]) * np.cos(lat_rad[1:]) * np.sin(dlon / 2) ** 2
+    step = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return np.concatenate([[0.0], np.nan_to_num(step)])
+
+
+def decode_gpx_points(path):
+    # Decode all track points into {name: np.ndarray}, using the same channel
+    # names and units as utils/fit_decoder.decode_fit_records.
+    lat = array('d')
+    lon = array('d')
+    ele = array('d')
+    times = array('q')  # milliseconds since unix epoch
+    channels = {name: array('d') for name in set(EXTENSION_TAGS.values())}
+
+    time_text = []
+    point = {}
+    segment = None
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        name = _local_name(elem.tag)
+        if event == 'start':
+            if name == 'trkseg':
+                segment = elem
+            elif name == 'trkpt':
+                point = {}
+            continue
+
+        if name == 'trkpt':
+            lat.append(_parse_float(elem.get('lat')))
+            lon.append(_parse_float(elem.get('lon')))
+            ele.append(point.get('ele', np.nan))
+            time_text.append(point.get('time'))
+            for channel, values in channels.items():
+                values.append(point.get(channel, np.nan))
+            if len(time_text) >= TIME_BATCH:
+                _flush_times(time_text, times)
+            elem.clear()
+            if segment is not None:
+                del segment[:]
+        elif name == 'ele':
+            point['ele'] = _parse_float(elem.text)
+        elif name == 'time':
+            point['time'] = elem.text
+        elif name in EXTENSION_TAGS:
+            point[EXTENSION_TAGS[name]] = _parse_float(elem.text)
+        elif name == 'trkseg':
+            segment = None
+    _flush_times(time_text, times)
+
+    n_points = len(lat)
+    position_lat = np.array(lat, dtype=np.float64)
+    position_long = np.array(lon, dtype=np.float64)
+    timestamp = np.array(times, dtype=np.int64).astype('datetime64[ms]').astype('datetime64[ns]')
+    altitude = np.array(ele, dtype=np.float64)
+
+    # Derived channels: distance from GPS track, speed from distance / time
+    step = haversine_distance(position_lat, position_long)
+    distance = np.cumsum(step)
+    seconds = np.where(np.isnat(timestamp), np.nan, timestamp.astype(np.int64) / 1e9)
+    dt = np.diff(seconds, prepend=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(dt > 0, step / dt, np.nan)
+    if n_points > 1:
+        speed[0] = speed[1]
+
+    result = {
+        'timestamp': timestamp,
+        'position_lat': position_lat,
+        'position_long': position_long,
+        'altitude': altitude,
+        'distance': distance,
+        'speed': speed,
+    }
+    for channel, values in channels.items():
+        values = np.array(values, dtype=np.float64)
+        if np.isnan(values).all():
+            continue
+        if channel in INTEGER_CHANNELS and not np.isnan(values).any():
+            values = values.astype(np.int64)
+        result[channel] = values
+    # Mirror the FIT loader, where altitude/speed are expanded to enhanced_*
+    result['enhanced_altitude'] = altitude.copy()
+    result['enhanced_speed'] = speed.copy()
+    return result, n_points
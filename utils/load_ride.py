@@ -1,24 +1,98 @@
 import os
-import fitparse
 import pandas as pd
 
+from utils.fit_decoder import decode_fit_records, decode_fit_summary, UnsupportedFitFile
+from utils.gpx_decoder import decode_gpx_points
+from utils.ride_cache import ride_cache, file_content_hash
+from utils.ride_dtypes import compact_ride, memory_report
+from utils.resample import MASK_COLUMNS, resample_ride, resampled_at
+
 BASE_FOLDER = 'rides'
 
-def load_fit_file(filename):
+RECORD_TYPES = {
+    'timestamp',
+    'position_lat', 'position_long', 'altitude',
+    'power', 'heart_rate', 'cadence',
+    'speed', 'distance', 'temperature',
+    'gps_accuracy', 'grade',
+    'enhanced_altitude', 'enhanced_speed',
+}
+
+def select_samples(df, columns=None, time_window=None):
+    # Restrict a decoded ride to columns (missing ones are filled with NA)
+    # and to the samples with a timestamp in time_window = (start, end),
+    # inclusive, either end may be None
+    if time_window is not None:
+        timestamps = pd.to_datetime(df['timestamp']) if 'timestamp' in df else pd.Series(pd.NaT, index=df.index)
+        keep = timestamps.notnull()
+        start, end = time_window
+        if start is not None:
+            keep &= timestamps >= pd.Timestamp(start)
+        if end is not None:
+            keep &= timestamps <= pd.Timestamp(end)
+        df = df[keep.to_numpy()].reset_index(drop=True)
+    if columns is not None:
+        for col in columns:
+            if col not in df.columns:
+                df[col] = None
+        df = df[list(columns)]
+    return df
+
+def load_fit_file(filename, decoder='columnar', columns=None, time_window=None):
+    # decoder='columnar' decodes record messages straight into NumPy arrays
+    # (see utils/fit_decoder.py). decoder='fitparse' is the original per-sample
+    # path, also used as a fallback for files the columnar decoder can't handle.
+    # columns and time_window select what is decoded (see select_samples).
     path = os.path.join(BASE_FOLDER, filename)
     if not os.path.exists(path):
         raise FileNotFoundError(f"File {filename} not found in {BASE_FOLDER}")
+    if decoder == 'columnar':
+        try:
+            return load_fit_file_columnar(path, filename, columns, time_window)
+        except UnsupportedFitFile as e:
+            print(f"Columnar decoder unavailable for {filename} ({e}), using fitparse")
+    elif decoder != 'fitparse':
+        raise ValueError(f"Unknown FIT decoder: {decoder}")
+    df = load_fit_file_fitparse(path, filename)
+    if columns is None and time_window is None:
+        return df
+    return select_samples(df, columns, time_window)
+
+def load_fit_file_columnar(path, filename, columns=None, time_window=None):
+    # Only the requested fields (and, with a time window, records) are decoded
+    fields = RECORD_TYPES if columns is None else RECORD_TYPES.intersection(columns)
+    decoded, n_records = decode_fit_records(path, fields, time_window)
+    df = pd.DataFrame(decoded, index=pd.RangeIndex(n_records))
+
+    # Fill columns with NA if they are not present in the data
+    for col in RECORD_TYPES if columns is None else columns:
+        if col not in df.columns:
+            df[col] = None
+
+    print(f"Fields found in {filename}: {', '.join(decoded)}")
+    print(f"Total records: {len(df)}")
+    return df
+
+def load_fit_summary(filename):
+    # Session and lap totals recorded by the device, without decoding the
+    # records (see decode_fit_summary). Empty lists if the file has none.
+    path = os.path.join(BASE_FOLDER, filename)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File {filename} not found in {BASE_FOLDER}")
+    try:
+        return decode_fit_summary(path)
+    except UnsupportedFitFile as e:
+        print(f"Summary unavailable for {filename} ({e})")
+        return {'session': [], 'lap': []}
+
+def load_fit_file_fitparse(path, filename):
+    # Imported here: only needed for files the columnar decoder can't read
+    import fitparse
+
     fitfile = fitparse.FitFile(path)
 
     data = []
-    record_types = {
-        'timestamp',
-        'position_lat', 'position_long', 'altitude',
-        'power', 'heart_rate', 'cadence',
-        'speed', 'distance', 'temperature',
-        'gps_accuracy', 'grade',
-        'enhanced_altitude', 'enhanced_speed',
-    }
+    record_types = RECORD_TYPES
 
     types_found = set()
     for record in fitfile.get_messages("record"):
@@ -71,21 +145,72 @@ def load_fit_file(filename):
     return df
 
 def load_gpx_file(filename):
-    raise NotImplementedError("GPX file loading is not implemented yet.")
+    # Track points are streamed into NumPy arrays (see utils/gpx_decoder.py).
+    # Speed and distance are derived from the GPS track.
     path = os.path.join(BASE_FOLDER, filename)
     if not os.path.exists(path):
         raise FileNotFoundError(f"File {filename} not found in {BASE_FOLDER}")
-    return None
+    columns, n_points = decode_gpx_points(path)
+    df = pd.DataFrame(
+        {col: columns[col] for col in columns if col in RECORD_TYPES},
+        index=pd.RangeIndex(n_points),
+    )
+
+    # Fill columns with NA if they are not present in the data
+    for col in RECORD_TYPES:
+        if col not in df.columns:
+            df[col] = None
+
+    print(f"Fields found in {filename}: {', '.join(columns)}")
+    print(f"Total records: {len(df)}")
+    return df
 
-def load_file(filename):
+def load_file(filename, use_cache=True, columns=None, time_window=None):
+    # columns and time_window load part of the ride (see select_samples).
+    # A partial load reads just those columns from the cache, or decodes just
+    # that part of the file on a cache miss (without caching it).
+    # Rides come back with the compact column types of utils/ride_dtypes.py,
+    # resampled to a uniform time base with gap/pause masks (utils/resample.py).
     print(f"Loading file: {filename}")
     ext = os.path.splitext(filename)[1].lower()
+    partial = columns is not None or time_window is not None
+    # Resampling needs the timestamps, and fills the masks itself
+    decoded_columns = None if columns is None else [
+        'timestamp', *(col for col in columns if col not in ('timestamp', *MASK_COLUMNS))
+    ]
     if ext == '.fit':
-        return load_fit_file(filename)
+        def loader():
+            df = resample_ride(load_fit_file(filename, columns=decoded_columns, time_window=time_window))
+            return select_samples(df, columns) if columns is not None else df
     elif ext == '.gpx':
-        return load_gpx_file(filename)
+        def loader():
+            df = resample_ride(load_gpx_file(filename))
+            return select_samples(df, columns, time_window) if partial else df
     else:
         raise ValueError(f"Unsupported file type: {ext}")
+    path = os.path.join(BASE_FOLDER, filename)
+    if not use_cache:
+        df = loader()
+        ride_id = file_content_hash(path)
+    else:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File {filename} not found in {BASE_FOLDER}")
+        # Decoded rides are cached on disk, keyed by file content (utils/ride_cache.py)
+        if partial:
+            cached_columns = None if columns is None else {*columns, 'timestamp'}
+            df = ride_cache.get(path, cached_columns)
+            if df is None or not resampled_at(df):
+                df = loader()
+            else:
+                df = compact_ride(select_samples(df, columns, time_window))
+        else:
+            df = ride_cache.get_or_load(path, loader, valid=resampled_at)
+        ride_id = ride_cache.fingerprint(path)
+    print(f"Memory: {memory_report(df)['total'][1] / 1024:,.0f} KiB")
+    # Identifies the ride's content for result caches (ex: utils/power_cache.py)
+    df.attrs['ride_id'] = ride_id
+    df.attrs['filename'] = filename
+    return df
 
 def get_ride_files(filetype_filter="Both"):
     if not os.path.exists(BASE_FOLDER):
@@ -96,10 +221,9 @@ def get_ride_files(filetype_filter="Both"):
         exts = ('.fit',)
     else:
         exts = ('.gpx',)
-    files = [
-        f for f in os.listdir(BASE_FOLDER)
-        if os.path.isfile(os.path.join(BASE_FOLDER, f)) and f.endswith(exts)
-    ]
+    # scandir reports the entry type without a stat() per file
+    with os.scandir(BASE_FOLDER) as entries:
+        files = [entry.name for entry in entries if entry.name.endswith(exts) and entry.is_file()]
     # Map filename to full path
     file_map = {f: os.path.join(BASE_FOLDER, f) for f in files}
     return files, file_map
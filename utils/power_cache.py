@@ -0,0 +1,157 @@
+import os
+import threading
+from collections import OrderedDict
+
+from utils.calculate_power import (
+    AIR_DENSITY,
+    DRAG_COEFFICIENT,
+    FRONTAL_AREA,
+    MODEL_VERSION,
+    POWER_COMPONENTS,
+    SMOOTHING_WINDOW,
+    column_as_float,
+    compute_power_arrays,
+    ride_seconds,
+)
+from utils.smoothing import (
+    DEFAULT_DERIVATIVE,
+    DEFAULT_SMOOTHING,
+    DEFAULT_SMOOTHING_WINDOW,
+)
+from utils.timing import span
+
+# In-memory LRU cache of power model results.
+#
+# Entries hold the (4, n) component array from compute_power_arrays, keyed by
+# (ride id, model parameters, MODEL_VERSION). The ride id is the content hash
+# load_file stores in df.attrs['ride_id']; frames without one aren't cached.
+# Cached arrays are read-only so a caller can't corrupt another session's hit.
+# The smoothing kernels of recently used rides (prefix sums of altitude, speed
+# and time, see utils/smoothing.py) are entries of the same LRU, so trying
+# another smoothing method or window on a ride skips most of the work. Both
+# kinds of entries count towards POWER_CACHE_MAX_MB; kernels take about 40
+# bytes per sample per series, several times the size of the result.
+
+POWER_CACHE_MAX_BYTES = int(float(os.environ.get('POWER_CACHE_MAX_MB', 256)) * 1024**2)
+
+
+def power_cache_key(ride_id, rider_weight, bike_weight, rolling_resistance_coefficient,
+                    air_density, drag_area, drivetrain_efficiency, window=SMOOTHING_WINDOW,
+                    smoothing=DEFAULT_SMOOTHING, smoothing_window=DEFAULT_SMOOTHING_WINDOW,
+                    derivative=DEFAULT_DERIVATIVE):
+    params = tuple(
+        round(float(p), 9) for p in (
+            rider_weight, bike_weight, rolling_resistance_coefficient,
+            air_density, drag_area, drivetrain_efficiency,
+        )
+    )
+    method = (int(window), smoothing, int(smoothing_window), derivative)
+    return (ride_id, params, method, MODEL_VERSION)
+
+
+def kernels_nbytes(kernels):
+    return sum(k.nbytes for k in kernels.values())
+
+
+class PowerResultCache:
+    def __init__(self, max_bytes=POWER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> components, or kernels dict
+        self._sizes = {}               # key -> bytes counted for the entry
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(
+        self, df, rider_weight, bike_weight, rolling_resistance_coefficient,
+        air_density=AIR_DENSITY, drag_area=FRONTAL_AREA * DRAG_COEFFICIENT,
+        drivetrain_efficiency=1.0, window=SMOOTHING_WINDOW,
+        smoothing=DEFAULT_SMOOTHING, smoothing_window=DEFAULT_SMOOTHING_WINDOW,
+        derivative=DEFAULT_DERIVATIVE,
+    ):
+        ride_id = df.attrs.get('ride_id')
+        key = power_cache_key(
+            ride_id, rider_weight, bike_weight, rolling_resistance_coefficient,
+            air_density, drag_area, drivetrain_efficiency,
+            window, smoothing, smoothing_window, derivative,
+        )
+        if ride_id is not None:
+            with self._lock:
+                components = self._entries.get(key)
+                if components is not None and components.shape[1] == len(df):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return components
+                self.misses += 1
+
+        kernels = self.kernels(ride_id, len(df))
+        with span('calculate_power'):
+            components = compute_power_arrays(
+                ride_seconds(df),
+                column_as_float(df, 'altitude'),
+                column_as_float(df, 'speed'),
+                rider_weight + bike_weight,
+                rolling_resistance_coefficient,
+                air_density=air_density,
+                drag_area=drag_area,
+                drivetrain_efficiency=drivetrain_efficiency,
+                window=window,
+                smoothing=smoothing,
+                smoothing_window=smoothing_window,
+                derivative=derivative,
+                kernels=kernels,
+            )
+        components.setflags(write=False)
+        if ride_id is not None:
+            with self._lock:
+                # Kernels grow as methods use them: count their current size
+                if kernels:
+                    self._put(('kernels', ride_id), kernels, kernels_nbytes(kernels))
+                self._put(key, components, components.nbytes)
+        return components
+
+    def kernels(self, ride_id, samples):
+        # Kernels dict of a ride for compute_power_arrays: the cached one if
+        # it matches the ride's length, else a fresh one (cached by
+        # get_or_compute once filled)
+        if ride_id is None:
+            return None
+        with self._lock:
+            kernels = self._entries.get(('kernels', ride_id))
+            if kernels is not None and all(k.n == samples for k in kernels.values()):
+                self._entries.move_to_end(('kernels', ride_id))
+                return kernels
+        return {}
+
+    def _put(self, key, value, nbytes):
+        # Insert or resize an entry, then evict least recently used entries
+        # down to max_bytes. Call with the lock held.
+        self._entries.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._sizes[key] = nbytes
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes:
+            evicted, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+
+def with_power_components(df, components):
+    # Shallow copy of df with the power columns set; the ride's own columns
+    # are shared, not copied
+    df = df.copy(deep=False)
+    for name, values in zip(POWER_COMPONENTS, components):
+        df[name] = values
+    return df
+
+
+power_cache = PowerResultCache()
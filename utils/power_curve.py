@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.load_ride import get_ride_files, load_file
+from utils.ride_cache import CACHE_DIR, ride_cache
+
+# Mean-maximal power / heart rate curves and an all-time best efforts index.
+#
+# A ride is first laid on a 1 Hz grid of elapsed seconds (rides resampled
+# at 1 Hz by utils/resample.py already are, and are used as is). Missing seconds
+# count as 0 W for power (stopped or coasting) and hold the last reading for
+# heart rate. The best average over every window of d seconds is then one
+# prefix-sum difference and argmax per duration, evaluated on CURVE_DURATIONS:
+# every second up to 10 minutes, then 2% steps (plus the full ride length).
+#
+# BestEffortsIndex keeps each ride's curve (on CURVE_DURATIONS) in a JSON file
+# next to the ride cache, keyed by content hash. Updating it decodes only the
+# rides it hasn't seen; the all-time curve is a running maximum over the
+# stored curves, so no ride is ever rescanned.
+
+CURVE_CHANNELS = {
+    'power': 'zero',
+    'heart_rate': 'hold',
+}
+# Rides longer than this (ex: a file left recording for days) are truncated
+CURVE_MAX_SECONDS = 48 * 3600
+
+
+def _curve_durations(max_seconds=CURVE_MAX_SECONDS, dense_until=600, step=1.02):
+    geometric = dense_until * step ** np.arange(int(np.log(max_seconds / dense_until) / np.log(step)) + 2)
+    durations = np.concatenate([np.arange(1, dense_until + 1), np.round(geometric)])
+    return np.unique(durations[durations <= max_seconds]).astype(np.int64)
+
+
+CURVE_DURATIONS = _curve_durations()
+# Bump when the curve definition changes to rebuild stored indexes
+CURVE_VERSION = 2
+BEST_EFFORTS_FILE = 'best_efforts.json'
+
+
+def one_hz_series(df, channel, fill):
+    # channel resampled to one value per elapsed second. fill='zero' sets
+    # missing seconds to 0, fill='hold' repeats the previous reading (NaN
+    # before the first one).
+    if channel not in df or 'timestamp' not in df or df.empty:
+        return np.array([])
+    if df.attrs.get('sample_rate') == 1:
+        grid = df[channel].to_numpy(dtype=np.float64, na_value=np.nan)[:CURVE_MAX_SECONDS]
+        return _fill(grid, fill)
+    timestamps = df['timestamp']
+    valid_time = timestamps.notnull().to_numpy()
+    seconds = timestamps.to_numpy(dtype='datetime64[ns]')[valid_time].astype(np.int64) / 1e9
+    values = df[channel].to_numpy(dtype=np.float64, na_value=np.nan)[valid_time]
+    if len(seconds) == 0:
+        return np.array([])
+    offsets = np.round(seconds - seconds[0]).astype(np.int64)
+    keep = (offsets >= 0) & (offsets < CURVE_MAX_SECONDS)
+    offsets, values = offsets[keep], values[keep]
+    grid = np.full(offsets.max() + 1, np.nan)
+    grid[offsets] = values
+    return _fill(grid, fill)
+
+
+def _fill(grid, fill):
+    if fill == 'zero':
+        return np.nan_to_num(grid, nan=0.0)
+    # Forward fill
+    positions = np.where(np.isfinite(grid), np.arange(len(grid)), 0)
+    np.maximum.accumulate(positions, out=positions)
+    return grid[positions]
+
+
+def mean_max(values, durations):
+    # Best average of values over any window of each duration (in samples);
+    # windows containing NaN don't count. Returns (best, start) arrays, with
+    # NaN / -1 where no window qualifies.
+    valid = np.isfinite(values)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    best = np.full(len(durations), np.nan)
+    start = np.full(len(durations), -1, dtype=np.int64)
+    all_valid = valid.all()
+    for i, d in enumerate(durations):
+        if d > len(values):
+            break
+        window = sums[d:] - sums[:-d]
+        if not all_valid:
+            window[(counts[d:] - counts[:-d]) < d] = -np.inf
+        j = int(window.argmax())
+        if np.isfinite(window[j]):
+            best[i] = window[j] / d
+            start[i] = j
+    return best, start
+
+
+def ride_curve_durations(length):
+    # CURVE_DURATIONS up to length, plus the full length itself
+    durations = CURVE_DURATIONS[CURVE_DURATIONS < length]
+    return np.append(durations, length) if length > 0 else durations
+
+
+def ride_curves(df, channels=CURVE_CHANNELS):
+    # {channel: (durations, best average)} over 1 s to the full ride length
+    curves = {}
+    for channel, fill in channels.items():
+        values = one_hz_series(df, channel, fill)
+        if len(values) == 0 or not np.isfinite(values).any():
+            continue
+        durations = ride_curve_durations(len(values))
+        curves[channel] = (durations, mean_max(values, durations)[0])
+    return curves
+
+
+class BestEffortsIndex:
+    def __init__(self, cache_dir=CACHE_DIR, channels=CURVE_CHANNELS):
+        self.path = os.path.join(cache_dir, BEST_EFFORTS_FILE)
+        self.channels = channels
+        self._lock = threading.Lock()
+        self._rides = None   # ride_id -> {'filename', 'curves': {channel: list}}
+        self._best = None    # channel -> (best, ride_id per duration)
+
+    # --- Persistence ---
+
+    def _load(self):
+        if self._rides is None:
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get('version') == CURVE_VERSION and data.get('durations') == CURVE_DURATIONS.tolist():
+                self._rides = data.get('rides', {})
+            else:
+                self._rides = {}
+            self._rebuild_best()
+        return self._rides
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': CURVE_VERSION,
+                'durations': CURVE_DURATIONS.tolist(),
+                'rides': self._rides,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    # --- All-time curve ---
+
+    def _ride_array(self, ride, channel):
+        values = ride['curves'].get(channel)
+        if values is None:
+            return np.full(len(CURVE_DURATIONS), np.nan)
+        return np.array(values, dtype=np.float64)
+
+    def _rebuild_best(self):
+        self._best = {}
+        for channel in self.channels:
+            best = np.full(len(CURVE_DURATIONS), np.nan)
+            owners = np.full(len(CURVE_DURATIONS), None, dtype=object)
+            self._best[channel] = (best, owners)
+            for ride_id, ride in self._rides.items():
+                self._merge(channel, ride_id, self._ride_array(ride, channel))
+
+    def _merge(self, channel, ride_id, values):
+        best, owners = self._best[channel]
+        better = values > np.nan_to_num(best, nan=-np.inf)
+        best[better] = values[better]
+        owners[better] = ride_id
+
+    # --- Updates ---
+
+    def add_ride(self, ride_id, filename, df):
+        # Store the curves of one ride and fold them into the all-time curve
+        curves = {}
+        for channel, fill in self.channels.items():
+            values = one_hz_series(df, channel, fill)
+            if len(values) == 0 or not np.isfinite(values).any():
+                continue
+            best, _ = mean_max(values, CURVE_DURATIONS)
+            curves[channel] = [None if np.isnan(v) else round(float(v), 2) for v in best]
+        with self._lock:
+            rides = self._load()
+            ride = {'filename': filename, 'curves': curves}
+            rides[ride_id] = ride
+            for channel in self.channels:
+                self._merge(channel, ride_id, self._ride_array(ride, channel))
+            self._save()
+
+    def update(self):
+        # Add rides in BASE_FOLDER that aren't indexed yet and forget deleted ones.
+        # Returns the number of rides added.
+        files, file_map = get_ride_files("Both")
+        seen = {}
+        for filename in files:
+            try:
+                seen[ride_cache.fingerprint(file_map[filename])] = filename
+            except OSError:
+                continue
+        with self._lock:
+            rides = self._load()
+            removed = [ride_id for ride_id in rides if ride_id not in seen]
+            for ride_id in removed:
+                del rides[ride_id]
+            for ride_id, filename in seen.items():
+                if ride_id in rides:
+                    rides[ride_id]['filename'] = filename
+            missing = {ride_id: filename for ride_id, filename in seen.items() if ride_id not in rides}
+            if removed:
+                self._rebuild_best()
+                self._save()
+        added = 0
+        for ride_id, filename in missing.items():
+            try:
+                df = load_file(filename)
+            except Exception as e:
+                print(f"Skipping {filename} in best efforts index: {e}")
+                continue
+            if df is not None and not df.empty:
+                self.add_ride(ride_id, filename, df)
+                added += 1
+        return added
+
+    # --- Queries ---
+
+    def best(self, channel):
+        # (durations, all-time best, filename holding each best) for channel
+        with self._lock:
+            rides = self._load()
+            best, owners = self._best[channel]
+            filenames = [rides[o]['filename'] if o is not None else None for o in owners]
+            return CURVE_DURATIONS.copy(), best.copy(), filenames
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+
+best_efforts = BestEffortsIndex()
@@ -0,0 +1,158 @@
+import numpy as np
+
+from utils.calculate_power import (
+    g,
+    AIR_DENSITY,
+    FRONTAL_AREA,
+    DRAG_COEFFICIENT,
+    SMOOTHING_WINDOW,
+    column_as_float,
+    ride_seconds,
+    rolling_mean,
+    time_steps,
+)
+from utils.smoothing import (
+    DEFAULT_DERIVATIVE,
+    DEFAULT_SMOOTHING,
+    DEFAULT_SMOOTHING_WINDOW,
+    model_rates,
+)
+
+# Batched evaluation of the power model over many parameter sets.
+#
+# Before clipping and smoothing, calculated power is linear in three
+# per-parameter-set coefficients:
+#
+#   raw = (m * A + (m * C_r) * B + (rho * CdA) * C) / efficiency
+#
+#   A = g * dh/dt + 0.5 * d(v^2)/dt      (gravitational + kinetic, per kg)
+#   B = g * v                            (rolling resistance, per kg per C_r)
+#   C = 0.5 * v^3                        (air resistance, per rho * CdA)
+#
+# So a sweep is one (P, 3) @ (3, n) matrix product followed by a clip and a
+# rolling mean, done in chunks of parameter sets to bound working memory.
+# Smoothing and derivative methods only change the basis (v is the smoothed
+# speed), so they cost one basis per method, not one per parameter set.
+
+SWEEP_PARAMETERS = (
+    'rider_weight',
+    'bike_weight',
+    'rolling_resistance_coefficient',
+    'air_density',
+    'drag_area',
+    'drivetrain_efficiency',
+)
+# Working memory per chunk: the raw block plus the rolling-mean temporaries
+DEFAULT_CHUNK_BYTES = 64 * 1024**2
+BLOCK_COPIES = 6
+
+
+def power_basis(
+    seconds, altitude, speed,
+    smoothing=DEFAULT_SMOOTHING, smoothing_window=DEFAULT_SMOOTHING_WINDOW,
+    derivative=DEFAULT_DERIVATIVE, kernels=None,
+):
+    # (3, n) array of the A, B, C terms above
+    n = len(altitude)
+    basis = np.empty((3, n))
+    if n == 0:
+        return basis
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if smoothing == 'none' and derivative == 'first_order':
+            steps = time_steps(seconds, n)
+            delta_altitude = np.diff(altitude, prepend=np.nan)
+            delta_speed_squared = np.diff(speed * speed, prepend=np.nan)
+            # Missing samples contribute no change in energy
+            delta_altitude[np.isnan(delta_altitude)] = 0
+            delta_speed_squared[np.isnan(delta_speed_squared)] = 0
+            basis[0] = (g * delta_altitude + 0.5 * delta_speed_squared) / steps
+            basis[0, 0] = 0
+        else:
+            speed, climb, speed_squared_change = model_rates(
+                seconds, altitude, speed, smoothing, smoothing_window, derivative, kernels,
+            )
+            basis[0] = g * climb + 0.5 * speed_squared_change
+        basis[1] = g * speed
+        basis[2] = 0.5 * speed ** 3
+    return basis
+
+
+def ride_power_basis(df, **smoothing):
+    # smoothing: smoothing, smoothing_window, derivative and kernels, as for
+    # power_basis
+    return power_basis(
+        ride_seconds(df),
+        column_as_float(df, 'altitude'),
+        column_as_float(df, 'speed'),
+        **smoothing,
+    )
+
+
+def parameter_grid(**axes):
+    # Cartesian product of parameter values, as flat arrays of equal length.
+    # ex: parameter_grid(rider_weight=[65, 70, 75], drag_area=np.linspace(0.2, 0.4, 21))
+    unknown = set(axes) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {', '.join(sorted(unknown))}")
+    names = list(axes)
+    grids = np.meshgrid(*(np.atleast_1d(np.asarray(axes[name], dtype=np.float64)) for name in names),
+                        indexing='ij')
+    return {name: grid.ravel() for name, grid in zip(names, grids)}
+
+
+def sweep_coefficients(
+    rider_weight, bike_weight, rolling_resistance_coefficient,
+    air_density=AIR_DENSITY, drag_area=FRONTAL_AREA * DRAG_COEFFICIENT,
+    drivetrain_efficiency=1.0,
+):
+    # (P, 3) coefficients for the basis; scalars broadcast against arrays
+    params = np.broadcast_arrays(*(
+        np.atleast_1d(np.asarray(value, dtype=np.float64))
+        for value in (
+            rider_weight, bike_weight, rolling_resistance_coefficient,
+            air_density, drag_area, drivetrain_efficiency,
+        )
+    ))
+    (rider_weight, bike_weight, rolling_resistance_coefficient,
+     air_density, drag_area, drivetrain_efficiency) = (p.ravel() for p in params)
+    system_weight = rider_weight + bike_weight
+    coefficients = np.stack([
+        system_weight,
+        system_weight * rolling_resistance_coefficient,
+        air_density * drag_area,
+    ], axis=1)
+    coefficients /= drivetrain_efficiency[:, None]
+    return coefficients
+
+
+def iter_sweep_power(basis, coefficients, window=SMOOTHING_WINDOW, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    # Yields (slice of parameter sets, calculated power block) chunk by chunk,
+    # so callers can reduce each block (ex: error vs real power) without ever
+    # holding the full (P, n) result.
+    n = basis.shape[1]
+    n_params = len(coefficients)
+    rows = max(1, int(chunk_bytes // (max(n, 1) * 8 * BLOCK_COPIES)))
+    for start in range(0, n_params, rows):
+        chunk = slice(start, min(start + rows, n_params))
+        block = coefficients[chunk] @ basis
+        # Output power cannot be negative (np.maximum keeps NaN)
+        np.maximum(block, 0, out=block)
+        rolling_mean(block, window, out=block)
+        yield chunk, block
+
+
+def sweep_power(df, params, window=SMOOTHING_WINDOW, chunk_bytes=DEFAULT_CHUNK_BYTES, out=None, **smoothing):
+    # Calculated power for every parameter set in `params` (a dict of
+    # SWEEP_PARAMETERS, ex: from parameter_grid, missing ones use the model
+    # defaults). Returns a (P, n) array; row i matches calculate_power's
+    # calculated_power for parameter set i (with the same smoothing options).
+    missing = {'rider_weight', 'bike_weight', 'rolling_resistance_coefficient'} - set(params)
+    if missing:
+        raise ValueError(f"Missing sweep parameters: {', '.join(sorted(missing))}")
+    coefficients = sweep_coefficients(**params)
+    basis = ride_power_basis(df, **smoothing)
+    if out is None:
+        out = np.empty((len(coefficients), basis.shape[1]))
+    for chunk, block in iter_sweep_power(basis, coefficients, window, chunk_bytes):
+        out[chunk] = block
+    return out
@@ -0,0 +1,75 @@
+import numpy as np
+
+# Histograms of any [start, end] index range of a ride in constant time.
+#
+# Each channel gets fixed bin edges for the whole ride (multiples of a round
+# bin width, widened until there are at most MAX_BINS bins) and a cumulative
+# per-bin count array along the sample axis: cumulative[i] holds the bin
+# counts of samples [0, i). A range's histogram is then one row subtraction,
+# and the dashboard ships the binned counts instead of raw samples.
+# The tables take (samples x bins) counts per channel, several times the size
+# of the compact ride, so callers index only the channels they plot.
+
+# Preferred bin width per channel, in the channel's units
+HISTOGRAM_BIN_WIDTHS = {
+    'power': 10.0,        # W
+    'heart_rate': 2.0,    # bpm
+    'cadence': 5.0,       # rpm
+    'speed': 0.5,         # m/s
+}
+MAX_BINS = 60
+
+
+def histogram_edges(values, width, max_bins=MAX_BINS):
+    # Edges on multiples of width covering the finite values
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+    low, high = values.min(), values.max()
+    while True:
+        first = np.floor(low / width)
+        n_bins = max(int(np.floor(high / width) - first) + 1, 1)
+        if n_bins <= max_bins:
+            return (first + np.arange(n_bins + 1)) * width
+        width *= 2
+
+
+class RangeHistogramIndex:
+    def __init__(self, df, channels=None, bin_widths=HISTOGRAM_BIN_WIDTHS):
+        # channels: names to index (default: all of bin_widths)
+        self.length = len(df)
+        self.channels = {}
+        # Smallest count type that can hold every sample of the ride
+        dtype = np.uint16 if self.length < np.iinfo(np.uint16).max else np.uint32
+        for channel in bin_widths if channels is None else channels:
+            width = bin_widths[channel]
+            if channel not in df:
+                continue
+            values = df[channel].to_numpy(dtype=np.float64, na_value=np.nan)
+            edges = histogram_edges(values, width)
+            if edges is None:
+                continue
+            n_bins = len(edges) - 1
+            valid = np.flatnonzero(np.isfinite(values))
+            bins = np.clip(
+                ((values[valid] - edges[0]) // (edges[1] - edges[0])).astype(np.int64),
+                0, n_bins - 1,
+            )
+            cumulative = np.zeros((self.length + 1, n_bins), dtype=dtype)
+            cumulative[valid + 1, bins] = 1
+            np.cumsum(cumulative, axis=0, dtype=dtype, out=cumulative)
+            self.channels[channel] = {'edges': edges, 'cumulative': cumulative}
+
+    def histogram(self, channel, start=None, end=None):
+        # (edges, counts) of channel over samples [start, end] (inclusive),
+        # or None if the ride has no such data
+        index = self.channels.get(channel)
+        if index is None:
+            return None
+        start = 0 if start is None else max(0, int(start))
+        end = self.length - 1 if end is None else min(self.length - 1, int(end))
+        cumulative = index['cumulative']
+        if start > end:
+            return index['edges'], np.zeros(cumulative.shape[1], dtype=np.int64)
+        counts = cumulative[end + 1].astype(np.int64) - cumulative[start]
+        return index['edges'], counts
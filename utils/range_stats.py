@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+# Constant-time statistics for any [start, end] index range of a ride.
+#
+# Built once per ride: cumulative counts, sums and sums of squares per channel
+# (values are shifted by the channel mean first so the variance doesn't suffer
+# from cancellation), plus sparse tables for range min/max. Elapsed time and
+# distance are differences of the timestamp/distance columns, and elevation
+# gain comes from a cumulative sum of positive altitude steps.
+
+RANGE_STAT_CHANNELS = ('power', 'heart_rate', 'cadence', 'speed', 'altitude')
+
+
+def _as_float(df, column):
+    if column not in df:
+        return np.full(len(df), np.nan)
+    return df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _valid_neighbours(values):
+    # For each position, the index of the nearest valid sample at or before
+    # it (-1 if none) and at or after it (n if none)
+    n = len(values)
+    positions = np.where(np.isfinite(values), np.arange(n), -1)
+    previous = np.maximum.accumulate(positions) if n else positions
+    positions = np.where(np.isfinite(values), np.arange(n), n)
+    following = np.minimum.accumulate(positions[::-1])[::-1] if n else positions
+    return previous, following
+
+
+def _sparse_table(values, better):
+    # table[k][i] = position of the best value in values[i:i + 2**k], where
+    # better(a, b) picks a over b. Storing int32 positions instead of values
+    # halves the memory of the n*log(n) levels and keeps results exact.
+    table = [np.arange(len(values), dtype=np.int32)]
+    width = 1
+    while 2 * width <= len(values):
+        previous = table[-1]
+        left, right = previous[:-width], previous[width:]
+        table.append(np.where(better(values[left], values[right]), left, right))
+        width *= 2
+    return table
+
+
+def _sparse_query(table, values, start, end):
+    # Two overlapping power-of-two windows cover [start, end]
+    level = (end - start + 1).bit_length() - 1
+    row = table[level]
+    return values[row[start]], values[row[end - (1 << level) + 1]]
+
+
+class RangeStatsIndex:
+    def __init__(self, df, channels=RANGE_STAT_CHANNELS):
+        self.length = len(df)
+        self.channels = {}
+        for channel in channels:
+            values = _as_float(df, channel)
+            valid = np.isfinite(values)
+            if not valid.any():
+                continue
+            shift = values[valid].mean()
+            shifted = np.where(valid, values - shift, 0.0)
+            self.channels[channel] = {
+                'shift': shift,
+                'count': np.concatenate([[0], np.cumsum(valid)]),
+                'sum': np.concatenate([[0.0], np.cumsum(shifted)]),
+                'sum_sq': np.concatenate([[0.0], np.cumsum(shifted * shifted)]),
+                'values': values,
+                'argmin': _sparse_table(np.where(valid, values, np.inf), np.less_equal),
+                'argmax': _sparse_table(np.where(valid, values, -np.inf), np.greater_equal),
+            }
+
+        if 'timestamp' in df and self.length:
+            timestamps = df['timestamp']
+            self.seconds = np.where(
+                timestamps.isnull().to_numpy(), np.nan,
+                timestamps.to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9,
+            )
+        else:
+            self.seconds = np.full(self.length, np.nan)
+        self.distance = _as_float(df, 'distance')
+        self._seconds_valid = _valid_neighbours(self.seconds)
+        self._distance_valid = _valid_neighbours(self.distance)
+
+        altitude = _as_float(df, 'altitude')
+        steps = np.diff(altitude, prepend=np.nan)
+        gain = np.where(steps > 0, steps, 0.0)
+        self.elevation_gain = np.concatenate([[0.0], np.cumsum(gain)])
+
+    def _clamp(self, start, end):
+        start = 0 if start is None else max(0, int(start))
+        end = self.length - 1 if end is None else min(self.length - 1, int(end))
+        return start, end
+
+    def channel_stats(self, channel, start=None, end=None):
+        # count/mean/std/min/max of one channel over [start, end] (inclusive)
+        start, end = self._clamp(start, end)
+        empty = {'count': 0, 'mean': np.nan, 'std': np.nan, 'min': np.nan, 'max': np.nan}
+        index = self.channels.get(channel)
+        if index is None or start > end:
+            return empty
+        count = int(index['count'][end + 1] - index['count'][start])
+        if count == 0:
+            return empty
+        total = index['sum'][end + 1] - index['sum'][start]
+        total_sq = index['sum_sq'][end + 1] - index['sum_sq'][start]
+        mean = total / count
+        # Sample standard deviation, like DataFrame.describe
+        std = np.sqrt(max(total_sq - count * mean * mean, 0.0) / (count - 1)) if count > 1 else np.nan
+        low = float(np.nanmin(_sparse_query(index['argmin'], index['values'], start, end)))
+        high = float(np.nanmax(_sparse_query(index['argmax'], index['values'], start, end)))
+        if low == high:
+            # Constant range, avoid round-off noise from the sums
+            return {'count': count, 'mean': low, 'std': 0.0 if count > 1 else np.nan, 'min': low, 'max': high}
+        return {
+            'count': count,
+            'mean': float(mean + index['shift']),
+            'std': float(std),
+            'min': low,
+            'max': high,
+        }
+
+    def _first_last(self, values, valid, start, end):
+        # Difference between the first and last valid value in the range,
+        # for cumulative columns (timestamps, distance)
+        if start > end:
+            return np.nan
+        previous, following = valid
+        first = following[start]
+        last = previous[end]
+        if first > last:
+            return np.nan
+        return float(values[last] - values[first])
+
+    def stats(self, start=None, end=None):
+        start, end = self._clamp(start, end)
+        result = {channel: self.channel_stats(channel, start, end) for channel in self.channels}
+        result['elapsed_seconds'] = self._first_last(self.seconds, self._seconds_valid, start, end)
+        result['distance'] = self._first_last(self.distance, self._distance_valid, start, end)
+        result['elevation_gain'] = (
+            float(self.elevation_gain[end + 1] - self.elevation_gain[start + 1])
+            if start <= end else np.nan
+        )
+        return result
+
+    def summary(self, start=None, end=None):
+        # Per-channel table for the dashboard, in the layout of
+        # df.describe().T.reset_index()
+        rows = [
+            dict(field=channel, **self.channel_stats(channel, start, end))
+            for channel in self.channels
+        ]
+        return pd.DataFrame(rows, columns=['field', 'count', 'mean', 'std', 'min', 'max'])
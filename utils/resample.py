@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.ride_dtypes import RIDE_DTYPES, compact_ride
+
+# Uniform time base for decoded rides.
+#
+# resample_ride lays a ride on a grid of RESAMPLE_HZ samples per second
+# (multiples of the sample spacing since the epoch, so a time window of a
+# ride lands on the same grid as the whole ride). Samples are sorted by
+# timestamp, duplicates keep their first reading, and each grid point is
+# interpolated linearly between the two samples around it, in one gather
+# for all channels. Integer channels are rounded back to whole values.
+#
+# Grid points inside a recording gap longer than GAP_SECONDS get no
+# readings (NA) and are flagged in one of two boolean columns:
+#   paused - the rider didn't move across the gap (auto-pause, a stop with
+#            the recorder paused); distance holds its last value
+#   gap    - the rider moved (GPS or sensor dropout); distance is
+#            interpolated
+# Downstream code can then rely on a fixed sample spacing
+# (df.attrs['sample_rate']), ex: the power model's time steps and the 1 Hz
+# power curve. RESAMPLE_HZ=0 keeps the recorded samples as they are.
+
+RESAMPLE_HZ = float(os.environ.get('RESAMPLE_HZ', 1))
+GAP_SECONDS = float(os.environ.get('GAP_SECONDS', 10))
+# Slowest average speed across a gap that still counts as moving (m/s)
+PAUSE_SPEED = 0.5
+MASK_COLUMNS = ('gap', 'paused')
+
+
+def resampled_at(df, rate=RESAMPLE_HZ):
+    # Whether df was resampled with rate (always true for rate=0 on a ride
+    # that was never resampled), ex: to reject cached frames
+    return df.attrs.get('sample_rate') == (rate or None)
+
+
+def _float_columns(df, columns):
+    # (k, n) float64 block of the numeric columns, NaN for missing values
+    block = np.empty((len(columns), len(df)))
+    for row, col in zip(block, columns):
+        row[:] = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+    return block
+
+
+def resample_ride(df, rate=RESAMPLE_HZ, max_gap=GAP_SECONDS):
+    # New compact frame on the uniform grid, with the MASK_COLUMNS added and
+    # df.attrs kept (plus 'sample_rate'). Rides without timestamps are
+    # returned compacted, unresampled.
+    if not rate or 'timestamp' not in df:
+        return compact_ride(df)
+    timestamps = compact_ride(df[['timestamp']])['timestamp']
+    valid = timestamps.notnull().to_numpy()
+    if not valid.any():
+        return compact_ride(df)
+    step = int(round(1e9 / rate))
+
+    # Sorted, distinct sample times
+    times = timestamps.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    rows = np.flatnonzero(valid)
+    rows = rows[np.argsort(times[rows], kind='stable')]
+    times, first = np.unique(times[rows], return_index=True)
+    rows = rows[first]
+
+    # Each grid point sits between samples left and right = left + 1
+    grid = np.arange(-(-times[0] // step) * step, times[-1] + 1, step)
+    left = np.searchsorted(times, grid, side='right') - 1
+    right = np.minimum(left + 1, len(times) - 1)
+    offset = grid - times[left]
+    span = times[right] - times[left]
+    weight = np.divide(offset, span, out=np.zeros(len(grid)), where=span > 0)
+    in_gap = (span > max_gap * 1e9) & (offset > 0)
+
+    numeric = [
+        col for col in df.columns
+        if col != 'timestamp' and (col in RIDE_DTYPES or pd.api.types.is_numeric_dtype(df[col].dtype))
+        and not pd.api.types.is_bool_dtype(df[col].dtype)
+    ]
+    block = _float_columns(df, numeric)[:, rows]
+    before, after = block[:, left], block[:, right]
+    with np.errstate(invalid='ignore'):
+        values = before + weight * (after - before)
+    # Exact hits keep their reading even when the next sample lacks one
+    exact = offset == 0
+    values[:, exact] = before[:, exact]
+
+    paused = np.zeros(len(grid), dtype=bool)
+    if in_gap.any():
+        if 'distance' in numeric:
+            distance = numeric.index('distance')
+            # Unknown distance on either side counts as moving
+            with np.errstate(invalid='ignore'):
+                still = after[distance] - before[distance] < PAUSE_SPEED * span / 1e9
+            paused = in_gap & still
+            values[distance, paused] = before[distance, paused]
+            others = [i for i in range(len(numeric)) if i != distance]
+            values[np.ix_(others, np.flatnonzero(in_gap))] = np.nan
+        else:
+            values[:, in_gap] = np.nan
+    for i, col in enumerate(numeric):
+        if RIDE_DTYPES.get(col, '').startswith('Int'):
+            np.round(values[i], out=values[i])
+
+    columns = {'timestamp': grid.astype('datetime64[ns]')}
+    for col in df.columns:
+        if col in numeric:
+            columns[col] = values[numeric.index(col)]
+        elif col != 'timestamp':
+            # Other columns (text, flags) take the reading at or before
+            columns[col] = df[col].to_numpy()[rows][left]
+    columns['gap'] = in_gap & ~paused
+    columns['paused'] = paused
+    resampled = pd.DataFrame(columns, index=pd.RangeIndex(len(grid)))
+    # Keep the original column order, masks last
+    resampled = compact_ride(resampled[[*(c for c in df.columns if c not in MASK_COLUMNS), *MASK_COLUMNS]])
+    resampled.attrs.update(df.attrs)
+    resampled.attrs['sample_rate'] = rate
+    return resampled
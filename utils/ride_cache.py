@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Persistent cache of decoded rides.
+#
+# Decoded DataFrames are stored column-by-column in uncompressed .npz files,
+# named by the SHA-256 of the source file's content. Nullable integer columns
+# are stored as their values plus a mask array, and scalar df.attrs (ex: the
+# sample rate of a resampled ride) in the metadata. An index maps each source
+# path to its last seen (mtime, size, hash) so an unchanged file is recognised
+# with a single stat() call, while an edited or replaced file is re-hashed and
+# re-decoded. Entries are evicted least-recently-used once the cache exceeds
+# its size cap.
+
+CACHE_DIR = os.environ.get('RIDE_CACHE_DIR', '.ride_cache')
+CACHE_MAX_BYTES = int(float(os.environ.get('RIDE_CACHE_MAX_MB', 512)) * 1024**2)
+# Bump when the decoded DataFrame layout changes to invalidate old entries
+CACHE_VERSION = 3
+
+INDEX_FILE = 'index.json'
+
+
+def file_content_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dataframe_to_arrays(df):
+    # Returns a dict of arrays for np.savez, or None if the frame holds
+    # object columns with real values (those can't be stored without pickle).
+    arrays = {}
+    none_columns = []
+    masked_columns = {}
+    for col in df.columns:
+        if isinstance(df[col].array, pd.arrays.IntegerArray):
+            dtype = df[col].dtype
+            arrays[f'col:{col}'] = df[col].to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+            arrays[f'mask:{col}'] = df[col].isna().to_numpy()
+            masked_columns[col] = str(dtype)
+            continue
+        values = df[col].to_numpy()
+        if values.dtype == object:
+            if df[col].notnull().any():
+                return None
+            none_columns.append(col)
+            continue
+        if values.dtype.metadata is not None:
+            # Unpickled arrays (ex: from a worker process) can carry empty
+            # dtype metadata, which np.savez warns about
+            values = values.view(np.dtype(values.dtype.str))
+        arrays[f'col:{col}'] = values
+    meta = {
+        'version': CACHE_VERSION,
+        'columns': list(df.columns),
+        'none_columns': none_columns,
+        'masked_columns': masked_columns,
+        'length': len(df),
+        'attrs': {key: value for key, value in df.attrs.items() if isinstance(value, (str, int, float, bool))},
+    }
+    arrays['__meta__'] = np.array(json.dumps(meta))
+    return arrays
+
+
+def arrays_to_dataframe(arrays, columns=None):
+    # columns limits the frame to those columns; np.load reads .npz members
+    # lazily, so the others are never read from disk
+    meta = json.loads(str(arrays['__meta__']))
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    index = pd.RangeIndex(meta['length'])
+    selected = [col for col in meta['columns'] if columns is None or col in columns]
+    masked = meta['masked_columns']
+    df = pd.DataFrame(
+        {
+            col: pd.arrays.IntegerArray(arrays[f'col:{col}'], arrays[f'mask:{col}']) if col in masked else arrays[f'col:{col}']
+            for col in selected if col not in meta['none_columns']
+        },
+        index=index,
+    )
+    for col in selected:
+        if col in meta['none_columns']:
+            df[col] = None
+    df = df[selected]
+    df.attrs.update(meta['attrs'])
+    return df
+
+
+class RideCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None
+
+    # --- Index persistence ---
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self._index_path()) as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+            self._index.setdefault('files', {})
+            self._index.setdefault('entries', {})
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._index_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path())
+
+    # --- Keys ---
+
+    def _fingerprint(self, path):
+        # Returns the content hash for path, re-hashing only when the file's
+        # mtime or size differ from what the index last recorded.
+        index = self._load_index()
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        known = index['files'].get(key)
+        if known and known['mtime_ns'] == stat.st_mtime_ns and known['size'] == stat.st_size:
+            return known['hash']
+        content_hash = file_content_hash(path)
+        if known and known['hash'] != content_hash:
+            self._drop_entry_if_unreferenced(known['hash'], ignore_path=key)
+        index['files'][key] = {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'hash': content_hash,
+        }
+        return content_hash
+
+    def _entry_path(self, content_hash):
+        return os.path.join(self.cache_dir, f'{content_hash[:32]}-v{CACHE_VERSION}.npz')
+
+    # --- Entries ---
+
+    def _drop_entry_if_unreferenced(self, content_hash, ignore_path=None):
+        index = self._load_index()
+        for path, known in index['files'].items():
+            if path != ignore_path and known['hash'] == content_hash:
+                return
+        self._remove_entry(content_hash)
+
+    def _remove_entry(self, content_hash):
+        entry = self._load_index()['entries'].pop(content_hash, None)
+        if entry is not None:
+            try:
+                os.remove(self._entry_path(content_hash))
+            except OSError:
+                pass
+
+    def _evict(self):
+        entries = self._load_index()['entries']
+        total = sum(entry['bytes'] for entry in entries.values())
+        for content_hash in sorted(entries, key=lambda h: entries[h]['last_used']):
+            if total <= self.max_bytes:
+                break
+            total -= entries[content_hash]['bytes']
+            self._remove_entry(content_hash)
+
+    def get(self, path, columns=None):
+        with self._lock:
+            content_hash = self._fingerprint(path)
+            entry = self._load_index()['entries'].get(content_hash)
+            df = None
+            if entry is not None:
+                try:
+                    with np.load(self._entry_path(content_hash), allow_pickle=False) as arrays:
+                        df = arrays_to_dataframe(arrays, columns)
+                except (OSError, ValueError, KeyError):
+                    df = None
+                if df is None:
+                    self._remove_entry(content_hash)
+                else:
+                    entry['last_used'] = time.time()
+            self._save_index()
+            return df
+
+    def put(self, path, df):
+        arrays = dataframe_to_arrays(df)
+        if arrays is None:
+            return False
+        with self._lock:
+            content_hash = self._fingerprint(path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entry_path = self._entry_path(content_hash)
+            tmp_path = entry_path + '.tmp.npz'
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, entry_path)
+            self._load_index()['entries'][content_hash] = {
+                'bytes': os.path.getsize(entry_path),
+                'last_used': time.time(),
+            }
+            self._evict()
+            self._save_index()
+            return True
+
+    def fingerprint(self, path):
+        # Content hash of path (a stat() call when the file is unchanged)
+        with self._lock:
+            return self._fingerprint(path)
+
+    def get_or_load(self, path, loader, valid=None):
+        # loader() decodes the ride on a cache miss; valid(df) can reject a
+        # cached frame (ex: one decoded with other settings)
+        df = self.get(path)
+        if df is not None and (valid is None or valid(df)):
+            return df
+        df = loader()
+        if df is not None:
+            self.put(path, df)
+        return df
+
+    def clear(self):
+        with self._lock:
+            index = self._load_index()
+            for content_hash in list(index['entries']):
+                self._remove_entry(content_hash)
+            index['files'].clear()
+            self._save_index()
+
+
+ride_cache = RideCache()
@@ -0,0 +1,146 @@
+import argparse
+import contextlib
+import io
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Compact column types for decoded rides.
+#
+# Decoders produce float64 (int64 when a channel has no gaps) and fill
+# channels a file doesn't record with None, i.e. object columns. compact_ride
+# converts a ride to a fixed schema instead: float32 for positions, altitude,
+# speed and grade (float32 keeps ~7 significant digits, ~0.5 m at worst for
+# coordinates and far below the recorded resolution for the rest), nullable
+# Int8/Int16 for integer channels (pd.NA for gaps, no float round trip),
+# float64 for cumulative distance (float32 would round to ~1.5 cm on long
+# rides) and datetime64[ns] for timestamps. Missing channels become all-NA
+# columns of their schema type, so a ride never holds an object column.
+#
+# Running this module prints a per-ride memory report, comparing the compact
+# frame with the float64/object layout, and the largest value change:
+#   python -m utils.ride_dtypes [NCAR.fit ...]
+
+RIDE_DTYPES = {
+    'timestamp': 'datetime64[ns]',
+    'position_lat': 'float32',
+    'position_long': 'float32',
+    'altitude': 'float32',
+    'enhanced_altitude': 'float32',
+    'speed': 'float32',
+    'enhanced_speed': 'float32',
+    'grade': 'float32',
+    'distance': 'float64',
+    'heart_rate': 'Int16',
+    'cadence': 'Int16',
+    'power': 'Int16',
+    'temperature': 'Int8',
+    'gps_accuracy': 'Int16',
+}
+
+
+def _compact_column(series, dtype):
+    if dtype.startswith('datetime64'):
+        values = pd.to_datetime(series)
+        if values.dt.tz is not None:
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+        return values.astype(dtype)
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    if dtype.startswith('float'):
+        return pd.Series(values.astype(dtype), index=series.index)
+    # Nullable integer, unless the values don't fit it (ex: a GPX file with
+    # fractional temperatures), in which case they are kept as float32
+    info = np.iinfo(dtype.lower())
+    valid = np.isfinite(values)
+    samples = values[valid]
+    if not (np.all(samples == np.round(samples)) and np.all((samples >= info.min) & (samples <= info.max))):
+        return pd.Series(values.astype(np.float32), index=series.index)
+    data = np.zeros(len(values), dtype=dtype.lower())
+    data[valid] = samples
+    return pd.Series(pd.arrays.IntegerArray(data, ~valid), index=series.index)
+
+
+def compact_ride(df):
+    # New frame with the RIDE_DTYPES columns converted; other columns and
+    # df.attrs are kept as they are
+    columns = {
+        col: _compact_column(df[col], RIDE_DTYPES[col]) if col in RIDE_DTYPES else df[col]
+        for col in df.columns
+    }
+    compact = pd.DataFrame(columns, index=df.index)
+    compact.attrs.update(df.attrs)
+    return compact
+
+
+def legacy_ride(df):
+    # The float64/object layout of a frame, for comparison: numeric channels
+    # as float64 and channels without any value as None
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if series.isnull().all() and not np.issubdtype(series.dtype, np.datetime64):
+            columns[col] = pd.Series(None, index=df.index, dtype=object)
+        elif col in RIDE_DTYPES and not RIDE_DTYPES[col].startswith('datetime64'):
+            columns[col] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            columns[col] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_report(df):
+    # {column: (dtype, bytes)} plus the total, counting object payloads
+    usage = df.memory_usage(deep=True, index=False)
+    report = {col: (str(df[col].dtype), int(usage[col])) for col in df.columns}
+    report['total'] = ('', int(usage.sum()))
+    return report
+
+
+def max_difference(compact, df):
+    # Largest absolute change per numeric column made by compact_ride
+    differences = {}
+    for col in df.columns:
+        if col not in RIDE_DTYPES or RIDE_DTYPES[col].startswith('datetime64'):
+            continue
+        before = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        after = compact[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        if np.isnan(before).all():
+            continue
+        if not np.array_equal(np.isnan(before), np.isnan(after)):
+            differences[col] = np.inf
+        else:
+            differences[col] = float(np.nanmax(np.abs(after - before)))
+    return differences
+
+
+def main(argv=None):
+    from utils.load_ride import get_ride_files, load_fit_file, load_gpx_file
+
+    parser = argparse.ArgumentParser(description="Per-ride memory report for the compact ride schema.")
+    parser.add_argument('filenames', nargs='*', help="ride files in the rides folder (default: all)")
+    args = parser.parse_args(argv)
+
+    filenames = args.filenames or sorted(get_ride_files("Both")[0])
+    total_before = total_after = 0
+    for filename in filenames:
+        loader = load_gpx_file if filename.lower().endswith('.gpx') else load_fit_file
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = loader(filename)
+        compact = compact_ride(df)
+        before = memory_report(legacy_ride(df))
+        after = memory_report(compact)
+        total_before += before['total'][1]
+        total_after += after['total'][1]
+        print(f"{filename}: {len(df)} samples, {before['total'][1] / 1024:,.0f} KiB -> {after['total'][1] / 1024:,.0f} KiB "
+              f"({before['total'][1] / max(after['total'][1], 1):.1f}x smaller)")
+        differences = max_difference(compact, df)
+        for col in df.columns:
+            change = f"  max change {differences[col]:.3g}" if col in differences else ""
+            print(f"  {col:<18}{before[col][0]:>15} {before[col][1]:>10,} B  ->  {after[col][0]:>15} {after[col][1]:>10,} B{change}")
+    if len(filenames) > 1:
+        print(f"All rides: {total_before / 1024**2:.2f} MiB -> {total_after / 1024**2:.2f} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
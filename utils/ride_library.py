@@ -0,0 +1,308 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from utils.calculate_metrics import format_duration
+from utils.load_ride import BASE_FOLDER, load_file
+from utils.power_curve import one_hz_series
+from utils.ride_cache import CACHE_DIR, ride_cache
+
+# Persistent SQLite index of the rides folder.
+#
+# One row per ride file with its content fingerprint and summary metadata
+# (start time, duration, distance, elevation gain, average and normalized
+# power, bounding box). refresh() compares each file's mtime and size with its
+# row and decodes only new or changed files, so listing, filtering and sorting
+# the library is a single query that never touches the ride files themselves.
+# Indexing only loads the columns the metadata needs (LIBRARY_COLUMNS).
+# Files are decoded outside the index lock and each row is written in its own
+# short transaction, so queries answer from the current index while a refresh
+# is still indexing a large folder.
+
+LIBRARY_FILE = 'library.sqlite'
+# Bump when the metadata definitions change to recompute every row
+LIBRARY_VERSION = 2
+# Normalized power rolling window (s)
+NP_WINDOW = 30
+
+# Ride columns read to compute the metadata
+LIBRARY_COLUMNS = ['timestamp', 'distance', 'altitude', 'power', 'position_lat', 'position_long']
+
+METADATA_COLUMNS = (
+    'start_time', 'duration', 'distance', 'elevation_gain',
+    'avg_power', 'np_power', 'lat_min', 'lat_max', 'lon_min', 'lon_max', 'samples',
+)
+
+# Label shown in the dashboard -> (column, descending)
+SORT_ORDERS = {
+    "Newest first": ('start_time', True),
+    "Oldest first": ('start_time', False),
+    "Longest distance": ('distance', True),
+    "Longest duration": ('duration', True),
+    "Most climbing": ('elevation_gain', True),
+    "Highest normalized power": ('np_power', True),
+    "File name": ('filename', False),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rides (
+    filename TEXT PRIMARY KEY,
+    extension TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    fingerprint TEXT,
+    version INTEGER NOT NULL,
+    error TEXT,
+    start_time REAL,
+    duration REAL,
+    distance REAL,
+    elevation_gain REAL,
+    avg_power REAL,
+    np_power REAL,
+    lat_min REAL,
+    lat_max REAL,
+    lon_min REAL,
+    lon_max REAL,
+    samples INTEGER
+);
+CREATE INDEX IF NOT EXISTS rides_start_time ON rides (start_time);
+CREATE INDEX IF NOT EXISTS rides_extension ON rides (extension);
+"""
+
+
+def _finite(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _column(df, column):
+    if column not in df:
+        return np.full(len(df), np.nan)
+    return df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def normalized_power(df, window=NP_WINDOW):
+    # Fourth-power mean of the 30 s rolling average power, on a 1 Hz grid
+    power = one_hz_series(df, 'power', 'zero')
+    if len(power) < window or not power.any():
+        return np.nan
+    sums = np.concatenate([[0.0], np.cumsum(power)])
+    rolling = (sums[window:] - sums[:-window]) / window
+    return float(np.mean(rolling ** 4) ** 0.25)
+
+
+def ride_metadata(df):
+    # Summary columns for one decoded ride
+    meta = dict.fromkeys(METADATA_COLUMNS)
+    if df is None or df.empty:
+        return meta
+    meta['samples'] = len(df)
+    if 'timestamp' in df and df['timestamp'].notnull().any():
+        timestamps = df['timestamp'].dropna()
+        meta['start_time'] = timestamps.iloc[0].timestamp()
+        meta['duration'] = (timestamps.iloc[-1] - timestamps.iloc[0]).total_seconds()
+    distance = _column(df, 'distance')
+    if np.isfinite(distance).any():
+        meta['distance'] = _finite(np.nanmax(distance))
+    altitude = _column(df, 'altitude')
+    steps = np.diff(altitude[np.isfinite(altitude)])
+    meta['elevation_gain'] = float(steps[steps > 0].sum()) if len(steps) else None
+    power = _column(df, 'power')
+    if np.isfinite(power).any():
+        meta['avg_power'] = _finite(np.nanmean(power))
+        meta['np_power'] = _finite(normalized_power(df))
+    lat, lon = _column(df, 'position_lat'), _column(df, 'position_long')
+    valid = np.isfinite(lat) & np.isfinite(lon)
+    if valid.any():
+        meta['lat_min'], meta['lat_max'] = float(lat[valid].min()), float(lat[valid].max())
+        meta['lon_min'], meta['lon_max'] = float(lon[valid].min()), float(lon[valid].max())
+    return meta
+
+
+def ride_label(ride):
+    # Radio label for a library row: name, date and headline numbers
+    parts = [ride['filename']]
+    if ride['start_time'] is not None:
+        parts.append(datetime.fromtimestamp(ride['start_time']).strftime('%Y-%m-%d'))
+    if ride['duration'] is not None:
+        parts.append(format_duration(ride['duration']))
+    if ride['distance'] is not None:
+        parts.append(f"{ride['distance'] / 1000:.1f} km")
+    if ride['elevation_gain'] is not None:
+        parts.append(f"{ride['elevation_gain']:.0f} m")
+    if ride['np_power'] is not None:
+        parts.append(f"NP {ride['np_power']:.0f} W")
+    return " · ".join(parts)
+
+
+class RideLibrary:
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.path = os.path.join(cache_dir, LIBRARY_FILE)
+        self._lock = threading.Lock()
+        self._indexing = set()  # filenames being decoded by a refresh
+        self._refresh_thread = None
+
+    @contextmanager
+    def _connect(self):
+        # One transaction on a fresh connection (sqlite3 connections can't be
+        # shared between Gradio's worker threads)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.row_factory = sqlite3.Row
+            connection.executescript(SCHEMA)
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    # --- Updates ---
+
+    def _scan(self):
+        # filename -> os.stat_result for the ride files in the folder
+        if not os.path.exists(BASE_FOLDER):
+            return {}
+        with os.scandir(BASE_FOLDER) as entries:
+            return {
+                entry.name: entry.stat()
+                for entry in entries
+                if entry.name.endswith(('.fit', '.gpx')) and entry.is_file()
+            }
+
+    def _file_row(self, filename, stat, df=None, error=None):
+        # Index row of one file. Decodes the ride unless it is passed in (df)
+        # or known to fail (error); call without holding the lock.
+        path = os.path.join(BASE_FOLDER, filename)
+        row = {
+            'filename': filename,
+            'extension': os.path.splitext(filename)[1].lower(),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'version': LIBRARY_VERSION,
+            'error': None,
+            'fingerprint': None,
+        }
+        try:
+            row['fingerprint'] = ride_cache.fingerprint(path)
+            if error is not None:
+                raise ValueError(error)
+            row.update(ride_metadata(load_file(filename, columns=LIBRARY_COLUMNS) if df is None else df))
+        except Exception as e:
+            print(f"Could not index {filename}: {e}")
+            row.update(dict.fromkeys(METADATA_COLUMNS))
+            row['error'] = str(e)
+        return row
+
+    def _write_row(self, row):
+        columns = ', '.join(row)
+        placeholders = ', '.join(f':{column}' for column in row)
+        with self._lock, self._connect() as connection:
+            connection.execute(f"INSERT OR REPLACE INTO rides ({columns}) VALUES ({placeholders})", row)
+
+    def refresh(self):
+        # Bring the index in line with the folder: index new or changed files,
+        # drop deleted ones. Returns (indexed, removed) counts. Files another
+        # refresh is already decoding are left to it.
+        files = self._scan()
+        with self._lock:
+            with self._connect() as connection:
+                known = {
+                    row['filename']: row
+                    for row in connection.execute("SELECT filename, mtime_ns, size, version FROM rides")
+                }
+                removed = [filename for filename in known if filename not in files]
+                connection.executemany("DELETE FROM rides WHERE filename = ?", [(f,) for f in removed])
+            stale = []
+            for filename, stat in sorted(files.items()):
+                row = known.get(filename)
+                if filename in self._indexing or (
+                    row is not None and row['mtime_ns'] == stat.st_mtime_ns
+                    and row['size'] == stat.st_size and row['version'] == LIBRARY_VERSION
+                ):
+                    continue
+                stale.append(filename)
+            self._indexing.update(stale)
+        try:
+            for filename in stale:
+                self._write_row(self._file_row(filename, files[filename]))
+        finally:
+            with self._lock:
+                self._indexing.difference_update(stale)
+        return len(stale), len(removed)
+
+    def refresh_in_background(self):
+        # Start refresh() on a daemon thread unless one is already running.
+        # Returns whether a refresh was started.
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return False
+            self._refresh_thread = threading.Thread(target=self.refresh, name='ride-library-refresh', daemon=True)
+            self._refresh_thread.start()
+            return True
+
+    def update_file(self, filename, df=None, error=None):
+        # Index (or re-index) one file, ex: right after an upload. Pass the
+        # decoded ride as df if it is at hand, or the decode error as error.
+        path = os.path.join(BASE_FOLDER, filename)
+        if os.path.isfile(path):
+            self._write_row(self._file_row(filename, os.stat(path), df, error))
+        else:
+            with self._lock, self._connect() as connection:
+                connection.execute("DELETE FROM rides WHERE filename = ?", (filename,))
+
+    # --- Queries ---
+
+    def current_files(self):
+        # filename -> (mtime_ns, size) of rows that are up to date and decoded
+        with self._lock, self._connect() as connection:
+            return {
+                row['filename']: (row['mtime_ns'], row['size'])
+                for row in connection.execute(
+                    "SELECT filename, mtime_ns, size FROM rides WHERE version = ? AND error IS NULL",
+                    (LIBRARY_VERSION,),
+                )
+            }
+
+    def list_rides(
+        self, filetype_filter="Both", sort_by="Newest first",
+        start_after=None, start_before=None, min_distance=None, bounding_box=None,
+    ):
+        # Library rows as dicts. start_after/start_before are unix seconds,
+        # min_distance is in meters, and bounding_box is (lat_min, lat_max,
+        # lon_min, lon_max); rides whose route intersects it are kept.
+        clauses, params = [], []
+        if filetype_filter in ('.fit', '.gpx'):
+            clauses.append("extension = ?")
+            params.append(filetype_filter)
+        if start_after is not None:
+            clauses.append("start_time >= ?")
+            params.append(start_after)
+        if start_before is not None:
+            clauses.append("start_time < ?")
+            params.append(start_before)
+        if min_distance is not None:
+            clauses.append("distance >= ?")
+            params.append(min_distance)
+        if bounding_box is not None:
+            lat_min, lat_max, lon_min, lon_max = bounding_box
+            clauses.append("lat_max >= ? AND lat_min <= ? AND lon_max >= ? AND lon_min <= ?")
+            params.extend([lat_min, lat_max, lon_min, lon_max])
+        column, descending = SORT_ORDERS.get(sort_by, SORT_ORDERS["Newest first"])
+        query = "SELECT * FROM rides"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        # Rides without the sort value go last either way
+        query += f" ORDER BY {column} IS NULL, {column} {'DESC' if descending else 'ASC'}, filename"
+        with self._lock, self._connect() as connection:
+            return [dict(row) for row in connection.execute(query, params)]
+
+    def choices(self, filetype_filter="Both", sort_by="Newest first"):
+        # (label, filename) pairs for the file selector
+        return [(ride_label(ride), ride['filename']) for ride in self.list_rides(filetype_filter, sort_by)]
+
+
+ride_library = RideLibrary()
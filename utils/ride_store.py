@@ -0,0 +1,199 @@
+import itertools
+import os
+import threading
+import time
+
+import pandas as pd
+
+from utils.load_ride import BASE_FOLDER, load_file
+from utils.power_cache import power_cache, with_power_components
+from utils.range_histograms import RangeHistogramIndex
+from utils.range_stats import RangeStatsIndex
+from utils.ride_cache import ride_cache
+from utils.route_simplify import RoutePyramid
+from utils.timing import span
+
+# Process-wide store of loaded rides, shared by all dashboard sessions.
+#
+# Each distinct ride (by content hash) is held once, as a DataFrame over
+# read-only arrays, together with its range statistics and histogram indexes
+# and route pyramid. Sessions only keep a small RideHandle in their gr.State; handlers
+# turn it into zero-copy views with RideStore.frame(). Rides are reference
+# counted by session and dropped once no session has used them for
+# RIDE_IDLE_SECONDS. Sessions that go away without releasing their handle
+# (closed tabs) are released after SESSION_IDLE_SECONDS.
+
+SESSION_IDLE_SECONDS = float(os.environ.get('RIDE_STORE_SESSION_IDLE_SECONDS', 3600))
+RIDE_IDLE_SECONDS = float(os.environ.get('RIDE_STORE_RIDE_IDLE_SECONDS', 300))
+# Channels the dashboard draws histograms of
+HISTOGRAM_CHANNELS = ('power', 'heart_rate')
+
+
+class RideHandle:
+    # What a session keeps in its gr.State: no arrays, just keys
+    __slots__ = ('handle_id', 'ride_id', 'filename', 'power_params')
+
+    def __init__(self, handle_id, ride_id, filename, power_params=None):
+        self.handle_id = handle_id
+        self.ride_id = ride_id
+        self.filename = filename
+        # kwargs for power_cache.get_or_compute, or None before calculating power
+        self.power_params = power_params
+
+    def with_power(self, **power_params):
+        return RideHandle(self.handle_id, self.ride_id, self.filename, power_params)
+
+    def __repr__(self):
+        return f"RideHandle({self.handle_id}, {self.filename})"
+
+
+def read_only_frame(df):
+    # Rebuild df over read-only column arrays (no copy for numeric columns)
+    columns = {}
+    for col in df.columns:
+        if isinstance(df[col].array, pd.arrays.IntegerArray):
+            # Nullable integers: read-only values and mask
+            data = df[col].to_numpy(dtype=df[col].dtype.numpy_dtype, na_value=0)
+            mask = df[col].isna().to_numpy()
+            data.setflags(write=False)
+            mask.setflags(write=False)
+            columns[col] = pd.arrays.IntegerArray(data, mask)
+            continue
+        values = df[col].to_numpy()
+        values.setflags(write=False)
+        columns[col] = values
+    frame = pd.DataFrame(columns, index=df.index, copy=False)
+    frame.attrs.update(df.attrs)
+    return frame
+
+
+class RideStore:
+    def __init__(self, session_idle_seconds=SESSION_IDLE_SECONDS, ride_idle_seconds=RIDE_IDLE_SECONDS):
+        self.session_idle_seconds = session_idle_seconds
+        self.ride_idle_seconds = ride_idle_seconds
+        self._rides = {}      # ride_id -> entry dict
+        self._sessions = {}   # handle_id -> {'ride_id', 'last_access'}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._handle_ids = itertools.count(1)
+
+    # --- Loading ---
+
+    def _load(self, filename):
+        # Returns the ride_id for filename, loading the ride once if needed
+        ride_id = ride_cache.fingerprint(os.path.join(BASE_FOLDER, filename))
+        with self._lock:
+            if ride_id in self._rides:
+                return ride_id
+            load_lock = self._load_locks.setdefault(ride_id, threading.Lock())
+        with load_lock:
+            with self._lock:
+                if ride_id in self._rides:
+                    return ride_id
+            with span('decode'):
+                df = read_only_frame(load_file(filename))
+            with span('indexes'):
+                entry = {
+                    'frame': df,
+                    'range_index': RangeStatsIndex(df),
+                    'histograms': RangeHistogramIndex(df, HISTOGRAM_CHANNELS),
+                    'route': RoutePyramid(df),
+                    'refs': set(),
+                    'last_access': time.monotonic(),
+                }
+            with self._lock:
+                self._rides[ride_id] = entry
+                self._load_locks.pop(ride_id, None)
+        return ride_id
+
+    def acquire(self, filename):
+        self.sweep()
+        ride_id = self._load(filename)
+        with self._lock:
+            handle_id = next(self._handle_ids)
+            now = time.monotonic()
+            self._sessions[handle_id] = {'ride_id': ride_id, 'last_access': now}
+            entry = self._rides[ride_id]
+            entry['refs'].add(handle_id)
+            entry['last_access'] = now
+        return RideHandle(handle_id, ride_id, filename)
+
+    def release(self, handle):
+        if handle is None:
+            return
+        with self._lock:
+            session = self._sessions.pop(handle.handle_id, None)
+            if session is None:
+                return
+            entry = self._rides.get(session['ride_id'])
+            if entry is not None:
+                entry['refs'].discard(handle.handle_id)
+                entry['last_access'] = time.monotonic()
+
+    def _entry(self, handle):
+        # Entry for handle, reloading the ride if it was evicted meanwhile
+        with self._lock:
+            entry = self._rides.get(handle.ride_id)
+            session = self._sessions.get(handle.handle_id)
+            now = time.monotonic()
+            if entry is not None and session is not None:
+                session['last_access'] = entry['last_access'] = now
+                return entry
+        ride_id = self._load(handle.filename)
+        with self._lock:
+            entry = self._rides[ride_id]
+            self._sessions[handle.handle_id] = {'ride_id': ride_id, 'last_access': now}
+            entry['refs'].add(handle.handle_id)
+            entry['last_access'] = now
+            return entry
+
+    # --- Views ---
+
+    def frame(self, handle):
+        # Read-only ride DataFrame for handle, with the session's calculated
+        # power columns attached (shared, not copied) if it has any
+        if handle is None:
+            return None
+        df = self._entry(handle)['frame']
+        if handle.power_params is not None:
+            df = with_power_components(df, power_cache.get_or_compute(df, **handle.power_params))
+        return df
+
+    def range_index(self, handle):
+        return None if handle is None else self._entry(handle)['range_index']
+
+    def histograms(self, handle):
+        return None if handle is None else self._entry(handle)['histograms']
+
+    def route(self, handle):
+        return None if handle is None else self._entry(handle)['route']
+
+    # --- Eviction ---
+
+    def sweep(self):
+        # Release idle sessions, then drop rides nobody has used for a while
+        now = time.monotonic()
+        with self._lock:
+            for handle_id, session in list(self._sessions.items()):
+                if now - session['last_access'] > self.session_idle_seconds:
+                    del self._sessions[handle_id]
+                    entry = self._rides.get(session['ride_id'])
+                    if entry is not None:
+                        entry['refs'].discard(handle_id)
+            for ride_id, entry in list(self._rides.items()):
+                if not entry['refs'] and now - entry['last_access'] > self.ride_idle_seconds:
+                    del self._rides[ride_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rides': len(self._rides),
+                'sessions': len(self._sessions),
+                'bytes': int(sum(
+                    entry['frame'].memory_usage(index=False, deep=False).sum()
+                    for entry in self._rides.values()
+                )),
+            }
+
+
+ride_store = RideStore()
@@ -0,0 +1,122 @@
+import numpy as np
+
+# Multi-resolution route geometry for the ride map.
+#
+# Douglas-Peucker is run once per ride, recording for every GPS fix the
+# tolerance (in meters) at which it would be dropped. Each map zoom level then
+# just keeps the fixes whose tolerance exceeds about one screen pixel at that
+# zoom, so the pyramid of simplified polylines costs one index array per level.
+
+EARTH_RADIUS_M = 6371008.8
+# Web Mercator ground resolution at zoom 0 on the equator (m / px)
+METERS_PER_PIXEL_Z0 = 156543.03392
+MIN_ZOOM = 1
+MAX_ZOOM = 16
+# Map panel size used to pick a zoom that fits a bounding box
+MAP_WIDTH_PX = 600
+MAP_HEIGHT_PX = 450
+# Simplification tolerance in screen pixels
+TOLERANCE_PX = 1.0
+
+
+def douglas_peucker_importance(x, y, min_tolerance=0.0):
+    # Tolerance at which each point is removed by Douglas-Peucker. Endpoints
+    # are never removed (inf). Points below min_tolerance are left at 0.
+    n = len(x)
+    importance = np.zeros(n)
+    if n == 0:
+        return importance
+    importance[0] = importance[-1] = np.inf
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        x0, y0 = x[first], y[first]
+        dx, dy = x[last] - x0, y[last] - y0
+        px = x[first + 1:last] - x0
+        py = y[first + 1:last] - y0
+        length = np.hypot(dx, dy)
+        if length > 0:
+            distance = np.abs(px * dy - py * dx) / length
+        else:
+            distance = np.hypot(px, py)
+        k = int(distance.argmax())
+        # A point can't outlive the segment it splits
+        tolerance = min(distance[k], parent)
+        if tolerance <= min_tolerance:
+            continue
+        split = first + 1 + k
+        importance[split] = tolerance
+        stack.append((first, split, tolerance))
+        stack.append((split, last, tolerance))
+    return importance
+
+
+def zoom_tolerance(zoom, latitude):
+    # Ground distance covered by TOLERANCE_PX pixels at this zoom
+    return TOLERANCE_PX * METERS_PER_PIXEL_Z0 * np.cos(np.radians(latitude)) / 2 ** zoom
+
+
+def _mercator_y(lat):
+    # Web Mercator y, scaled to the same units as longitude degrees
+    return np.degrees(np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)))
+
+
+def fit_zoom(lat_min, lat_max, lon_min, lon_max):
+    # Largest integer zoom at which the bounding box fits the map panel
+    lon_span = max(abs(lon_max - lon_min), 1e-6)
+    lat_span = max(abs(_mercator_y(lat_max) - _mercator_y(lat_min)), 1e-6)
+    zoom_x = np.log2(MAP_WIDTH_PX * 360 / (256 * lon_span))
+    zoom_y = np.log2(MAP_HEIGHT_PX * 360 / (256 * lat_span))
+    return int(np.clip(np.floor(min(zoom_x, zoom_y)), MIN_ZOOM, MAX_ZOOM))
+
+
+class RoutePyramid:
+    def __init__(self, df):
+        lat = df['position_lat'].to_numpy(dtype=np.float64, na_value=np.nan) if 'position_lat' in df else np.array([])
+        lon = df['position_long'].to_numpy(dtype=np.float64, na_value=np.nan) if 'position_long' in df else np.array([])
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        # Ride sample positions of the valid GPS fixes
+        self.positions = np.flatnonzero(valid)
+        self.lat = lat[valid]
+        self.lon = lon[valid]
+        self.levels = {}
+        if len(self.positions) == 0:
+            return
+        # Local equirectangular projection in meters
+        lat0 = np.radians(self.lat.mean())
+        x = np.radians(self.lon) * np.cos(lat0) * EARTH_RADIUS_M
+        y = np.radians(self.lat) * EARTH_RADIUS_M
+        reference_lat = float(np.degrees(lat0))
+        finest = zoom_tolerance(MAX_ZOOM, reference_lat)
+        importance = douglas_peucker_importance(x, y, min_tolerance=finest)
+        # levels[zoom] = indices into the valid fixes kept at that zoom (sorted)
+        for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+            self.levels[zoom] = np.flatnonzero(importance >= zoom_tolerance(zoom, reference_lat))
+
+    def _range_bounds(self, start, end):
+        # Slice of the valid fixes that fall within ride samples [start, end]
+        lo = np.searchsorted(self.positions, start, side='left')
+        hi = np.searchsorted(self.positions, end, side='right')
+        return lo, hi
+
+    def bounding_box(self, start, end):
+        lo, hi = self._range_bounds(start, end)
+        if lo >= hi:
+            return None
+        lat, lon = self.lat[lo:hi], self.lon[lo:hi]
+        return lat.min(), lat.max(), lon.min(), lon.max()
+
+    def polyline(self, start, end, zoom):
+        # (lat, lon) of the route between ride samples start and end at zoom,
+        # always including the first and last fix of the range
+        lo, hi = self._range_bounds(start, end)
+        if lo >= hi:
+            return np.array([]), np.array([])
+        level = self.levels[int(np.clip(zoom, MIN_ZOOM, MAX_ZOOM))]
+        a = np.searchsorted(level, lo, side='left')
+        b = np.searchsorted(level, hi, side='left')
+        indices = np.concatenate([[lo], level[a:b], [hi - 1]])
+        indices = np.unique(indices)
+        return self.lat[indices], self.lon[indices]
@@ -0,0 +1,296 @@
+import numpy as np
+
+# Smoothing and derivative kernels for the power model.
+#
+# The model needs altitude and speed, and their rates of change. Both inputs
+# can be smoothed first (SMOOTHING_METHODS) and differentiated with one of
+# DERIVATIVE_METHODS:
+#   smoothing   none             - the recorded values
+#               moving_average   - centered mean over the window
+#               savitzky_golay   - value of a least squares quadratic over the
+#                                  window (keeps peaks a moving average
+#                                  flattens)
+#               exponential      - trailing exponentially weighted mean with
+#                                  span = window (like pandas' ewm(span).mean())
+#   derivative  first_order      - backward difference y[i] - y[i-1]
+#               central          - (y[i+1] - y[i-1]) / 2, second order
+#               fourth_order     - five-point central difference, fourth order
+#               savitzky_golay   - slope of the least squares quadratic over
+#                                  the window (the derivative of the smoothed
+#                                  curve)
+#
+# Every kernel costs O(n) whatever the window: the centered windows are
+# differences of prefix sums and the exponential mean is a blocked closed form
+# of its recursion. The prefix sums of a series (SignalKernels) are built
+# once and shared by every window and method, so several variants of a ride
+# cost little more than one (see utils/power_cache.py).
+#
+# Windows are centered and odd (even ones are widened by one sample) and at
+# most MAX_WINDOW samples. Near gaps and the ends of a ride, where a window
+# isn't complete, Savitzky-Golay falls back to the mean of the samples
+# available (slope: to the central difference). Missing samples stay missing
+# after smoothing. Rates use the chain rule against the timestamps (or the
+# sample spacing of a resampled ride), so uneven sampling is handled too.
+
+# (label, method) pairs, as shown in the dashboard
+SMOOTHING_METHODS = [
+    ("None (recorded values)", 'none'),
+    ("Moving average", 'moving_average'),
+    ("Savitzky-Golay", 'savitzky_golay'),
+    ("Exponential", 'exponential'),
+]
+DERIVATIVE_METHODS = [
+    ("First order (backward difference)", 'first_order'),
+    ("Central difference", 'central'),
+    ("4th order central difference", 'fourth_order'),
+    ("Savitzky-Golay slope", 'savitzky_golay'),
+]
+DEFAULT_SMOOTHING = 'none'
+DEFAULT_DERIVATIVE = 'first_order'
+DEFAULT_SMOOTHING_WINDOW = 5  # samples
+MAX_WINDOW = 301
+# Samples per row of SignalKernels; short rows keep the index-weighted sums
+# (and their rounding errors) small
+KERNEL_CHUNK = 2048
+
+# Finite difference weights by offset, for d/d(sample)
+STENCILS = {
+    'first_order': {-1: -1.0, 0: 1.0},
+    'central': {-1: -0.5, 1: 0.5},
+    'fourth_order': {-2: 1 / 12, -1: -8 / 12, 1: 8 / 12, 2: -1 / 12},
+}
+
+
+def half_width(window):
+    window = int(window)
+    if window < 1 or window > MAX_WINDOW:
+        raise ValueError(f"Smoothing window must be between 1 and {MAX_WINDOW} samples, got {window}")
+    return window // 2
+
+
+class SignalKernels:
+    def __init__(self, values, chunk=KERNEL_CHUNK, max_half_width=MAX_WINDOW // 2):
+        # The series cut into rows of `chunk` samples, each padded with
+        # max_half_width neighbours on both sides, holding prefix sums of the
+        # valid count and of y, t*y, t^2*y (t: position from the middle of the
+        # row, y: value minus the row's mean)
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        self.n, self.chunk, self.pad = n, chunk, max_half_width
+        self.valid = np.isfinite(values)
+        starts = np.arange(0, max(n, 1), chunk)
+        positions = starts[:, None] - max_half_width + np.arange(chunk + 2 * max_half_width)
+        inside = (positions >= 0) & (positions < n)
+        gathered = values[np.clip(positions, 0, max(n - 1, 0))] if n else np.full(positions.shape, np.nan)
+        valid = inside & np.isfinite(gathered)
+        count = valid.sum(axis=1)
+        with np.errstate(invalid='ignore'):
+            self.baseline = np.where(count > 0, np.where(valid, gathered, 0.0).sum(axis=1) / np.maximum(count, 1), 0.0)
+        y = np.where(valid, gathered - self.baseline[:, None], 0.0)
+        self._middle = positions.shape[1] // 2
+        t = np.arange(positions.shape[1], dtype=np.float64) - self._middle
+
+        def prefix(terms):
+            sums = np.zeros((terms.shape[0], terms.shape[1] + 1))
+            np.cumsum(terms, axis=1, out=sums[:, 1:])
+            return sums
+
+        self._count = prefix(valid.astype(np.float64))
+        self._moments = [prefix(y), prefix(t * y), prefix(t * t * y)]
+
+    @property
+    def nbytes(self):
+        return self.valid.nbytes + self.baseline.nbytes + self._count.nbytes + sum(m.nbytes for m in self._moments)
+
+    def _per_sample(self, rows):
+        # (rows, chunk) block -> flat per-sample array of length n
+        return rows.ravel()[:self.n]
+
+    def window_sums(self, window):
+        # For every sample's centered window: the valid count and the sums
+        # of y, k*y and k^2*y (k: offset from the center)
+        h = half_width(window)
+        # Windows of the row's samples start at pad - h and end at pad + h
+        lo = slice(self.pad - h, self.pad - h + self.chunk)
+        hi = slice(self.pad + h + 1, self.pad + h + 1 + self.chunk)
+        count = self._per_sample(self._count[:, hi] - self._count[:, lo])
+        s0, s1, s2 = (self._per_sample(m[:, hi] - m[:, lo]) for m in self._moments)
+        k = np.tile(np.arange(self.pad, self.pad + self.chunk, dtype=np.float64) - self._middle, len(self._count))[:self.n]
+        m1 = s1 - k * s0
+        m2 = s2 - 2 * k * s1 + k * k * s0
+        return count, s0, m1, m2
+
+    def _baseline(self):
+        return np.repeat(self.baseline, self.chunk)[:self.n]
+
+    def _mean(self, count, s0, baseline):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = s0 / count + baseline
+        mean[~self.valid] = np.nan
+        return mean
+
+    def moving_average(self, window):
+        count, s0, _, _ = self.window_sums(window)
+        return self._mean(count, s0, self._baseline())
+
+    def savitzky_golay(self, window):
+        # Closed form of the quadratic fit's value at the center over a full
+        # window; the moving average elsewhere
+        h = half_width(window)
+        count, s0, _, m2 = self.window_sums(window)
+        baseline = self._baseline()
+        smoothed = self._mean(count, s0, baseline)
+        if h == 0:
+            return smoothed
+        full = count == 2 * h + 1
+        norm = (2 * h - 1) * (2 * h + 1) * (2 * h + 3)
+        fitted = (3 * (3 * h * h + 3 * h - 1) * s0[full] - 15 * m2[full]) / norm
+        smoothed[full] = fitted + baseline[full]
+        return smoothed
+
+    def savitzky_golay_slope(self, window):
+        # Slope per sample of the fit over a full window (NaN elsewhere); a
+        # quadratic and a straight line have the same slope at the center of
+        # a symmetric window
+        h = max(half_width(window), 1)
+        count, _, m1, _ = self.window_sums(2 * h + 1)
+        slope = m1 / (h * (h + 1) * (2 * h + 1) / 3)
+        slope[count != 2 * h + 1] = np.nan
+        return slope
+
+
+def exponential_mean(values, window):
+    # Trailing mean weighted by beta^age (alpha = 2 / (window + 1)) over the
+    # valid samples. The recursion s[i] = beta * s[i-1] + x[i] is evaluated in
+    # blocks short enough for beta^-k not to overflow: a cumulative sum per
+    # block, then one carry per block.
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return values.copy()
+    beta = 1 - 2 / (int(window) + 1)
+    valid = np.isfinite(values)
+    if beta <= 0:
+        return np.where(valid, values, np.nan)
+    block = int(min(n, max(1, 500 // -np.log(beta))))
+    rows = -(-n // block)
+    padded = np.zeros((2, rows * block))
+    padded[0, :n] = np.where(valid, values, 0.0)
+    padded[1, :n] = valid
+    padded = padded.reshape(2, rows, block)
+    k = np.arange(block)
+    sums = np.cumsum(padded * beta ** -k, axis=2) * beta ** k
+    # Carry each block's last sum into the next
+    decay = beta ** block
+    carry = np.zeros((2, rows))
+    for row in range(1, rows):
+        carry[:, row] = decay * carry[:, row - 1] + sums[:, row - 1, -1]
+    sums += carry[:, :, None] * beta ** (k + 1)
+    numerator, denominator = sums.reshape(2, -1)[:, :n]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = numerator / denominator
+    mean[~valid] = np.nan
+    return mean
+
+
+def _kernels(kernels, name, values):
+    # SignalKernels of a raw series, from (and into) the kernels dict if given
+    if kernels is None:
+        return SignalKernels(values)
+    if name not in kernels:
+        kernels[name] = SignalKernels(values)
+    return kernels[name]
+
+
+def smooth(values, method=DEFAULT_SMOOTHING, window=DEFAULT_SMOOTHING_WINDOW, kernels=None, name=None):
+    # values smoothed with method; kernels/name look up shared SignalKernels
+    if method == 'none':
+        return values
+    if method == 'moving_average':
+        return _kernels(kernels, name, values).moving_average(window)
+    if method == 'savitzky_golay':
+        return _kernels(kernels, name, values).savitzky_golay(window)
+    if method == 'exponential':
+        half_width(window)
+        return exponential_mean(values, window)
+    raise ValueError(f"Unknown smoothing method: {method}")
+
+
+def stencil(values, method):
+    # Finite difference of values per sample (NaN where the stencil reaches
+    # a missing sample or past the ends)
+    n = len(values)
+    out = np.zeros(n)
+    for offset, weight in STENCILS[method].items():
+        shifted = np.full(n, np.nan)
+        if offset >= 0:
+            shifted[:n - offset] = values[offset:]
+        else:
+            shifted[-offset:] = values[:n + offset]
+        out += weight * shifted
+    return out
+
+
+def change(values, method, window=DEFAULT_SMOOTHING_WINDOW, kernels=None, name=None):
+    # Rate of change of values per sample
+    if method == 'savitzky_golay':
+        slope = _kernels(kernels, name, values).savitzky_golay_slope(window)
+        fallback = np.isnan(slope)
+        slope[fallback] = stencil(values, 'central')[fallback]
+        return slope
+    if method not in STENCILS:
+        raise ValueError(f"Unknown derivative method: {method}")
+    return stencil(values, method)
+
+
+def _reach(method):
+    # Samples at each end without a complete stencil
+    if method == 'savitzky_golay':
+        method = 'central'
+    offsets = STENCILS[method]
+    return max(0, -min(offsets)), max(0, max(offsets))
+
+
+def rate(values, seconds, method=DEFAULT_DERIVATIVE, window=DEFAULT_SMOOTHING_WINDOW, kernels=None, name=None):
+    # d values / dt, with seconds the timestamps or the sample spacing (see
+    # utils.calculate_power.time_steps). Changes involving a missing sample
+    # count as no change, and so do the samples at the ends of the ride the
+    # stencil can't reach past; steps where time doesn't move forward give NaN.
+    n = len(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = change(values, method, window, kernels, name)
+        delta[np.isnan(delta)] = 0
+        if np.ndim(seconds) == 0:
+            elapsed = np.full(n, float(seconds))
+        else:
+            elapsed = change(seconds, method, window, kernels, 'seconds' if kernels is not None else None)
+        elapsed[~(elapsed > 0)] = np.nan
+        rates = delta / elapsed
+    before, after = _reach(method)
+    rates[:min(before, n)] = 0
+    if after:
+        rates[max(n - after, 0):] = 0
+    return rates
+
+
+def model_rates(
+    seconds, altitude, speed,
+    smoothing=DEFAULT_SMOOTHING, smoothing_window=DEFAULT_SMOOTHING_WINDOW,
+    derivative=DEFAULT_DERIVATIVE, kernels=None,
+):
+    # (speed, d altitude/dt, d speed^2/dt) for the power model, from the
+    # smoothed inputs. kernels is an optional dict caching the SignalKernels
+    # of the raw inputs across calls (ex: one per ride).
+    kernels = {} if kernels is None else kernels
+    altitude = smooth(altitude, smoothing, smoothing_window, kernels, 'altitude')
+    speed = smooth(speed, smoothing, smoothing_window, kernels, 'speed')
+    if derivative == 'savitzky_golay' and smoothing in ('none', 'savitzky_golay'):
+        # The slope of the smoothed curve is the slope of the fit over the
+        # raw series (kernels of the raw inputs), and d(v^2)/dt = 2 v dv/dt
+        climb = rate(altitude, seconds, derivative, smoothing_window, kernels, 'altitude')
+        speed_change = rate(speed, seconds, derivative, smoothing_window, kernels, 'speed')
+        return speed, climb, 2 * speed * speed_change
+    # Anything else differentiates the smoothed series itself
+    climb = rate(altitude, seconds, derivative, smoothing_window)
+    speed_squared_change = rate(speed * speed, seconds, derivative, smoothing_window)
+    return speed, climb, speed_squared_change
@@ -0,0 +1,187 @@
+import argparse
+import contextlib
+import io
+import math
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from utils.calculate_power import (
+    AIR_DENSITY,
+    DRAG_COEFFICIENT,
+    FRONTAL_AREA,
+    POWER_COMPONENTS,
+    SMOOTHING_WINDOW,
+    column_as_float,
+    compute_power_arrays,
+    g,
+)
+from utils.load_ride import load_file
+
+# Incremental version of the power model for live sample feeds.
+#
+# StreamingPowerEstimator takes one sample (or a small batch) at a time and
+# only keeps the previous sample and a ring buffer of the last `window` raw
+# power values, yet produces the same gravitational/kinetic/frictional/
+# calculated values as compute_power_arrays over the whole ride.
+#
+# Running this module replays a ride file through the estimator, at real time
+# or accelerated, checking parity with the batch model and reporting
+# per-sample latency:
+#   python -m utils.streaming_power NCAR.fit [--speed 10] [--rider-weight 70 ...]
+
+
+def _float(value):
+    return math.nan if value is None else float(value)
+
+
+class StreamingPowerEstimator:
+    def __init__(
+        self, system_weight, rolling_resistance_coefficient,
+        air_density=AIR_DENSITY, drag_area=FRONTAL_AREA * DRAG_COEFFICIENT,
+        drivetrain_efficiency=1.0, window=SMOOTHING_WINDOW,
+    ):
+        self.system_weight = system_weight
+        self.drivetrain_efficiency = drivetrain_efficiency
+        self.window = window
+        # Force coefficients, as in compute_power_arrays
+        self._drag = 0.5 * air_density * drag_area
+        self._rolling = rolling_resistance_coefficient * system_weight * g
+        self.reset()
+
+    def reset(self):
+        self._previous = None  # (seconds, altitude, speed^2) of the last sample
+        self._raw = deque(maxlen=self.window)
+
+    def update(self, seconds, altitude, speed):
+        # Feed one sample (timestamp in seconds; None or NaN for missing
+        # values). Returns its (gravitational, kinetic, frictional, calculated)
+        # power.
+        seconds, altitude, speed = _float(seconds), _float(altitude), _float(speed)
+        speed_squared = speed * speed
+        frictional = (self._drag * speed_squared + self._rolling) * speed
+        if self._previous is None:
+            gravitational = kinetic = 0.0
+        else:
+            previous_seconds, previous_altitude, previous_speed_squared = self._previous
+            time_step = seconds - previous_seconds
+            # Steps that don't move forward (ex: duplicate timestamps) have
+            # no rate of change, as in time_steps
+            if not time_step > 0:
+                time_step = math.nan
+            rise = altitude - previous_altitude
+            gain = speed_squared - previous_speed_squared
+            # Missing samples contribute no change in energy
+            gravitational = _divide(0.0 if math.isnan(rise) else rise * self.system_weight * g, time_step)
+            kinetic = _divide(0.0 if math.isnan(gain) else gain * 0.5 * self.system_weight, time_step)
+        self._previous = (seconds, altitude, speed_squared)
+
+        raw = gravitational + kinetic + frictional
+        if self.drivetrain_efficiency != 1.0:
+            raw /= self.drivetrain_efficiency
+        if raw < 0:
+            raw = 0.0
+        self._raw.append(raw)
+        # Trailing mean of the finite raw values (min_periods=1)
+        total, count = 0.0, 0
+        for value in self._raw:
+            if math.isfinite(value):
+                total += value
+                count += 1
+        calculated = total / count if count else math.nan
+        return gravitational, kinetic, frictional, calculated
+
+    def update_batch(self, seconds, altitude, speed):
+        # Feed a few samples at once; returns a (4, k) array like
+        # compute_power_arrays
+        out = np.empty((4, len(seconds)))
+        for i, sample in enumerate(zip(seconds, altitude, speed)):
+            out[:, i] = self.update(*sample)
+        return out
+
+
+def _divide(numerator, denominator):
+    # IEEE division like NumPy's (x/0 -> +-inf, 0/0 and NaN -> NaN)
+    try:
+        return numerator / denominator
+    except ZeroDivisionError:
+        if numerator == 0 or math.isnan(numerator):
+            return math.nan
+        return math.copysign(math.inf, numerator) * math.copysign(1.0, denominator)
+
+
+def replay(df, estimator, speed_factor=0.0):
+    # Stream df through estimator. speed_factor=1 replays in real time, 10
+    # ten times faster, 0 as fast as possible. Returns (components, latencies):
+    # the streamed (4, n) output and the seconds each update() took.
+    seconds = column_as_float(df, 'timestamp')
+    altitude = column_as_float(df, 'altitude')
+    speed = column_as_float(df, 'speed')
+    n = len(df)
+    components = np.empty((4, n))
+    latencies = np.empty(n)
+    started = time.perf_counter()
+    first = seconds[np.isfinite(seconds)][0] if np.isfinite(seconds).any() else 0.0
+    for i in range(n):
+        if speed_factor > 0 and np.isfinite(seconds[i]):
+            delay = (seconds[i] - first) / speed_factor - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        t0 = time.perf_counter()
+        components[:, i] = estimator.update(seconds[i], altitude[i], speed[i])
+        latencies[i] = time.perf_counter() - t0
+    return components, latencies
+
+
+def parity(streamed, batch):
+    # Largest absolute difference per component, treating matching NaN/inf
+    # as equal; inf where only one side is finite
+    result = {}
+    for name, a, b in zip(POWER_COMPONENTS, streamed, batch):
+        same = (a == b) | (np.isnan(a) & np.isnan(b))
+        diff = np.where(same, 0.0, np.abs(a - b))
+        diff[np.isnan(diff)] = np.inf
+        result[name] = float(diff.max()) if len(diff) else 0.0
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a ride through the streaming power estimator.")
+    parser.add_argument('filename', help="ride file in the rides folder")
+    parser.add_argument('--speed', type=float, default=0.0, help="replay speed (1 = real time, 0 = as fast as possible)")
+    parser.add_argument('--rider-weight', type=float, default=70.0, help="kg")
+    parser.add_argument('--bike-weight', type=float, default=10.0, help="kg")
+    parser.add_argument('--crr', type=float, default=0.004, help="rolling resistance coefficient")
+    parser.add_argument('--tolerance', type=float, default=1e-6, help="max allowed difference from the batch model (W)")
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = load_file(os.path.basename(args.filename))
+    system_weight = args.rider_weight + args.bike_weight
+    estimator = StreamingPowerEstimator(system_weight, args.crr)
+    started = time.perf_counter()
+    streamed, latencies = replay(df, estimator, args.speed)
+    elapsed = time.perf_counter() - started
+    batch = compute_power_arrays(
+        column_as_float(df, 'timestamp'),
+        column_as_float(df, 'altitude'),
+        column_as_float(df, 'speed'),
+        system_weight, args.crr,
+    )
+
+    print(f"Replayed {len(df)} samples of {args.filename} in {elapsed:.2f}s ({len(df) / elapsed:,.0f} samples/s)")
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e6
+    print(f"update() latency: p50 {p50:.1f}us  p95 {p95:.1f}us  p99 {p99:.1f}us  max {latencies.max() * 1e6:.1f}us")
+    differences = parity(streamed, batch)
+    ok = all(diff <= args.tolerance for diff in differences.values())
+    for name, diff in differences.items():
+        print(f"  {name:<20} max |streamed - batch| = {diff:.3g} W")
+    print("Parity OK" if ok else f"Parity FAILED (tolerance {args.tolerance:g} W)")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
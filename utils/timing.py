@@ -0,0 +1,146 @@
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from utils.ride_cache import CACHE_DIR
+
+# Timing spans for the dashboard handlers.
+#
+# A handler wrapped with timed_handler(name) records its total time and the
+# time of every span(stage) entered while it runs (in its own thread), ex:
+# 'decode', 'calculate_power', 'slice', 'figures', 'serialize.map'. Spans
+# outside a handler cost two perf_counter calls and record nothing. The last
+# TIMING_WINDOW durations of each (handler, stage) feed a rolling
+# p50/p95/p99 table (handler_timings.table()), shown in the dashboard's
+# diagnostics panel and served as JSON. Each call also prints one
+# 'timing {json}' log line unless TIMING_LOG=0.
+#
+# PROFILE_HANDLERS=1 (or a comma-separated list of handler names) runs the
+# handlers under cProfile and dumps one .prof file per call to PROFILE_DIR,
+# for `python -m pstats` or snakeviz. Only one call is profiled at a time,
+# and figures built on the figure pool's threads (FIGURE_WORKERS > 1) are not
+# in the profile.
+
+TIMING_WINDOW = int(os.environ.get('TIMING_WINDOW', 500))
+TIMING_LOG = os.environ.get('TIMING_LOG', '1') != '0'
+PROFILE_HANDLERS = os.environ.get('PROFILE_HANDLERS', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(CACHE_DIR, 'profiles'))
+TOTAL = 'total'
+
+# Stage durations of the handler call running in this thread (or None)
+_current = contextvars.ContextVar('timing_request', default=None)
+_profile_lock = threading.Lock()
+
+
+def _profiling(name):
+    if PROFILE_HANDLERS.lower() in ('', '0', 'false'):
+        return False
+    if PROFILE_HANDLERS.lower() in ('1', 'true', 'all'):
+        return True
+    return name in {n.strip() for n in PROFILE_HANDLERS.split(',')}
+
+
+class HandlerTimings:
+    def __init__(self, window=TIMING_WINDOW):
+        self.window = window
+        self._samples = {}  # (handler, stage) -> deque of seconds
+        self._counts = {}   # (handler, stage) -> calls ever recorded
+        self._lock = threading.Lock()
+
+    def record(self, handler, stages):
+        # stages: {stage: seconds} of one call, including TOTAL
+        with self._lock:
+            for stage, seconds in stages.items():
+                key = (handler, stage)
+                if key not in self._samples:
+                    self._samples[key] = deque(maxlen=self.window)
+                    self._counts[key] = 0
+                self._samples[key].append(seconds)
+                self._counts[key] += 1
+
+    def table(self):
+        # One row per (handler, stage), totals first; times in ms over the
+        # rolling window
+        with self._lock:
+            samples = {key: np.array(values) for key, values in self._samples.items()}
+            counts = dict(self._counts)
+        rows = []
+        for (handler, stage), values in sorted(samples.items(), key=lambda item: (item[0][0], item[0][1] != TOTAL, item[0][1])):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            rows.append({
+                'handler': handler, 'stage': stage, 'calls': counts[(handler, stage)],
+                'window': len(values), 'p50_ms': round(float(p50), 2), 'p95_ms': round(float(p95), 2),
+                'p99_ms': round(float(p99), 2), 'max_ms': round(float(values.max()) * 1000, 2),
+            })
+        return rows
+
+    def snapshot(self):
+        # JSON-serializable state for the diagnostics endpoint
+        return {'window': self.window, 'timings': self.table()}
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+handler_timings = HandlerTimings()
+
+
+def record_stage(stage, seconds):
+    # Add seconds to stage of the running handler call, if any
+    stages = _current.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def timed_handler(name, timings=handler_timings):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            stages = {}
+            token = _current.set(stages)
+            profiler = None
+            if _profiling(name) and _profile_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+            start = time.perf_counter()
+            try:
+                if profiler is None:
+                    return fn(*args, **kwargs)
+                return profiler.runcall(fn, *args, **kwargs)
+            finally:
+                stages[TOTAL] = time.perf_counter() - start
+                _current.reset(token)
+                profile_path = None
+                if profiler is not None:
+                    try:
+                        os.makedirs(PROFILE_DIR, exist_ok=True)
+                        profile_path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{time.monotonic_ns() % 10**6}.prof")
+                        profiler.dump_stats(profile_path)
+                    finally:
+                        _profile_lock.release()
+                timings.record(name, stages)
+                if TIMING_LOG:
+                    line = {'handler': name, **{f'{stage}_ms': round(s * 1000, 2) for stage, s in stages.items()}}
+                    if profile_path:
+                        line['profile'] = profile_path
+                    print(f"timing {json.dumps(line)}")
+        return wrapper
+    return decorator